@@ -0,0 +1,234 @@
+# Desc: Times the menu operations of the Health Information System on a patient file and records their peak memory
+#       and throughput, so runs can be compared to catch regressions, along with the cold start of cli.py commands.
+#       Results are written as JSON. Every operation that changes data works on a temporary copy of the file.
+# Usage: python benchmark.py [FILE] [--rows N] [--patients N] [--error-rate R] [--repeat N] [--workers N]
+#        [--output results.json] [--compare baseline.json] [--threshold 0.2]
+
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from datagen import generatePatientsFile
+from main import (addPatientData, deleteAllVisitsOfPatient, displayStats, findPatientsWhoNeedFollowUp,
+                  findVisitsByDate, readPatientsFromFile)
+from visitstore import ROW_SPAN, daysToDate
+
+OPERATIONS = ("readPatientsFromFile", "displayStats", "findVisitsByDate", "findPatientsWhoNeedFollowUp",
+              "addPatientData", "deleteAllVisitsOfPatient", "cliAdd", "cliStats")
+
+#the command line tool, started in a new interpreter to measure its cold start
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+
+#the operations that run the command line tool in a child process
+CLI_OPERATIONS = ("cliAdd", "cliStats")
+
+#number of visits added and patients deleted in one run of the write benchmarks
+WRITES_PER_RUN = 100
+
+
+def runChild(command):
+    """
+    Runs a command in a child process and waits for it.
+
+    command: The command and its arguments. Its output is thrown away.
+    return: The peak resident memory of the child in bytes, or None where the platform can't tell (Windows).
+    """
+    child = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    if not hasattr(os, "wait4"):
+        if child.wait():
+            raise subprocess.CalledProcessError(child.returncode, command)
+        return None
+    #wait4 gives the resource usage of this child alone, RUSAGE_CHILDREN would be the largest of every child so far
+    _, status, usage = os.wait4(child.pid, 0)
+    child.returncode = os.waitstatus_to_exitcode(status)
+    if child.returncode:
+        raise subprocess.CalledProcessError(child.returncode, command)
+    #ru_maxrss is in kilobytes, except on macOS where it is in bytes
+    return usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def measure(function, repeat, memory=True, child=False):
+    """
+    Times a function and records its peak memory.
+
+    function: The function to run, without arguments. Whatever it prints is thrown away.
+    repeat: The number of timed runs.
+    memory: If True, one more run is made under tracemalloc to record the peak memory. It is not timed, since
+            tracing slows every allocation down.
+    child: If True, function runs a child process and returns its peak memory as runChild does. The largest of the
+           timed runs is recorded instead, since tracemalloc only sees this process.
+    return: {"best": fastest run in seconds, "mean": average run in seconds, "peakBytes": peak traced memory, or peak
+            resident memory of the child, or None}
+    """
+    times = []
+    peaks = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            peaks.append(function())
+            times.append(time.perf_counter() - start)
+        peak = None
+        if child:
+            if memory and None not in peaks:
+                peak = max(peaks)
+        elif memory:
+            tracemalloc.start()
+            try:
+                function()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    return {"best": min(times), "mean": sum(times) / len(times), "peakBytes": peak}
+
+
+def runBenchmarks(fileName, repeat=3, workers=None, memory=True, operations=OPERATIONS):
+    """
+    Runs every benchmark on a patient file.
+
+    fileName: The patient file to benchmark with. It is not changed.
+    repeat: The number of timed runs of each operation.
+    workers: The number of processes used to load the file. None uses every CPU.
+    memory: If True, the peak memory of each operation is recorded too.
+    operations: The names of the operations to run, from OPERATIONS.
+    return: A dictionary with "meta" (environment and data set) and "results" (one entry per operation, with
+            seconds, peak memory, the number of items processed and items per second).
+    """
+    workDir = tempfile.mkdtemp(prefix="his-bench-")
+    try:
+        copy = os.path.join(workDir, "patients.txt")
+        shutil.copyfile(fileName, copy)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            patients = readPatientsFromFile(copy, workers)
+        visits = patients.numVisits()
+        patientIds = list(patients)
+        #the date search looks up the year of the middle visit in date order
+        index = patients.liveDateIndex()
+        year = int(daysToDate(patients.dates[index[len(index) // 2] % ROW_SPAN])[:4]) if visits else 2020
+        results = {}
+
+        def addVisits():
+            for i in range(WRITES_PER_RUN):
+                addPatientData(patients, patientIds[i % len(patientIds)] if patientIds else 1, f"{year}-01-01",
+                               37.0, 72, 16, 120, 80, 97, copy)
+
+        def deletePatients():
+            #every run deletes the first patients that are still there
+            for patientId in list(patients)[:WRITES_PER_RUN]:
+                deleteAllVisitsOfPatient(patients, patientId, copy)
+
+        def runCli(*args):
+            return runChild([sys.executable, CLI, "--file", copy, *args])
+
+        tasks = {
+            "readPatientsFromFile": (lambda: readPatientsFromFile(copy, workers), visits),
+            "displayStats": (lambda: displayStats(patients, 0), visits),
+            "findVisitsByDate": (lambda: sum(1 for _ in findVisitsByDate(patients, year)), visits),
+            "findPatientsWhoNeedFollowUp": (lambda: findPatientsWhoNeedFollowUp(patients), visits),
+            "addPatientData": (addVisits, WRITES_PER_RUN),
+            "deleteAllVisitsOfPatient": (deletePatients, WRITES_PER_RUN),
+            #a whole process each, so these include interpreter start, imports and (for stats) the snapshot load
+            "cliAdd": (lambda: runCli("add", "1", f"{year}-01-01", "37.0", "72", "16", "120", "80", "97"), 1),
+            "cliStats": (lambda: runCli("stats"), 1),
+        }
+        for name in operations:
+            function, items = tasks[name]
+            result = measure(function, repeat, memory, name in CLI_OPERATIONS)
+            result["items"] = items
+            result["itemsPerSecond"] = items / result["best"] if result["best"] > 0 else None
+            results[name] = result
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    meta = {
+        "file": os.path.abspath(fileName),
+        "fileBytes": os.path.getsize(fileName),
+        "visits": visits,
+        "patients": len(patientIds),
+        "repeat": repeat,
+        "workers": workers if workers is not None else os.cpu_count(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return {"meta": meta, "results": results}
+
+
+def compareResults(baseline, current, threshold=0.2, minDelta=0.001):
+    """
+    Compares two benchmark results.
+
+    baseline: The results of an older run, as returned by runBenchmarks.
+    current: The results of the new run.
+    threshold: The share, from 0, by which an operation may get slower before it counts as a regression.
+    minDelta: The number of seconds an operation has to get slower by as well, so timer noise on operations that
+              take microseconds is not reported.
+    return: A list of (operation, baseline seconds, current seconds, ratio, regressed) for the operations in both.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = result["best"] / old["best"] if old["best"] > 0 else float("inf")
+        regressed = ratio > 1 + threshold and result["best"] - old["best"] > minDelta
+        rows.append((name, old["best"], result["best"], ratio, regressed))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Health Information System operations.")
+    parser.add_argument("file", nargs="?", help="patient file to use (a synthetic one is generated if left out)")
+    parser.add_argument("--rows", type=int, default=100000, help="visits in the generated file (default 100000)")
+    parser.add_argument("--patients", type=int, default=None, help="patients in the generated file (default rows/10)")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="share of broken generated lines")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the generated file")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per operation (default 3)")
+    parser.add_argument("--workers", type=int, default=None, help="processes used to load (default every CPU)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak-memory runs")
+    parser.add_argument("--output", help="write the JSON results to this file instead of printing them")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slow-down that counts as a regression")
+    args = parser.parse_args()
+
+    fileName = args.file
+    generated = None
+    if fileName is None:
+        patients = args.patients or max(args.rows // 10, 1)
+        handle, generated = tempfile.mkstemp(prefix="his-data-", suffix=".txt")
+        os.close(handle)
+        generatePatientsFile(generated, patients, max(args.rows // patients, 1), errorRate=args.error_rate,
+                             seed=args.seed)
+        fileName = generated
+    try:
+        report = runBenchmarks(fileName, args.repeat, args.workers, not args.no_memory)
+    finally:
+        if generated:
+            os.unlink(generated)
+    if generated:
+        report["meta"]["generated"] = {"rows": args.rows, "errorRate": args.error_rate, "seed": args.seed}
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as outfile:
+            outfile.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)
+        regressions = 0
+        for name, old, new, ratio, regressed in compareResults(baseline, report, args.threshold):
+            regressions += regressed
+            print(f"{name:30} {old:10.4f}s -> {new:10.4f}s  x{ratio:.2f}{'  REGRESSION' if regressed else ''}",
+                  file=sys.stderr)
+        sys.exit(1 if regressions else 0)
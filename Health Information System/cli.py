@@ -0,0 +1,392 @@
+# Desc: Command line interface of the Health Information System, for scripts and scheduled jobs that can't answer the
+#       interactive menu. Every menu option is a subcommand, and a file of queries can be answered in one process so
+#       the patient file is loaded once for all of them. The patient file is only loaded by the commands that read it
+#       (the snapshot next to it is used when it is up to date), 'add' only validates and appends its visits, and the
+#       program's modules are imported when a command needs them, so a short command starts quickly.
+# Usage: python cli.py [--file patients.txt] [--workers N] [--no-snapshot] [--errors] [--timing] [--profile] COMMAND ...
+#          show [--patient ID] [--format text|csv|jsonl] [--page-size N] [--offset N]
+#          stats [--patient ID] [--start yyyy-mm-dd] [--end yyyy-mm-dd]
+#          cohort VITAL [PERIOD] [--start yyyy-mm-dd] [--end yyyy-mm-dd]   (PERIOD is yyyy, yyyy-Qn or yyyy-mm)
+#          trend ID VITAL [--rolling DAYS]
+#          visits [--year YYYY] [--month MM] [--start yyyy-mm-dd] [--end yyyy-mm-dd] [--format ...] [--page-size N]
+#                 [--offset N]
+#          followup
+#          add ID DATE TEMP HR RR SBP DBP SPO2 | add --from FILE
+#          delete ID
+#          rejects                         (number of rejected lines by reason, as JSON)
+#          batch QUERIES [--echo]          (one command per line, '-' reads standard input)
+
+
+import argparse
+import os
+import shlex
+import sys
+import time
+
+#time the interpreter reached this module, the start of the cold start that --timing reports
+STARTED = time.perf_counter()
+
+FORMATS = ("text", "csv", "jsonl")
+
+#name, label and unit of every vital sign, in VITALS order, as displayStats prints them
+VITAL_LABELS = (("temp", "Temperature", "C"), ("hr", "Heart Rate", "bpm"), ("rr", "Respiratory Rate", "bpm"),
+                ("sbp", "Systolic Blood Pressure", "mmHg"), ("dbp", "Diastolic Blood Pressure", "mmHg"),
+                ("spo2", "Oxygen Saturation", "%"))
+
+
+class Session:
+    """
+    The state shared by the commands of one run: the patient file and the store, which is loaded the first time a
+    command asks for it.
+    """
+
+    def __init__(self, fileName, workers=None, useSnapshot=True, showErrors=False):
+        self.fileName = fileName
+        self.workers = workers
+        self.useSnapshot = useSnapshot
+        self.showErrors = showErrors
+        self.patients = None
+        self.errors = []
+        self.loadSeconds = 0.0
+
+    def store(self):
+        """
+        return: The VisitStore of the patient file, loaded on the first call. Rejected lines are written to standard
+                error if showErrors is set. Raises OSError if the file cannot be opened.
+        """
+        if self.patients is None:
+            start = time.perf_counter()
+            if self.useSnapshot:
+                from snapshot import loadPatientsWithSnapshot
+                self.patients, errors = loadPatientsWithSnapshot(self.fileName, self.workers)
+            else:
+                from loader import loadPatients
+                self.patients, errors = loadPatients(self.fileName, self.workers)
+            self.loadSeconds = time.perf_counter() - start
+            self.errors = errors
+            if self.showErrors and errors:
+                print("\n".join(error.message for error in errors), file=sys.stderr)
+        return self.patients
+
+########################################################################################################
+
+
+def showCommand(session, args):
+    """
+    Displays the visits of every patient, or of --patient, like menu options 1 and 2.
+    """
+    from main import displayPatientData
+    displayPatientData(session.store(), args.patient, args.format, args.page_size, args.offset)
+    return 0
+
+
+def statsCommand(session, args):
+    """
+    Displays the average vital signs of every patient, or of --patient, like menu option 4.
+    """
+    if args.start is None and args.end is None:
+        from main import displayStats
+        displayStats(session.store(), args.patient)
+        return 0
+    from timeseries import windowStats
+    try:
+        patientId = int(args.patient)
+        stats = windowStats(session.store(), patientId, args.start, args.end)
+    except ValueError:
+        print("Error:", "'patientId' should be an integer and dates in the format 'yyyy-mm-dd'.")
+        return 1
+    if stats is None:
+        print(f"No data found for patient with ID {patientId}.")
+        return 1
+    window = f"from {args.start or 'the first visit'} to {args.end or 'the last visit'}"
+    if stats["count"] == 0:
+        print(f"No visits found {window}.")
+        return 0
+    print(f"Vital Signs for {'All Patients' if patientId == 0 else f'Patient {patientId}'} {window}:")
+    for name, label, unit in VITAL_LABELS:
+        print(f"  Average {label}: {stats[name]:.2f} {unit}")
+    return 0
+
+
+def cohortCommand(session, args):
+    """
+    Displays the average of one vital sign over every patient's visits in a period or range of dates.
+    """
+    from timeseries import cohortMean
+    try:
+        mean = cohortMean(session.store(), args.vital, args.period, args.start, args.end)
+    except ValueError as error:
+        print(error)
+        return 1
+    label, unit = {name: (label, unit) for name, label, unit in VITAL_LABELS}[args.vital]
+    if args.period:
+        window = f"in {args.period}"
+    else:
+        window = f"from {args.start or 'the first visit'} to {args.end or 'the last visit'}"
+    if mean is None:
+        print(f"No visits found {window}.")
+    else:
+        print(f"Average {label} for All Patients {window}: {mean:.2f} {unit}")
+    return 0
+
+
+def trendCommand(session, args):
+    """
+    Displays how a vital sign of a patient changed from visit to visit, or its rolling average, in date order.
+    """
+    from timeseries import seriesOf
+    series = seriesOf(session.store(), args.patient)
+    if series is None:
+        print(f"No data found for patient with ID {args.patient}.")
+        return 1
+    if args.rolling is not None:
+        try:
+            means = series.rollingMeans(args.vital, args.rolling)
+        except ValueError as error:
+            print(error)
+            return 1
+        print("\n".join(f"{date} {mean:.2f}" for date, mean in means))
+    else:
+        print("\n".join(f"{date} {change:+g} after {days} days" for date, change, days in series.trend(args.vital)))
+    return 0
+
+
+def visitsCommand(session, args):
+    """
+    Displays the visits in a year, month or range of dates, like menu option 5.
+    """
+    from main import findVisitRowsByDate
+    from render import writeVisits
+    patients = session.store()
+    try:
+        rows = findVisitRowsByDate(patients, args.year, args.month, args.start, args.end)
+        found = writeVisits(patients, rows, fmt=args.format, patientHeaders="visit", pageSize=args.page_size,
+                            offset=args.offset)
+    except ValueError:
+        print("Error:", "dates should be valid dates in the format 'yyyy-mm-dd'.")
+        return 1
+    if not found and args.format == "text":
+        print("No visits found for the specified year/month.")
+    return 0
+
+
+def followupCommand(session, args):
+    """
+    Lists the patients who need a follow-up visit, like menu option 6.
+    """
+    from main import findPatientsWhoNeedFollowUp
+    patientIds = findPatientsWhoNeedFollowUp(session.store())
+    if patientIds:
+        print("Patients who need follow-up visits:")
+        print("\n".join(map(str, patientIds)))
+    else:
+        print("No patients found who need follow-up visits.")
+    return 0
+
+
+def addCommand(session, args):
+    """
+    Validates visits and appends them to the patient file, which is not parsed. Returns 1 if any is rejected.
+    """
+    from main import addVisits
+    if args.source is not None:
+        with (sys.stdin if args.source == "-" else open(args.source)) as visits:
+            #the store is only kept up to date if an earlier query of a batch loaded it
+            result = addVisits(session.patients, visits, session.fileName)
+    else:
+        visit = args.visit
+        if len(visit) != 8:
+            print("add needs ID DATE TEMP HR RR SBP DBP SPO2, or --from FILE.", file=sys.stderr)
+            return 2
+        try:
+            visit = (int(visit[0]), visit[1], float(visit[2]), *map(int, visit[3:]))
+        except ValueError:
+            print("Invalid input. Please enter valid data.")
+            return 1
+        result = addVisits(session.patients, [visit], session.fileName)
+    if args.source is None:
+        print(result.rejected[0][1] if result.rejected else f"Visit is saved successfully for Patient # {visit[0]}")
+    else:
+        for index, message in result.rejected:
+            print(f"Visit {index + 1}: {message}")
+        print(f"{result.accepted} visits saved, {len(result.rejected)} rejected.")
+    return 1 if result.rejected else 0
+
+
+def deleteCommand(session, args):
+    """
+    Deletes all visits of a patient, like menu option 7. Returns 1 if the patient is not found.
+    """
+    from main import deleteAllVisitsOfPatient
+    patients = session.store()
+    found = args.patient in patients
+    deleteAllVisitsOfPatient(patients, args.patient, session.fileName)
+    return 0 if found else 1
+
+
+def rejectsCommand(session, args):
+    """
+    Prints the number of rejected lines of the patient file by reason, as JSON for data quality dashboards.
+    """
+    import json
+    from loader import rejectCounts
+    session.store()
+    print(json.dumps(rejectCounts(session.errors)))
+    return 0
+
+
+def batchCommand(session, args):
+    """
+    Answers every query of a file, one command line per line. Blank lines and lines starting with '#' are skipped.
+    return: 0 if every query succeeded, otherwise 1.
+    """
+    parser = buildParser(batch=True)
+    status = 0
+    with (sys.stdin if args.queries == "-" else open(args.queries)) as queries:
+        for lineNumber, line in enumerate(queries, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if args.echo:
+                print(f"> {line}")
+            try:
+                query = parser.parse_args(shlex.split(line))
+            except (ValueError, SystemExit):
+                #argparse exits on a bad command, which must not end the whole batch
+                print(f"Invalid query in line {lineNumber}: {line}", file=sys.stderr)
+                status = 1
+                continue
+            try:
+                status |= 1 if query.command(session, query) else 0
+            except BrokenPipeError:
+                raise
+            #a query that fails must not end the whole batch either
+            except Exception as error:
+                print(f"Query in line {lineNumber} failed: {error}", file=sys.stderr)
+                status = 1
+    return status
+
+########################################################################################################
+
+
+def addQueryCommands(commands, batch=False):
+    """
+    Adds the subcommands to an argparse subparsers object.
+
+    commands: The object returned by ArgumentParser.add_subparsers.
+    batch: If True, the batch command itself is left out, so batch files can't start other batches.
+    """
+    def listing(command):
+        command.add_argument("--format", choices=FORMATS, default="text", help="output format (default text)")
+        command.add_argument("--page-size", type=int, default=None, help="number of visits to write")
+        command.add_argument("--offset", type=int, default=0, help="number of visits to skip first")
+
+    command = commands.add_parser("show", help="display the visits of every patient or of one patient")
+    command.add_argument("--patient", type=int, default=0, help="patient ID (default every patient)")
+    listing(command)
+    command.set_defaults(command=showCommand)
+
+    command = commands.add_parser("stats", help="display the average vital signs")
+    command.add_argument("--patient", default="0", help="patient ID (default every patient)")
+    command.add_argument("--start", default=None, help="first date of the visits to average, yyyy-mm-dd")
+    command.add_argument("--end", default=None, help="last date (included) of the visits to average, yyyy-mm-dd")
+    command.set_defaults(command=statsCommand)
+
+    vitals = [name for name, label, unit in VITAL_LABELS]
+    command = commands.add_parser("cohort", help="average one vital sign over every patient in a period")
+    command.add_argument("vital", choices=vitals)
+    command.add_argument("period", nargs="?", default=None, help="yyyy, yyyy-Qn or yyyy-mm")
+    command.add_argument("--start", default=None, help="first date, yyyy-mm-dd, if no period is given")
+    command.add_argument("--end", default=None, help="last date (included), yyyy-mm-dd, if no period is given")
+    command.set_defaults(command=cohortCommand)
+
+    command = commands.add_parser("trend", help="show a vital sign of a patient from visit to visit")
+    command.add_argument("patient", type=int)
+    command.add_argument("vital", choices=vitals)
+    command.add_argument("--rolling", type=int, default=None, help="show the average over this many days instead")
+    command.set_defaults(command=trendCommand)
+
+    command = commands.add_parser("visits", help="find visits by year, month, both, or a range of dates")
+    command.add_argument("--year", type=int, default=None)
+    command.add_argument("--month", type=int, default=None)
+    command.add_argument("--start", default=None, help="first date, yyyy-mm-dd")
+    command.add_argument("--end", default=None, help="last date (included), yyyy-mm-dd")
+    listing(command)
+    command.set_defaults(command=visitsCommand)
+
+    command = commands.add_parser("followup", help="list the patients who need a follow-up visit")
+    command.set_defaults(command=followupCommand)
+
+    command = commands.add_parser("add", help="append visits without loading the patient file")
+    command.add_argument("visit", nargs="*", help="ID DATE TEMP HR RR SBP DBP SPO2")
+    command.add_argument("--from", dest="source", default=None,
+                         help="file of visits in the patients.txt format, '-' reads standard input")
+    command.set_defaults(command=addCommand)
+
+    command = commands.add_parser("delete", help="delete all visits of a patient")
+    command.add_argument("patient", type=int)
+    command.set_defaults(command=deleteCommand)
+
+    command = commands.add_parser("rejects", help="count the rejected lines of the patient file by reason")
+    command.set_defaults(command=rejectsCommand)
+
+    if not batch:
+        command = commands.add_parser("batch", help="answer a file of queries in one process")
+        command.add_argument("queries", help="file with one command per line, '-' reads standard input")
+        command.add_argument("--echo", action="store_true", help="write each query before its answer")
+        command.set_defaults(command=batchCommand)
+
+
+def buildParser(batch=False):
+    """
+    batch: If True, the parser is for the lines of a batch file, which have no global options.
+    return: The argparse parser of the command line.
+    """
+    parser = argparse.ArgumentParser(prog="cli.py", description="Query and update a Health Information System file.")
+    if not batch:
+        parser.add_argument("--file", default="patients.txt", help="patient file (default patients.txt)")
+        parser.add_argument("--workers", type=int, default=None, help="processes used to load (default every CPU)")
+        parser.add_argument("--no-snapshot", action="store_true", help="parse the text file even if a snapshot is "
+                                                                        "up to date")
+        parser.add_argument("--errors", action="store_true", help="write rejected lines to standard error")
+        parser.add_argument("--timing", action="store_true", help="write startup, load and command times to "
+                                                                  "standard error")
+        parser.add_argument("--profile", action="store_true", help="write the time spent in each stage and the "
+                                                                   "load and query counters to standard error")
+    addQueryCommands(parser.add_subparsers(dest="name", required=True), batch)
+    return parser
+
+
+def run(argv=None):
+    """
+    Runs one command line.
+
+    argv: The arguments, without the program name. If None, sys.argv is used.
+    return: The exit status, 0 on success.
+    """
+    args = buildParser().parse_args(argv)
+    session = Session(args.file, args.workers, not args.no_snapshot, args.errors)
+    if args.profile:
+        import profiling
+        profiling.enable()
+    commandStart = time.perf_counter()
+    try:
+        status = args.command(session, args)
+    except BrokenPipeError:
+        #whatever read the output stopped early, for example 'cli.py show | head'
+        sys.stdout = open(os.devnull, "w")
+        status = 0
+    except OSError as error:
+        print(f"The file {error.filename} could not be found." if error.filename else error, file=sys.stderr)
+        status = 1
+    if args.timing:
+        finished = time.perf_counter()
+        print(f"startup {1000 * (commandStart - STARTED):.1f} ms, load {1000 * session.loadSeconds:.1f} ms, "
+              f"command {1000 * (finished - commandStart - session.loadSeconds):.1f} ms", file=sys.stderr)
+    if args.profile:
+        print(profiling.formatReport(), file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(run())
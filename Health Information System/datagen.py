@@ -0,0 +1,99 @@
+# Desc: Writes synthetic patient files in the patients.txt format, for benchmarks and load tests. Visits are spread
+#       over random patients and dates, every vital sign is in its valid range, and a chosen share of the lines can be
+#       broken on purpose (wrong number of fields, text instead of a number, out-of-range values, impossible dates).
+# Usage: python datagen.py OUTPUT [--patients N] [--visits N] [--start-year YYYY] [--end-year YYYY]
+#        [--error-rate R] [--seed S]
+
+
+import argparse
+import random
+from datetime import date, timedelta
+
+#number of lines formatted before they are written, keeps memory flat for files of any size
+WRITE_BATCH = 100000
+
+#ways a line is broken when an error is generated
+ERROR_KINDS = ("fields", "type", "range", "date")
+
+
+def dateStrings(startYear, endYear):
+    """
+    startYear: The first year visits can be in.
+    endYear: The last year visits can be in.
+    return: A list of every 'yyyy-mm-dd' date from the start of startYear to the end of endYear.
+    """
+    first = date(startYear, 1, 1)
+    count = (date(endYear, 12, 31) - first).days + 1
+    return [(first + timedelta(days)).isoformat() for days in range(count)]
+
+
+def brokenLine(rng, line):
+    """
+    Breaks a valid line in a random way, so the loader has to reject it.
+
+    rng: The random.Random to use.
+    line: A valid line of the patient file.
+    return: The broken line.
+    """
+    fields = line.split(",")
+    kind = rng.choice(ERROR_KINDS)
+    if kind == "fields":
+        fields = fields[:rng.randint(1, 7)]
+    elif kind == "type":
+        fields[rng.randint(2, 7)] = "abc"
+    elif kind == "range":
+        fields[3] = str(rng.choice((10, 250)))
+    else:
+        fields[1] = fields[1][:5] + "02-30"
+    return ",".join(fields)
+
+
+def generatePatientsFile(fileName, patients=1000, visitsPerPatient=10, startYear=2015, endYear=2023, errorRate=0.0,
+                         seed=None):
+    """
+    Writes a synthetic patient file.
+
+    fileName: The name of the file to write.
+    patients: The number of different patient IDs, from 1 to patients.
+    visitsPerPatient: The average number of visits per patient. The file has patients * visitsPerPatient lines.
+    startYear: The first year visits can be in.
+    endYear: The last year visits can be in.
+    errorRate: The share of lines, from 0 to 1, that are broken on purpose.
+    seed: The random seed, the same seed always writes the same file.
+    return: The number of lines written.
+    """
+    rng = random.Random(seed)
+    dates = dateStrings(startYear, endYear)
+    rows = patients * visitsPerPatient
+    randint, choice, uniform, chance = rng.randint, rng.choice, rng.uniform, rng.random
+    with open(fileName, "w") as outfile:
+        separator = ""
+        written = 0
+        while written < rows:
+            batch = []
+            for _ in range(min(WRITE_BATCH, rows - written)):
+                line = (f"{randint(1, patients)},{choice(dates)},{uniform(35.5, 39.5):.1f},{randint(50, 120)},"
+                        f"{randint(12, 24)},{randint(95, 160)},{randint(60, 100)},{randint(88, 100)}")
+                if errorRate and chance() < errorRate:
+                    line = brokenLine(rng, line)
+                batch.append(line)
+            #lines are separated, not ended, by a line break like the rest of the program writes them
+            outfile.write(separator + "\n".join(batch))
+            separator = "\n"
+            written += len(batch)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic patients.txt file.")
+    parser.add_argument("output", help="file to write")
+    parser.add_argument("--patients", type=int, default=1000, help="number of patient IDs (default 1000)")
+    parser.add_argument("--visits", type=int, default=10, help="average visits per patient (default 10)")
+    parser.add_argument("--start-year", type=int, default=2015, help="first year of visits (default 2015)")
+    parser.add_argument("--end-year", type=int, default=2023, help="last year of visits (default 2023)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of broken lines, 0 to 1 (default 0)")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+    args = parser.parse_args()
+    count = generatePatientsFile(args.output, args.patients, args.visits, args.start_year, args.end_year,
+                                 args.error_rate, args.seed)
+    print(f"Wrote {count} lines to {args.output}")
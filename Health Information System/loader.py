@@ -0,0 +1,200 @@
+# Desc: Loads patients.txt into a VisitStore. The file is split into byte ranges that start and end on a line break,
+#       each range is parsed on its own (in a process pool for large files) and the parsed columns are merged back in
+#       file order, so every patient keeps the order their visits appear in the file. Each range is checked against the
+#       rules of validation.py in one batch, and rejected lines are returned as a list of RejectedLine records instead
+#       of being printed. Tombstone lines written by visitlog remove the visits of their patient that come before them.
+
+
+import os
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from itertools import compress, repeat
+
+import profiling
+from validation import REASONS, acceptedColumns, checkFields, lineMessage, rejectedRows, splitFields
+from visitlog import TOMBSTONE, staleLines
+from visitstore import VisitStore
+
+#files smaller than this are parsed in the calling process, a pool would only add start-up time
+PARALLEL_THRESHOLD = 4 * 1024 * 1024
+
+#number of byte ranges handed to each worker, more than one keeps workers busy if some ranges are slower
+CHUNKS_PER_WORKER = 4
+
+#lineNumber starts at 1. reason is one of validation.REASONS: 'fields', 'type', 'id', 'date', 'temp', 'hr', 'rr', 'sbp',
+#'dbp', 'spo2'.
+RejectedLine = namedtuple("RejectedLine", ["lineNumber", "reason", "message"])
+
+#result of parsing part of a file. staleLines counts tombstone lines and the visits they removed.
+LoadResult = namedtuple("LoadResult", ["patients", "errors", "lineCount", "staleLines"])
+
+
+def parseRange(fileName, start, end):
+    """
+    Parses the lines stored between two byte offsets of a patient file.
+
+    fileName: The name of the file to read.
+    start: The offset of the first byte of the range, at the start of a line.
+    end: The offset just after the last byte of the range, at the start of a line or the end of the file.
+    return: (columns, tombstones, rejects, lineCount, timings). columns is a tuple of arrays in VisitStore.extend
+            order, tombstones is a list of (number of visits accepted before the tombstone, patient ID), rejects is a
+            list of (line index inside the range, reason, message), lineCount is the number of lines in the range
+            and timings is (read seconds, split seconds, parse seconds) for the profiling report.
+    """
+    #timed once per range, which costs nothing next to the lines, so workers don't need to know if profiling is on
+    started = time.perf_counter()
+    with open(fileName, "rb") as infile:
+        infile.seek(start)
+        text = infile.read(end - start).decode("utf-8", errors="replace")
+    read = time.perf_counter()
+    lines = text.split("\n")
+    if lines[-1] == "":        #the range ends with a line break, there is no line after it
+        lines.pop()
+    split = time.perf_counter()
+    #a visit has 8 fields, so the lines with 7 commas are converted and checked as one batch, column by column
+    stripped = list(map(str.strip, lines))
+    commas = list(map(str.count, stripped, repeat(",")))
+    visitLines = list(compress(range(len(lines)), map((7).__eq__, commas)))
+    check = checkFields(splitFields(list(map(stripped.__getitem__, visitLines))))
+    rejects = []
+    tombstones = []
+    #tombstones and lines with the wrong number of fields are looked at one by one
+    for index in compress(range(len(lines)), map((7).__ne__, commas)):
+        line = lines[index].rstrip("\r")
+        fields = stripped[index].split(",")
+        if fields[0] == TOMBSTONE and len(fields) == 2:
+            try:
+                tombstones.append((bisect_left(visitLines, index), int(fields[1])))
+            except ValueError:
+                rejects.append((index, "type", f"Invalid data type in line: {line}"))
+        else:
+            rejects.append((index, "fields", f"Invalid number of fields {len(fields)} in line: {fields}"))
+    if check.rejectCount:
+        for row in rejectedRows(check):
+            index = visitLines[row]
+            line = lines[index].rstrip("\r")
+            reason = REASONS[check.reasons[row]]
+            if reason == "type":
+                rejects.append((index, reason, f"Invalid data type in line: {line}"))
+            else:
+                rejects.append((index, reason, lineMessage(check, row, line)))
+        rejects.sort()
+        #a tombstone removes the visits accepted before it
+        tombstones = [(position - check.rejected[:position].count(1), patientId) for position, patientId in tombstones]
+    columns = tuple(acceptedColumns(check))
+    timings = (read - started, split - read, time.perf_counter() - split)
+    return columns, tombstones, rejects, len(lines), timings
+
+########################################################################################################
+
+
+def splitFile(fileName, count, start=0, end=None):
+    """
+    Splits a file into byte ranges that begin at the start of a line.
+
+    fileName: The name of the file to split.
+    count: The number of ranges wanted. Fewer are returned if the file has fewer lines.
+    start: The offset to start splitting at, at the start of a line.
+    end: The offset to stop splitting at. If None, the whole rest of the file is split.
+    return: A list of (start, end) byte offsets covering the part of the file, in file order.
+    """
+    if end is None:
+        end = os.path.getsize(fileName)
+    bounds = [start]
+    with open(fileName, "rb") as infile:
+        for k in range(1, count):
+            position = start + (end - start) * k // count
+            if position <= bounds[-1]:
+                continue
+            #step back one byte so a range that already starts on a new line is not pushed to the next one
+            infile.seek(position - 1)
+            infile.readline()
+            position = infile.tell()
+            if position >= end:
+                break
+            if position > bounds[-1]:
+                bounds.append(position)
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def loadRange(fileName, start, end, workers=None, patients=None, firstLine=1):
+    """
+    Parses the lines stored between two byte offsets of a patient file into a VisitStore.
+
+    fileName: The name of the file to read patient data from.
+    start: The offset of the first byte to parse, at the start of a line.
+    end: The offset just after the last byte to parse.
+    workers: The number of processes to parse with. None uses every CPU, 1 parses in the calling process.
+    patients: The VisitStore to add the visits to. If None, a new one is made.
+    firstLine: The line number of the line at start, used in the rejected lines.
+    return: A LoadResult. Raises OSError if the file cannot be opened.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or end - start < PARALLEL_THRESHOLD:
+        results = [parseRange(fileName, start, end)]
+    else:
+        #imported here, so small files and the command line tool don't pay for loading multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        ranges = splitFile(fileName, workers * CHUNKS_PER_WORKER, start, end)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(parseRange, [fileName] * len(ranges), *zip(*ranges)))
+
+    #merge the ranges in file order, so each patient keeps the order their visits were first seen in
+    if patients is None:
+        patients = VisitStore()
+    errors = []
+    allTombstones = []
+    lineNumber = firstLine
+    merging = time.perf_counter()
+    for columns, tombstones, rejects, lineCount, timings in results:
+        allTombstones.extend((len(patients.patientIds) + position, patientId) for position, patientId in tombstones)
+        patients.extend(*columns)
+        errors.extend(RejectedLine(lineNumber + index, reason, message) for index, reason, message in rejects)
+        lineNumber += lineCount
+    merged = time.perf_counter()
+    #tombstones are applied once every visit is in, so visits from every range above them are removed
+    removed = patients.deleteVisitsBefore(allTombstones) if allTombstones else 0
+    if profiling.enabled:
+        for columns, tombstones, rejects, lineCount, timings in results:
+            for stage, seconds in zip(("read", "split", "parse"), timings):
+                profiling.addTime(stage, seconds)
+            profiling.count("rowsParsed", len(columns[0]))
+        profiling.addTime("insert", merged - merging)
+        profiling.addTime("tombstones", time.perf_counter() - merged)
+        profiling.count("bytesRead", end - start)
+        profiling.count("linesRead", lineNumber - firstLine)
+        profiling.count("tombstones", len(allTombstones))
+        profiling.count("rowsRejected", len(errors))
+        for reason, rejected in rejectCounts(errors).items():
+            profiling.count(f"rejected.{reason}", rejected)
+    return LoadResult(patients, errors, lineNumber - firstLine, len(allTombstones) + removed)
+
+
+def rejectCounts(errors):
+    """
+    Counts rejected lines by reason, for data quality reports.
+
+    errors: A list of RejectedLine.
+    return: A dictionary {reason: number of lines}, with only the reasons that occur, in the order of their first line.
+    """
+    counts = {}
+    for error in errors:
+        counts[error.reason] = counts.get(error.reason, 0) + 1
+    return counts
+
+
+def loadPatients(fileName, workers=None):
+    """
+    Reads patient data from a plaintext file into a VisitStore.
+
+    fileName: The name of the file to read patient data from.
+    workers: The number of processes to parse with. None uses every CPU, 1 parses in the calling process.
+    return: (store, errors), where errors is a list of RejectedLine in file order.
+            Raises OSError if the file cannot be opened.
+    """
+    result = loadRange(fileName, 0, os.path.getsize(fileName), workers)
+    staleLines[os.path.abspath(fileName)] = result.staleLines
+    return result.patients, result.errors
@@ -0,0 +1,171 @@
+# Desc: Load test of server.py. It serves a temporary copy of a patient file on localhost, connects many simulated
+#       clients that send a random mix of the menu operations at the same time, and reports the latency percentiles
+#       and throughput seen by the clients. Afterwards the file is read again and compared with the server's store,
+#       so writes that were lost or applied twice make the run fail.
+# Usage: python loadtest.py [FILE] [--rows N] [--clients N] [--requests N] [--write-share R] [--seed S]
+#        [--output results.json]
+
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from datagen import generatePatientsFile
+from loader import loadPatients
+from server import PatientServer, percentiles
+from snapshot import loadPatientsWithSnapshot
+from visitstore import daysToDate
+
+
+async def request(reader, writer, message):
+    """
+    Sends one request and waits for its response.
+
+    return: The response as a dictionary.
+    """
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def runClient(port, patientIds, years, requests, writeShare, rng, latencies, writes):
+    """
+    One simulated client. It opens a connection, sends requests one after the other and quits.
+
+    port: The port of the server.
+    patientIds: The patient IDs of the file, to pick from.
+    years: The years of the visits in the file, to pick from.
+    requests: The number of requests to send.
+    writeShare: The share of requests that add visits or delete a patient.
+    rng: The random.Random to use.
+    latencies: A dictionary {op: list of seconds} the latency of every request is added to.
+    writes: A dictionary with the counts "accepted" and "deletedPatients", updated with the writes that succeeded.
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=1 << 24)
+    try:
+        for _ in range(requests):
+            if rng.random() < writeShare:
+                if rng.random() < 0.9:
+                    visit = [rng.choice(patientIds), f"{rng.choice(years)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+                             round(rng.uniform(35.5, 39.5), 1), rng.randint(50, 120), rng.randint(12, 24),
+                             rng.randint(95, 160), rng.randint(60, 100), rng.randint(88, 100)]
+                    message = {"op": "add", "visit": visit}
+                else:
+                    message = {"op": "delete", "patientId": rng.choice(patientIds)}
+            else:
+                op = rng.choice(("show", "stats", "stats", "visits", "followup"))
+                if op == "show":
+                    message = {"op": op, "patientId": rng.choice(patientIds)}
+                elif op == "stats":
+                    message = {"op": op, "patientId": rng.choice((0, rng.choice(patientIds)))}
+                elif op == "visits":
+                    message = {"op": op, "year": rng.choice(years), "month": rng.randint(1, 12), "pageSize": 100}
+                else:
+                    message = {"op": op}
+            start = time.perf_counter()
+            response = await request(reader, writer, message)
+            latencies.setdefault(message["op"], []).append(time.perf_counter() - start)
+            if response["ok"] and message["op"] == "add":
+                writes["accepted"] += response["result"]["accepted"]
+            elif response["ok"] and message["op"] == "delete":
+                writes["deletedPatients"] += 1
+        await request(reader, writer, {"op": "quit"})
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def runLoadTest(fileName, clients=50, requests=200, writeShare=0.1, seed=None):
+    """
+    Runs a load test on a temporary copy of a patient file.
+
+    fileName: The patient file to serve. It is not changed.
+    clients: The number of clients connected at the same time.
+    requests: The number of requests every client sends.
+    writeShare: The share of requests that add visits or delete a patient.
+    seed: The random seed of the clients.
+    return: A dictionary with "meta", "client" (latency percentiles in milliseconds per operation, as seen by the
+            clients), "server" (the server's own percentiles), "requestsPerSecond" and "consistent", which is True if
+            the file read back holds exactly the visits of the server's store.
+    """
+    workDir = tempfile.mkdtemp(prefix="his-load-")
+    try:
+        copy = os.path.join(workDir, "patients.txt")
+        shutil.copyfile(fileName, copy)
+        patients, errors = loadPatientsWithSnapshot(copy)
+        visitsBefore = patients.numVisits()
+        patientIds = list(patients) or [1]
+        dates = patients.dates
+        years = list(range(int(daysToDate(min(dates))[:4]), int(daysToDate(max(dates))[:4]) + 1)) if dates else [2020]
+
+        service = PatientServer(patients, copy)
+        server = await service.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        rng = random.Random(seed)
+        latencies = {}
+        writes = {"accepted": 0, "deletedPatients": 0}
+        start = time.perf_counter()
+        await asyncio.gather(*(runClient(port, patientIds, years, requests, writeShare, random.Random(rng.random()),
+                                         latencies, writes) for _ in range(clients)))
+        seconds = time.perf_counter() - start
+        serverReport = service.latency.report()
+        await service.close()
+
+        #the file on disk has to hold exactly what the server holds in memory
+        reloaded, _ = loadPatients(copy)
+        consistent = reloaded.asDict() == patients.asDict()
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    total = sum(len(samples) for samples in latencies.values())
+    return {
+        "meta": {"file": os.path.abspath(fileName), "visits": visitsBefore, "patients": len(patientIds),
+                 "clients": clients, "requests": requests, "writeShare": writeShare, "seed": seed},
+        "client": {op: percentiles(samples) for op, samples in latencies.items()},
+        "server": serverReport,
+        "requestsPerSecond": total / seconds if seconds > 0 else None,
+        "writes": writes,
+        "consistent": consistent,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the Health Information System server on localhost.")
+    parser.add_argument("file", nargs="?", help="patient file to serve (a synthetic one is generated if left out)")
+    parser.add_argument("--rows", type=int, default=100000, help="visits in the generated file (default 100000)")
+    parser.add_argument("--clients", type=int, default=50, help="simulated clients (default 50)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per client (default 200)")
+    parser.add_argument("--write-share", type=float, default=0.1, help="share of add and delete requests")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the generated file and of the clients")
+    parser.add_argument("--output", help="write the JSON results to this file instead of printing them")
+    args = parser.parse_args()
+
+    fileName = args.file
+    generated = None
+    if fileName is None:
+        handle, generated = tempfile.mkstemp(prefix="his-data-", suffix=".txt")
+        os.close(handle)
+        patients = max(args.rows // 10, 1)
+        generatePatientsFile(generated, patients, max(args.rows // patients, 1), seed=args.seed)
+        fileName = generated
+    try:
+        report = asyncio.run(runLoadTest(fileName, args.clients, args.requests, args.write_share, args.seed))
+    finally:
+        if generated:
+            os.unlink(generated)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as outfile:
+            outfile.write(text)
+    else:
+        print(text)
+    if not report["consistent"]:
+        print("The patient file does not match the server's store.", file=sys.stderr)
+    sys.exit(0 if report["consistent"] else 1)
@@ -8,189 +8,288 @@
 # Outputs: Patient details and errors if there are any.
 
 
-from typing import List, Dict, Optional
-import re
+from array import array
+from collections import namedtuple
+import sys
+import time
 
-def readPatientsFromFile(fileName):
+from itertools import chain
+
+import profiling
+from loader import loadPatients
+from render import writeVisits
+from snapshot import loadPatientsWithSnapshot
+from validation import TYPE_MESSAGE, checkFields, checkRow, parseDate, rowMessage, splitFields
+from visitlog import appendLines, appendTombstone, countStale, fileLock, maybeCompact
+from visitstore import MAXYEAR, asStore, daysToDate, monthToDays, toDays, writableStore
+
+
+#accepted is the number of visits added, rejected a list of (index in the batch, message)
+BatchResult = namedtuple("BatchResult", ["accepted", "rejected", "seconds", "rowsPerSecond"])
+
+#batches with at least this many valid visits are added to the store column by column
+BULK_BATCH = 64
+
+#position in a visit tuple and array type code of every store column except the date
+BATCH_COLUMNS = ((0, "q"), (2, "d"), (3, "h"), (4, "h"), (5, "h"), (6, "h"), (7, "h"))
+
+def readPatientsFromFile(fileName, workers=None, useSnapshot=False):
     """
     Reads patient data from a plaintext file.
 
     fileName: The name of the file to read patient data from.
-    Returns a dictionary of patient IDs, where each patient has a list of visits.
-    The dictionary has the following structure:
+    workers: The number of processes used to parse large files. None uses every CPU, 1 parses without a pool.
+    useSnapshot: If True, a binary snapshot kept next to the file is read instead of the text when the file has not
+                 changed (only lines appended since are parsed), and it is written again after the file is parsed.
+    Returns a VisitStore holding every valid visit. The store can be used like the dictionary this function used to
+    return, and store.asDict() gives a plain copy with the following structure:
     {
-        patientId (int): [
-            [date (str), temperature (float), heart rate (int), respiratory rate (int), systolic blood pressure (int), diastolic blood pressure (int), oxygen saturation (int)],
-            [date (str), temperature (float), heart rate (int), respiratory rate (int), systolic blood pressure (int), diastolic blood pressure (int), oxygen saturation (int)],
-            ...
-        ],
         patientId (int): [
             [date (str), temperature (float), heart rate (int), respiratory rate (int), systolic blood pressure (int), diastolic blood pressure (int), oxygen saturation (int)],
             ...
         ],
         ...
     }
+    Lines that are rejected are printed, use loader.loadPatients to get them back as a list instead.
     """
-#creating an empty dictionary
-    patients={}
     try:
-        # Open a file for reading
-        infile = open(fileName, 'r')
-        lines = infile.readlines()
-        try:
-            for line in lines:
-                patientDataList = line.strip().split(",")       #take away the blank spaces and splitting by commas
-                patientId = patientDataList[0]
-                if len(patientDataList) == 8:                #makes sure there are 8 elements in the patient data list
-
-                    try:
-                        patientId = int(patientId)
-                        patientDataList.pop(0)              #'pop'(remove) the first element which will be key for dictionary
-                        patientDataList[1] = float(patientDataList[1])
-                        for i in range(2, 7):      #values from temp to oxy saturation has to be an integer hence for loop is from 2 to 7
-                            patientDataList[i] = int(patientDataList[i])
-                        #try and except block raises error if data is not within range
-                        try:
-                            if not(35.0 <= patientDataList[1] <= 42.0):
-                                raise ValueError(f"Invalid temperature value ({patientDataList[1]}) in line: {line}")
-                            if not(30<=patientDataList[2]<=180):
-                                raise ValueError(f"Invalid heart rate value ({patientDataList[2]}) in line: {line}")
-                            if not(5<=patientDataList[3]<=40):
-                                raise ValueError(f"Invalid respiratory rate ({patientDataList[3]}) in line: {line}")
-                            if not(70 <= patientDataList[4] <= 200):
-                                raise ValueError(f"Invalid systolic blood pressure value ({patientDataList[4]}) in line: {line}")
-                            if not(40<=patientDataList[5]<=120):
-                                raise ValueError(f"Invalid diastolic blood pressure value ({patientDataList[5]}) in line: {line}")
-                            if not(70 <= patientDataList[6] <= 100):
-                                raise ValueError(f"Invalid oxygen saturation value ({patientDataList[6]}) in line: {line}")
-                            if patientId not in patients.keys():
-                                patients[patientId] = []
-                                patients[patientId].append(patientDataList)
-                            else:
-                                patients[patientId].append(patientDataList)
-                        except ValueError as exception:
-                            print(str(exception))
-                    except ValueError:
-                        print(f"Invalid data type in line: {line}")
-                #else statement corresponds to the if, print invalid number of fields.
-                else:
-                    print(f"Invalid number of fields {len(patientDataList)} in line: {patientDataList}")
-        #except block if there are errors in file
-        except:
-            print("An unexpected error occurred while reading the file")
-        #closing file since we opened it for reading
-        finally:
-            infile.close()
+        if useSnapshot:
+            patients, errors = loadPatientsWithSnapshot(fileName, workers)
+        else:
+            patients, errors = loadPatients(fileName, workers)
     #if file can't be found it altomatically exits
     except IOError:
         print(f"The file {fileName} could not be found.")
         exit()
+    #errors are collected while parsing and printed once at the end
+    if errors:
+        print("\n".join(error.message for error in errors))
     return patients
 
 ##########################################################################################################
 
 
-def displayPatientData(patients, patientId=0):
+def displayPatientData(patients, patientId=0, fmt="text", pageSize=None, offset=0, out=None):
     """
     Displays patient data for a given patient ID.
 
-    patients: A dictionary of patient dictionaries, where each patient has a list of visits.
+    patients: A VisitStore (or a dictionary of patient IDs), where each patient has a list of visits.
     patientId: The ID of the patient to display data for. If 0, data for all patients will be displayed.
+    fmt: 'text' (default), 'csv' or 'jsonl'.
+    pageSize: The number of visits to display. If None, every visit from offset on is displayed.
+    offset: The number of visits to skip before displaying.
+    out: The stream to write to. If None, standard output is used.
     """
-# if patientId is 0, it prints all patient number in the dictionary, and their data for each visit
-    if patientId == 0:
-        for patientNumber in patients:
-            print(f"Patient ID: {patientNumber}")
-            for visit in patients[patientNumber]:
-                print(f" Visit Date: {visit[0]}")
-                print(f"  Temperature: {visit[1]:.2f} C")
-                print(f"  Heart Rate: {visit[2]} bpm")
-                print(f"  Respiratory Rate: {visit[3]} bpm")
-                print(f"  Systolic Blood Pressure: {visit[4]} mmHg")
-                print(f"  Diastolic Blood Pressure: {visit[5]} mmHg")
-                print(f"  Oxygen Saturation: {visit[6]} %")
-    #if user input of patientId is not in dictionary, it prints not found message
-    elif patientId not in patients:
+    patients = asStore(patients)
+    #if user input of patientId is not in the store, it prints not found message
+    if patientId != 0 and patientId not in patients:
         print(f"Patient with ID {patientId} not found.")
-    #if user inputs a specific patientId, it only prints the data for that patient
+        return
+# if patientId is 0, it writes the visits of every patient in the store, otherwise only that patient's visits.
+# visits are formatted in batches and written with one call per batch
+    if patientId == 0:
+        rows = chain.from_iterable(patients.offsets.values())
     else:
-        print(f"Patient ID: {patientId}")
-        for visit in patients[patientId]:
-            print(f" Visit Date: {visit[0]}")
-            print(f"  Temperature: {visit[1]:.2f} C")
-            print(f"  Heart Rate: {visit[2]} bpm")
-            print(f"  Respiratory Rate: {visit[3]} bpm")
-            print(f"  Systolic Blood Pressure: {visit[4]} mmHg")
-            print(f"  Diastolic Blood Pressure: {visit[5]} mmHg")
-            print(f"  Oxygen Saturation: {visit[6]} %")
+        rows = patients.rows(patientId)
+    writeVisits(patients, rows, out, fmt, "change", pageSize, offset)
 
 #######################################################################################################
 
+def getStats(patients, patientId=0):
+    """
+    Returns the statistics of each vital sign for all patients or for the specified patient.
+
+    patients: A VisitStore (or a dictionary of patient IDs), where each patient has a list of visits.
+    patientId: The ID of the patient to return statistics for. If 0, statistics of all patients are returned.
+    return: A dictionary {"count": number of visits, "temp": {"mean", "variance", "min", "max"}, "hr": {...}, "rr",
+            "sbp", "dbp", "spo2"}, or None if there are no visits. Raises ValueError if patientId is not an integer.
+    """
+    patients = asStore(patients)
+    patientId = int(patientId)
+    #the store keeps running totals, so no visit has to be looked at here
+    with profiling.timed("stats"):
+        if patientId == 0:
+            aggregate = patients.stats()
+        elif patientId not in patients:
+            return None
+        else:
+            aggregate = patients.stats(patientId)
+    if aggregate.count == 0:
+        return None
+    return aggregate.asDict()
+
+
 def displayStats(patients, patientId=0):
     """
     Prints the average of each vital sign for all patients or for the specified patient.
 
-    patients: A dictionary of patient IDs, where each patient has a list of visits.tfc
+    patients: A VisitStore (or a dictionary of patient IDs), where each patient has a list of visits.
     patientId: The ID of the patient to display vital signs for. If 0, vital signs will be displayed for all patients.
     """
-    avgTem = 0
-    avgHr = 0
-    avgResRate = 0
-    avgSysRate = 0
-    avgDisRate = 0
-    avgOxySat = 0
-    numData = 0
     try:
-        #if patient ID(user input) is 0, it prints the average vital signs for all patients
-        if int(patientId) == 0:
-            for patientNumber in patients:
-                for visit in patients[patientNumber]:
-                    avgTem += visit[1]                     #avg vital signs was 0, and it adds up the data for all visits.
-                    avgHr += visit[2]                      #its in a for loop so it will add from all visits
-                    avgResRate += visit[3]
-                    avgSysRate += visit[4]
-                    avgDisRate += visit[5]
-                    avgOxySat += visit[6]
-                    numData += 1
-            if numData>0:                 #numData is number of data. to find average vital signs, I divide total vital signs from all visits
-                print("Vital Signs for All Patients:")   #with the number of data.
-                print(f"  Average Temperature: {float(avgTem/numData):.2f} C")
-                print(f"  Average Heart Rate: {float(avgHr/numData):.2f} bpm")
-                print(f"  Average Respiratory Rate: {float(avgResRate/numData):.2f} bpm")
-                print(f"  Average Systolic Blood Pressure: {float(avgSysRate/numData):.2f} mmHg")
-                print(f"  Average Diastolic Blood Pressure: {float(avgDisRate/numData):.2f} mmHg")
-                print(f"  Average Oxygen Saturation: {float(avgOxySat/numData):.2f} %")
-        #if user inputed a patient ID not in dictionary it will print 'no data found...'
-        elif int(patientId) not in patients:
-            print(f"No data found for patient with ID {patientId}.")
-        else:
-            for visit in patients[int(patientId)]:   #for a specific patient it print average vital signs from all their visits
-                avgTem += visit[1]
-                avgHr += visit[2]
-                avgResRate += visit[3]
-                avgSysRate += visit[4]
-                avgDisRate += visit[5]
-                avgOxySat += visit[6]
-                numData += 1
-            print(f"Vital Signs for Patient {patientId}:")
-            print(f"  Average Temperature: {float(avgTem/numData):.2f} C")
-            print(f"  Average Heart Rate: {float(avgHr/numData):.2f} bpm")
-            print(f"  Average Respiratory Rate: {float(avgResRate/numData):.2f} bpm")
-            print(f"  Average Systolic Blood Pressure: {float(avgSysRate/numData):.2f} mmHg")
-            print(f"  Average Diastolic Blood Pressure: {float(avgDisRate/numData):.2f} mmHg")
-            print(f"  Average Oxygen Saturation: {float(avgOxySat/numData):.2f} %")
+        printStats(getStats(patients, patientId), patientId)
     #making sure that user input is not some random word (has to be integer)
     except ValueError:
         print("Error:", "'patientId' should be an integer.")
 
 
+def printStats(stats, patientId=0):
+    """
+    Prints the average of each vital sign from statistics returned by getStats.
+
+    stats: The dictionary returned by getStats, or None if there were no visits.
+    patientId: The ID of the patient the statistics are for, 0 for all patients.
+    """
+    #if user inputed a patient ID not in the store it will print 'no data found...'
+    if stats is None and int(patientId) != 0:
+        print(f"No data found for patient with ID {patientId}.")
+    elif stats is not None:
+        if int(patientId) == 0:
+            print("Vital Signs for All Patients:")
+        else:
+            print(f"Vital Signs for Patient {patientId}:")
+        print(f"  Average Temperature: {stats['temp']['mean']:.2f} C")
+        print(f"  Average Heart Rate: {stats['hr']['mean']:.2f} bpm")
+        print(f"  Average Respiratory Rate: {stats['rr']['mean']:.2f} bpm")
+        print(f"  Average Systolic Blood Pressure: {stats['sbp']['mean']:.2f} mmHg")
+        print(f"  Average Diastolic Blood Pressure: {stats['dbp']['mean']:.2f} mmHg")
+        print(f"  Average Oxygen Saturation: {stats['spo2']['mean']:.2f} %")
+
+
 #######################################################################################################
 
+def validateVisit(patientId, date, temp, hr, rr, sbp, dbp, spo2):
+    """
+    Checks the data of one new visit.
+
+    patientId: The ID of the patient the visit is for.
+    date: The date of the visit in the format 'yyyy-mm-dd'.
+    temp, hr, rr, sbp, dbp, spo2: The vital signs of the visit.
+    return: (visit, None) if the visit is valid, otherwise (None, message) where message explains the first problem
+            found. visit is (patientId, days, temp, hr, rr, sbp, dbp, spo2) with the date as days since 1970-01-01
+            and the temperature as a float, the values the store keeps and the file line is written from.
+    """
+    #the same rules the loader checks every line of the file against
+    visit = (patientId, parseDate(date), temp, hr, rr, sbp, dbp, spo2)
+    code = checkRow(visit)
+    if code:
+        return None, rowMessage(code)
+    return (patientId, visit[1], float(temp), hr, rr, sbp, dbp, spo2), None
+
+
+def streamVisits(stream, rejected):
+    """
+    Converts and checks the lines of a stream in one batch, with the rules the loader uses for the patient file.
+
+    stream: An open text file of lines in the patients.txt format.
+    rejected: A list the (index of the line, message) of every rejected line is added to.
+    return: A list of (index of the line, (patientId, date, temp, hr, rr, sbp, dbp, spo2)) for the accepted lines.
+            The accepted tuples are checked again by checkVisits, which costs little next to the file append.
+    """
+    lines = [line.strip() for line in stream.read().splitlines()]
+    rows = []
+    for index, line in enumerate(lines):
+        if line.count(",") == 7:
+            rows.append(index)
+        else:
+            rejected.append((index, TYPE_MESSAGE))
+    texts = splitFields([lines[index] for index in rows])
+    check = checkFields(texts)
+    accepted = []
+    columns = check.columns
+    for row, index in enumerate(rows):
+        code = check.reasons[row]
+        if code == 0:
+            accepted.append((index, (columns[0][row], texts[1][row], columns[2][row], columns[3][row],
+                                     columns[4][row], columns[5][row], columns[6][row], columns[7][row])))
+        else:
+            rejected.append((index, rowMessage(code)))
+    return accepted
+
+
+def checkVisits(visits):
+    """
+    Checks many new visits, every one the same way addPatientData checks one, without changing anything.
+
+    visits: See addVisits.
+    return: (accepted, rejected). accepted is a list of the valid visits as returned by validateVisit, rejected a
+            list of (index of the visit in the batch, message).
+    """
+    accepted = []
+    rejected = []
+    if hasattr(visits, "read"):
+        visits = streamVisits(visits, rejected)
+    else:
+        visits = enumerate(visits)
+    for index, visit in visits:
+        try:
+            visit, message = validateVisit(*visit)
+        #anything wrong with one visit, such as a value that can't be compared or converted or a visit that is not
+        #a sequence, is reported like typed input that is not a number instead of failing the batch
+        except Exception:
+            visit, message = None, TYPE_MESSAGE
+        if message is None:
+            accepted.append(visit)
+        else:
+            rejected.append((index, message))
+    #lines of a stream that could not be converted were rejected before the others
+    rejected.sort()
+    return accepted, rejected
+
+
+def saveVisits(patients, visits, fileName, fsync=False):
+    """
+    Adds visits checked by checkVisits to the store and appends them to the file with a single write.
+
+    patients: The VisitStore to add data to, or None, see addVisits.
+    visits: A list of visits as returned by validateVisit.
+    fileName: The name of the file to append new data to.
+    fsync: If True, the file is flushed to disk once after the visits are written.
+    """
+    if patients is not None:
+        writableStore(patients)
+    #the lock keeps a background compaction from writing the file between adding to the store and appending
+    with fileLock:
+        if patients is not None and len(visits) < BULK_BATCH:
+            for visit in visits:
+                #adds the visit to the store, the store makes a new entry if the ID has not been seen before.
+                patients.addVisit(*visit)
+        elif patients is not None:
+            #large batches go in column by column, the store sorts its date index once instead of once per visit
+            columns = [array(typecode, [visit[i] for visit in visits]) for i, typecode in BATCH_COLUMNS]
+            columns.insert(1, array("i", [visit[1] for visit in visits]))
+            patients.extend(*columns)
+        #the line is written from the checked values, so the loader reads back exactly what the store holds
+        appendLines(fileName, [f"{visit[0]},{daysToDate(visit[1])}," + ",".join(map(str, visit[2:]))
+                               for visit in visits], fsync)
+
+
+def addVisits(patients, visits, fileName, fsync=False):
+    """
+    Adds many new visits at once. Every visit is checked the same way addPatientData checks one, then all the valid
+    visits are added to the store and appended to the file with a single write.
+
+    patients: The VisitStore to add data to. If None, the visits are only appended to the file, which does not have
+              to be loaded first.
+    visits: An iterable of (patientId, date, temp, hr, rr, sbp, dbp, spo2) tuples, or an open text file (or any
+            stream with a read method) of lines in the patients.txt format.
+    fileName: The name of the file to append new data to.
+    fsync: If True, the file is flushed to disk once after the batch is written.
+    return: A BatchResult. rejected is a list of (index of the visit in the batch, message).
+    """
+    start = time.perf_counter()
+    accepted, rejected = checkVisits(visits)
+    saveVisits(patients, accepted, fileName, fsync)
+    seconds = time.perf_counter() - start
+    rowsPerSecond = (len(accepted) + len(rejected)) / seconds if seconds > 0 else 0.0
+    return BatchResult(len(accepted), rejected, seconds, rowsPerSecond)
+
+
 def addPatientData(patients, patientId, date, temp, hr, rr, sbp, dbp, spo2, fileName):
     """
     Adds new patient data to the patient list.
 
-    patients: The dictionary of patient IDs, where each patient has a list of visits, to add data to.
+    patients: The VisitStore to add data to. A plain dictionary raises TypeError, since the visit would be lost.
     patientId: The ID of the patient to add data for.
     date: The date of the patient visit in the format 'yyyy-mm-dd'.
     temp: The patient's body temperature.
@@ -201,86 +300,59 @@ def addPatientData(patients, patientId, date, temp, hr, rr, sbp, dbp, spo2, file
     spo2: The patient's oxygen saturation level.
     fileName: The name of the file to append new data to.
     """
-    #making sure that the new ID entered will be greater than 0.
-    if patientId > 0:
-        # if the date entered is not this format, it prints invalid date
-        if not re.search("[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]", date):
-            print("Invalid date format. Please enter date in the format 'yyyy-mm-dd'.")
-        else:
-            #append to file, split by '-' so I can seperate the date into components: year, month, day
-            infile = open(fileName, 'a')
-            dateList = date.split("-")
-#change from str to int so following if statement works.
-            year = int(dateList[0])
-            month = int(dateList[1])
-            day = int(dateList[2])
-            if year < 1900 or not 1 <= month <= 12 or not 1 <= day <= 31:
-                print("Invalid date. Please enter a valid date.")
-                return
-#makes sure that user input vital signs are within range.
-            try:
-                if not (35.0 <= temp <= 42.0):
-                    raise ValueError("Invalid temperature. Please enter a temperature between 35.0 and 42.0 Celsius.")
-                if not (30 <= hr <= 180):
-                    raise ValueError("Invalid heart rate. Please enter a heart rate between 30 and 180 bpm.")
-                if not (5 <= rr <= 40):
-                    raise ValueError("Invalid respiratory rate. Please enter a respiratory rate between 5 and 40 bpm.")
-                if not (70 <= sbp <= 200):
-                    raise ValueError(
-                        "Invalid systolic blood pressure. Please enter a systolic blood pressure between 70 and 200 mmHg.")
-                if not (40 <= dbp <= 120):
-                    raise ValueError(
-                        "Invalid diastolic blood pressure. Please enter a diastolic blood pressure between 40 and 120 bpm.")
-                if not (70 <= spo2 <= 100):
-                    raise ValueError("Invalid oxygen saturation. Please enter an oxygen saturation between 70 and 100%.")
-                #if the user inputed ID is not in the dictionary then it makes a new list for that key. Appends corresponding data.
-                if patientId not in patients:
-                    patients[patientId] = []
-                    patients[patientId].append([date, temp, hr, rr, sbp, dbp, spo2])
-                else:
-                    patients[patientId].append([date, temp, hr, rr, sbp, dbp, spo2])
-                infile.write(f"\n{patientId},{date},{temp},{hr},{rr},{sbp},{dbp},{spo2}")
-                print(f"Visit is saved successfully for Patient # {patientId}")
-            except ValueError as exception:
-                print(str(exception))
-            finally:
-                infile.close()
-
+    result = addVisits(patients, [(patientId, date, temp, hr, rr, sbp, dbp, spo2)], fileName)
+    if result.rejected:
+        print(result.rejected[0][1])
     else:
-        print("patient ID has to be greater than 0.")
+        print(f"Visit is saved successfully for Patient # {patientId}")
 
 ###########################################################################################################
 
 
-def findVisitsByDate(patients, year=None, month=None):
+def findVisitRowsByDate(patients, year=None, month=None, start=None, end=None):
     """
-    Find visits by year, month, or both.
+    Find the row numbers of visits by year, month, both, or by a range of dates.
 
-    patients: A dictionary of patient IDs, where each patient has a list of visits.
+    patients: A VisitStore.
+    year, month, start, end: The same filters as findVisitsByDate.
+    return: An iterator of row numbers of the store that match every given filter, in date order.
+    """
+    #year has to be none or right value, same for month. a month without a year matches nothing
+    if not ((year is None or year > 1900) and (month is None or 1 <= month <= 12)) or (year is None and month is not None):
+        return iter(())
+    #turn the filters into one range of days [first, last) that can be looked up in the store's date index
+    first = None if start is None else toDays(start)
+    last = None if end is None else toDays(end) + 1
+    if year is not None:
+        if year > MAXYEAR:          #no visit can be stored after the last year datetime supports
+            return iter(())
+        yearFirst = monthToDays(year, month or 1)
+        yearLast = monthToDays(year + 1, 1) if month is None else monthToDays(year, month + 1)
+        first = yearFirst if first is None else max(first, yearFirst)
+        last = yearLast if last is None or yearLast is None else min(last, yearLast)
+    rows = patients.rowsBetween(first, last)
+    if profiling.enabled:
+        #the rows are collected up front, so the scan is timed on its own instead of inside the formatting
+        with profiling.timed("scan"):
+            rows = array("q", rows)
+        profiling.count("visitsScanned", len(rows))
+    return rows
+
+
+def findVisitsByDate(patients, year=None, month=None, start=None, end=None):
+    """
+    Find visits by year, month, both, or by a range of dates.
+
+    patients: A VisitStore (or a dictionary of patient IDs), where each patient has a list of visits.
     year: The year to filter by.
     month: The month to filter by.
-    return: A list of tuples containing patient ID and visit that match the filter.
-    """
-    visits = []
-    #year has to be none or right value, same for month
-    if (year is None or year > 1900) and (month is None or 1 <= month <= 12):
-        for patientId in patients:
-            #for each patient ID's visit
-            for visit in patients[patientId]:
-                if re.search("[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]", visit[0]):
-                    dateList = visit[0].split("-")
-                    oldYear = int(dateList[0])
-                    oldMonth = int(dateList[1])
-                    if oldYear >= 1900 or 1 <= oldMonth <= 12:
-                        if year is not None and month is not None:
-                            if year == oldYear and month == oldMonth:
-                                visits.append((patientId, visit))
-                        elif year is not None and month is None:
-                            if year == oldYear:
-                                visits.append((patientId, visit))
-                        elif year is None and month is None:
-                            visits.append((patientId, visit))
-    return visits
+    start: The first date of the range to filter by, as 'yyyy-mm-dd' or a datetime.date.
+    end: The last date (included) of the range to filter by, as 'yyyy-mm-dd' or a datetime.date.
+    return: An iterator of tuples containing patient ID and visit that match every given filter, in date order.
+    """
+    patients = asStore(patients)
+    rows = findVisitRowsByDate(patients, year, month, start, end)
+    return ((patients.patientIds[row], patients.visit(row)) for row in rows)
 
 ########################################################################################################
 
@@ -288,55 +360,59 @@ def findPatientsWhoNeedFollowUp(patients):
     """
     Find patients who need follow-up visits based on abnormal vital signs.
 
-    patients: A dictionary of patient IDs, where each patient has a list of visits.
+    patients: A VisitStore (or a dictionary of patient IDs), where each patient has a list of visits. The thresholds
+              are the store's followUpRules, change them with patients.setFollowUpRules(FollowUpRules(...)).
     return: A list of patient IDs that need follow-up visits to to abnormal health stats.
     """
-    #blank list for followup patients
-    followup_patients = []
-    for patientId in patients:
-        for visit in patients[patientId]:
-            #corresponding vital values needs follow up
-            if visit[2] > 100 or visit[2] < 60 or visit[4] > 140 or visit[5] > 90 or visit[6] < 90:
-                if patientId not in followup_patients:
-                    followup_patients.append(patientId)
-    return followup_patients
+    #the store flags patients as visits are added and deleted, so no visit has to be looked at here
+    with profiling.timed("followup"):
+        return asStore(patients).flaggedPatients()
 
 ########################################################################################################
 
 
+def deletePatientVisits(patients, patientId, filename):
+    """
+    Deletes all visits of a particular patient without printing anything.
+
+    patients: The VisitStore to delete data from. A plain dictionary raises TypeError, like in addPatientData.
+    patientId: The ID of the patient to delete data for.
+    filename: The name of the patient file. A tombstone line is appended to it instead of rewriting it, and it is
+              compacted in the background once enough of it is stale.
+    return: The number of visits deleted, or None if the patient was not found.
+    """
+    if patientId not in writableStore(patients):
+        return None
+    with fileLock:
+        removed = patients.deletePatient(patientId)
+        appendTombstone(filename, patientId)
+        countStale(filename, removed + 1)
+    maybeCompact(patients, filename)
+    return removed
+
+
 def deleteAllVisitsOfPatient(patients, patientId, filename):
     """
     Delete all visits of a particular patient.
 
-    patients: The dictionary of patient IDs, where each patient has a list of visits, to delete data from.
+    patients: The VisitStore to delete data from. A plain dictionary raises TypeError, like in addPatientData.
     patientId: The ID of the patient to delete data for.
-    filename: The name of the file to save the updated patient data.
+    filename: The name of the patient file, see deletePatientVisits.
     return: None
     """
-    #blank str set
-    data = ""
-    if patientId not in patients.keys():
+    if deletePatientVisits(patients, patientId, filename) is None:
         print(f"No data found for patient with ID {patientId}.")
     else:
-        patients.pop(patientId)
-        # open file for writing
-        outputFile = open(filename, 'w')
-        for patientNumber in patients:
-            for visit in patients[patientNumber]:
-                data += str(patientNumber)+","
-                for index in visit:
-                    data+=str(index)+","
-                data = data[:-1]
-                data+="\n"
-        outputFile.write(data)
         print(f"Data for patient {patientId} has been deleted.")
-        outputFile.close()
 
 #########################################################################################################
 
 
-def main():
-    patients=readPatientsFromFile("patients.txt")
+def main(profile=False):
+    #with --profile the time spent in each stage is printed when the program quits
+    if profile:
+        profiling.enable()
+    patients=readPatientsFromFile("patients.txt", useSnapshot=True)
 
     while True:
         print("\n\nWelcome to the Health Information System\n\n")
@@ -374,19 +450,9 @@ def main():
         elif choice == '5':
             year = input("Enter year (YYYY) (or 0 for all years): ")
             month = input("Enter month (MM) (or 0 for all months): ")
-            visits = findVisitsByDate(patients, int(year) if year != '0' else None,
-                                      int(month) if month != '0' else None)
-            if visits:
-                for visit in visits:
-                    print("Patient ID:", visit[0])
-                    print(" Visit Date:", visit[1][0])
-                    print("  Temperature:", "%.2f" % visit[1][1], "C")
-                    print("  Heart Rate:", visit[1][2], "bpm")
-                    print("  Respiratory Rate:", visit[1][3], "bpm")
-                    print("  Systolic Blood Pressure:", visit[1][4], "mmHg")
-                    print("  Diastolic Blood Pressure:", visit[1][5], "mmHg")
-                    print("  Oxygen Saturation:", visit[1][6], "%")
-            else:
+            visitRows = findVisitRowsByDate(patients, int(year) if year != '0' else None,
+                                            int(month) if month != '0' else None)
+            if not writeVisits(patients, visitRows, patientHeaders="visit"):
                 print("No visits found for the specified year/month.")
         elif choice == '6':
             followup_patients = findPatientsWhoNeedFollowUp(patients)
@@ -401,10 +467,12 @@ def main():
             deleteAllVisitsOfPatient(patients, int(patientID), "patients.txt")
         elif choice == '8':
             print("Goodbye!")
+            if profile:
+                print(profiling.formatReport())
             break
         else:
             print("Invalid choice. Please try again.\n")
 
 
 if __name__ == '__main__':
-    main()
+    main("--profile" in sys.argv[1:])
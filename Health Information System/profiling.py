@@ -0,0 +1,117 @@
+# Desc: Opt-in instrumentation of the hot paths. Once enable() is called, loading, the queries and the visit listings
+#       add the time they spend in each stage to timers and keep counters such as rows parsed, rows rejected by
+#       reason, bytes read and visits scanned. It is disabled by default, and then the instrumented code only checks
+#       the enabled flag once per file range, query or listing, never once per line or visit.
+#       Callers read the flag as profiling.enabled, so enable() and disable() are seen by modules that imported it.
+
+
+import time
+from contextlib import contextmanager, nullcontext
+
+enabled = False
+
+#stage name -> [seconds, calls]. Stages of a parallel load are summed over the workers, so they can add up to more
+#than the time the load took.
+timers = {}
+
+#counter name -> value
+counters = {}
+
+#stages in the order a request goes through them, used to order the report
+STAGES = ("read", "split", "parse", "insert", "tombstones", "snapshotRead", "snapshotWrite", "stats", "followup",
+          "scan", "format", "write")
+
+DISABLED = nullcontext()
+
+
+def enable():
+    """
+    Turns instrumentation on. Timers and counters keep what they already hold, use reset() to clear them.
+    """
+    global enabled
+    enabled = True
+
+
+def disable():
+    """
+    Turns instrumentation off.
+    """
+    global enabled
+    enabled = False
+
+
+def reset():
+    """
+    Clears every timer and counter.
+    """
+    timers.clear()
+    counters.clear()
+
+
+def addTime(stage, seconds, calls=1):
+    """
+    Adds time to a stage.
+
+    stage: The name of the stage.
+    seconds: The time spent in it.
+    calls: The number of times the stage ran in that time.
+    """
+    timer = timers.get(stage)
+    if timer is None:
+        timer = timers[stage] = [0.0, 0]
+    timer[0] += seconds
+    timer[1] += calls
+
+
+def count(name, amount=1):
+    """
+    Adds to a counter.
+    """
+    counters[name] = counters.get(name, 0) + amount
+
+
+@contextmanager
+def timing(stage):
+    """
+    The context manager returned by timed() while instrumentation is enabled.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        addTime(stage, time.perf_counter() - start)
+
+
+def timed(stage):
+    """
+    Times a block of code: with profiling.timed("scan"): ...
+
+    stage: The name of the stage the time is added to.
+    return: A context manager, which does nothing while instrumentation is disabled.
+    """
+    return timing(stage) if enabled else DISABLED
+
+
+def report():
+    """
+    return: {"timers": {stage: {"seconds", "calls"}}, "counters": {name: value}}, with the stages in STAGES order
+            and the counters sorted by name.
+    """
+    order = {stage: i for i, stage in enumerate(STAGES)}
+    stages = sorted(timers, key=lambda stage: (order.get(stage, len(STAGES)), stage))
+    return {"timers": {stage: {"seconds": timers[stage][0], "calls": timers[stage][1]} for stage in stages},
+            "counters": dict(sorted(counters.items()))}
+
+
+def formatReport():
+    """
+    return: The report as a text table.
+    """
+    result = report()
+    lines = [f"{'stage':<16}{'seconds':>12}{'calls':>10}"]
+    for stage, timer in result["timers"].items():
+        lines.append(f"{stage:<16}{timer['seconds']:>12.4f}{timer['calls']:>10}")
+    lines.append(f"{'counter':<16}{'value':>12}")
+    for name, value in result["counters"].items():
+        lines.append(f"{name:<16}{value:>12}")
+    return "\n".join(lines)
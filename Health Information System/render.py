@@ -0,0 +1,131 @@
+# Desc: Formats visits for output. Visits are formatted in batches and each batch is written with one call, instead
+#       of one print per line, and any page of visits can be formatted without formatting the ones before it. Three
+#       formats are supported: 'text' (the layout the menu always printed), 'csv' (the patients.txt line format) and
+#       'jsonl' (one JSON object per visit).
+
+
+import sys
+import time
+from itertools import islice
+
+import profiling
+from visitstore import daysToDate
+
+FORMATS = ("text", "csv", "jsonl")
+
+#number of visits formatted into one string before it is written or yielded
+BATCH_SIZE = 2000
+
+TEXT_VISIT = (" Visit Date: {}\n"
+              "  Temperature: {:.2f} C\n"
+              "  Heart Rate: {} bpm\n"
+              "  Respiratory Rate: {} bpm\n"
+              "  Systolic Blood Pressure: {} mmHg\n"
+              "  Diastolic Blood Pressure: {} mmHg\n"
+              "  Oxygen Saturation: {} %\n")
+
+CSV_VISIT = "{},{},{!r},{},{},{},{},{}\n"
+
+JSON_VISIT = ('{{"patientId": {}, "date": "{}", "temp": {!r}, "hr": {}, "rr": {}, "sbp": {}, "dbp": {}, '
+              '"spo2": {}}}\n')
+
+
+def pageOf(rows, pageSize=None, offset=0):
+    """
+    Returns one page of row numbers.
+
+    rows: The row numbers, an array or list is sliced directly, any other iterable is skipped through.
+    pageSize: The number of rows in the page. If None, every row from offset on is returned.
+    offset: The number of rows to skip.
+    return: An iterable of row numbers.
+    """
+    end = None if pageSize is None else offset + pageSize
+    if hasattr(rows, "__getitem__"):
+        return rows[offset:end]
+    return islice(rows, offset, end)
+
+
+def renderChunks(patients, rows, fmt="text", patientHeaders="change", pageSize=None, offset=0, batchSize=BATCH_SIZE):
+    """
+    Formats visits in batches.
+
+    patients: The VisitStore the visits are in.
+    rows: The row numbers of the visits, in the order they should be written.
+    fmt: 'text', 'csv' or 'jsonl'.
+    patientHeaders: For 'text' only. 'change' writes 'Patient ID: ...' before the first visit of every patient, as
+                    the patient listing does, and 'visit' writes it before every visit, as the date search does.
+    pageSize: The number of visits to format. If None, every visit from offset on is formatted.
+    offset: The number of visits to skip first.
+    batchSize: The number of visits formatted into each chunk.
+    return: A generator of strings, each holding up to batchSize formatted visits.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    template = {"text": TEXT_VISIT, "csv": CSV_VISIT, "jsonl": JSON_VISIT}[fmt].format
+    patientIds, dates = patients.patientIds, patients.dates
+    temps, hrs, rrs, sbps, dbps, spo2s = patients.columns()
+    #visits share a small number of distinct dates, so each one is only turned into a string once
+    dateCache = {}
+    lastPatient = None
+    batch = []
+    for row in pageOf(rows, pageSize, offset):
+        patientId = patientIds[row]
+        date = dateCache.get(dates[row])
+        if date is None:
+            date = dateCache[dates[row]] = daysToDate(dates[row])
+        if fmt == "text":
+            if patientHeaders == "visit" or patientId != lastPatient:
+                batch.append(f"Patient ID: {patientId}\n")
+                lastPatient = patientId
+            batch.append(template(date, temps[row], hrs[row], rrs[row], sbps[row], dbps[row], spo2s[row]))
+        else:
+            batch.append(template(patientId, date, temps[row], hrs[row], rrs[row], sbps[row], dbps[row], spo2s[row]))
+        if len(batch) >= batchSize:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+def writeVisits(patients, rows, out=None, fmt="text", patientHeaders="change", pageSize=None, offset=0):
+    """
+    Formats visits and writes them with one write per batch.
+
+    patients: The VisitStore the visits are in.
+    rows: The row numbers of the visits, in the order they should be written.
+    out: The stream to write to. If None, standard output is used.
+    fmt, patientHeaders, pageSize, offset: The same as for renderChunks.
+    return: True if at least one visit was written.
+    """
+    out = out or sys.stdout
+    chunks = renderChunks(patients, rows, fmt, patientHeaders, pageSize, offset)
+    if profiling.enabled:
+        return writeProfiled(chunks, out)
+    wrote = False
+    for chunk in chunks:
+        out.write(chunk)
+        wrote = True
+    return wrote
+
+
+def writeProfiled(chunks, out):
+    """
+    writeVisits while profiling is enabled: formatting and writing every chunk are timed as separate stages.
+
+    chunks: The chunks from renderChunks.
+    out: The stream to write to.
+    return: True if at least one visit was written.
+    """
+    clock = time.perf_counter
+    wrote = False
+    while True:
+        start = clock()
+        chunk = next(chunks, None)
+        formatted = clock()
+        profiling.addTime("format", formatted - start)
+        if chunk is None:
+            return wrote
+        out.write(chunk)
+        profiling.addTime("write", clock() - formatted)
+        profiling.count("bytesFormatted", len(chunk))
+        wrote = True
@@ -0,0 +1,433 @@
+# Desc: A local network service for the Health Information System. One process loads the patient file once and
+#       answers the eight menu operations for many clients, so appends, deletes and compaction of patients.txt are
+#       all coordinated by it instead of by separate copies of main.py. Reads run concurrently under a reader/writer
+#       lock, and every write goes through one writer task, which adds the visits of all queued requests with a
+#       single append. The latency of every request is recorded and reported as percentiles.
+# Usage: python server.py [--file patients.txt] [--host 127.0.0.1] [--port 8765] [--workers N] [--fsync] [--profile]
+# Protocol: newline-delimited JSON. Each request is an object with an "op" and its arguments on one line, and each
+#           response is {"ok": true, "result": ...} or {"ok": false, "error": message} on one line.
+#             {"op": "show", "patientId": 0, "format": "text", "pageSize": 1000, "offset": 0}   -> {"output": text}
+#             {"op": "add", "visit": [id, date, temp, hr, rr, sbp, dbp, spo2]}  or  {"op": "add", "visits": [...]}
+#                                                                            -> {"accepted": n, "rejected": [[i, msg]]}
+#             {"op": "stats", "patientId": 0}                  -> getStats dictionary, or null if there are no visits
+#             {"op": "visits", "year": 2022, "month": 3, "start": null, "end": null, "format": ..., "pageSize": ...,
+#              "offset": ...}                                                                     -> {"output": text}
+#             {"op": "followup"}                                                               -> {"patientIds": [...]}
+#             {"op": "delete", "patientId": 12}                                                   -> {"deleted": n}
+#             {"op": "quit"}                                                  -> {"goodbye": true}, then disconnects
+#             {"op": "metrics"}                                   -> latency percentiles in milliseconds, per operation
+#                                                                       and the profiling report under "profile" if on
+
+
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+import time
+from collections import deque
+from itertools import chain
+
+import profiling
+from main import (checkVisits, deletePatientVisits, findPatientsWhoNeedFollowUp, findVisitRowsByDate, getStats,
+                  saveVisits)
+from render import FORMATS, renderChunks
+
+#number of visits a listing returns when the request does not give a pageSize, so one response stays small
+PAGE_SIZE = 1000
+
+#number of most recent latencies kept per operation for the percentiles
+LATENCY_SAMPLES = 10000
+
+PERCENTILES = (50, 90, 99)
+
+#longest request line accepted, in bytes
+MAX_REQUEST = 1 << 24
+
+
+class RequestError(Exception):
+    """
+    A request that can't be answered. Its message is sent back to the client.
+    """
+
+
+class ReadWriteLock:
+    """
+    An asyncio lock held by any number of readers or by one writer. A waiting writer stops new readers from getting
+    the lock, so a steady stream of reads can't hold writes back forever.
+    """
+
+    def __init__(self):
+        self.readers = 0
+        self.writing = False
+        self.waitingWriters = 0
+        self.condition = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def reading(self):
+        """
+        Holds the lock as one of its readers.
+        """
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.writing and not self.waitingWriters)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def writer(self):
+        """
+        Holds the lock as its only writer.
+        """
+        async with self.condition:
+            self.waitingWriters += 1
+            try:
+                await self.condition.wait_for(lambda: not self.writing and not self.readers)
+            finally:
+                self.waitingWriters -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+
+
+def percentiles(samples, points=PERCENTILES):
+    """
+    samples: A list of latencies in seconds.
+    points: The percentiles to return.
+    return: {"count", "p50", "p90", "p99", "max"} with the latencies in milliseconds (nearest rank), or None if
+            there are no samples.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    result = {"count": len(ordered)}
+    for point in points:
+        result[f"p{point}"] = 1000 * ordered[max(-(-point * len(ordered) // 100) - 1, 0)]
+    result["max"] = 1000 * ordered[-1]
+    return result
+
+
+class LatencyLog:
+    """
+    The most recent request latencies of every operation.
+    """
+
+    def __init__(self, size=LATENCY_SAMPLES):
+        self.size = size
+        self.samples = {}
+        self.counts = {}
+
+    def record(self, op, seconds):
+        """
+        Records the latency of one request of an operation.
+        """
+        if op not in self.samples:
+            self.samples[op] = deque(maxlen=self.size)
+            self.counts[op] = 0
+        self.samples[op].append(seconds)
+        self.counts[op] += 1
+
+    def report(self):
+        """
+        return: {op: percentiles of its recent latencies, with "count" the number of requests since the start}.
+        """
+        report = {}
+        for op, samples in self.samples.items():
+            report[op] = percentiles(list(samples))
+            report[op]["count"] = self.counts[op]
+        return report
+
+########################################################################################################
+
+
+def pageArguments(request):
+    """
+    request: A listing request.
+    return: (format, page size, offset) of the request, with PAGE_SIZE when no pageSize is given.
+    """
+    fmt = request.get("format", "text")
+    if fmt not in FORMATS:
+        raise RequestError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    pageSize = request.get("pageSize", PAGE_SIZE)
+    offset = request.get("offset", 0)
+    if pageSize is not None and (type(pageSize) is not int or pageSize < 0):
+        raise RequestError("pageSize has to be a whole number of at least 0.")
+    if type(offset) is not int or offset < 0:
+        raise RequestError("offset has to be a whole number of at least 0.")
+    return fmt, pageSize, offset
+
+
+def showVisits(patients, request):
+    """
+    Menu options 1 and 2: one page of the visits of every patient, or of patientId.
+    """
+    patientId = request.get("patientId", 0)
+    fmt, pageSize, offset = pageArguments(request)
+    if patientId == 0:
+        rows = chain.from_iterable(patients.offsets.values())
+    elif patientId in patients:
+        rows = patients.rows(patientId)
+    else:
+        raise RequestError(f"Patient with ID {patientId} not found.")
+    with profiling.timed("format"):
+        return {"output": "".join(renderChunks(patients, rows, fmt, "change", pageSize, offset))}
+
+
+def findVisits(patients, request):
+    """
+    Menu option 5: one page of the visits in a year, month or range of dates.
+    """
+    fmt, pageSize, offset = pageArguments(request)
+    rows = findVisitRowsByDate(patients, request.get("year"), request.get("month"), request.get("start"),
+                               request.get("end"))
+    with profiling.timed("format"):
+        return {"output": "".join(renderChunks(patients, rows, fmt, "visit", pageSize, offset))}
+
+
+def stats(patients, request):
+    """
+    Menu option 4: the statistics of every patient, or of patientId.
+    """
+    return getStats(patients, request.get("patientId", 0))
+
+
+def followUp(patients, request):
+    """
+    Menu option 6: the patients who need a follow-up visit.
+    """
+    return {"patientIds": findPatientsWhoNeedFollowUp(patients)}
+
+
+#operations that only read the store, each called with (store, request) while the read lock is held
+READS = {"show": showVisits, "visits": findVisits, "stats": stats, "followup": followUp}
+
+########################################################################################################
+
+
+class PatientServer:
+    """
+    Serves one VisitStore and its patient file to any number of connections.
+    """
+
+    def __init__(self, patients, fileName, fsync=False):
+        """
+        patients: The VisitStore loaded from the file.
+        fileName: The name of the patient file that writes are appended to.
+        fsync: If True, the file is flushed to disk after every group of writes.
+        """
+        self.patients = patients
+        self.fileName = fileName
+        self.fsync = fsync
+        self.lock = ReadWriteLock()
+        self.writes = asyncio.Queue()
+        self.latency = LatencyLog()
+        self.server = None
+        self.writerTask = None
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """
+        Starts listening and starts the writer task.
+
+        return: The asyncio server. Port 0 picks a free port, read it from server.sockets[0].getsockname().
+        """
+        self.writerTask = asyncio.create_task(self.writeLoop())
+        self.server = await asyncio.start_server(self.serveClient, host, port, limit=MAX_REQUEST)
+        return self.server
+
+    async def close(self):
+        """
+        Stops listening, lets the queued writes finish and stops the writer task.
+        """
+        self.server.close()
+        await self.server.wait_closed()
+        await self.writes.join()
+        self.writerTask.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.writerTask
+
+    async def serveClient(self, reader, writer):
+        """
+        Answers the requests of one connection until it closes or sends quit.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                start = time.perf_counter()
+                op = None
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise RequestError("A request has to be a JSON object.")
+                    op = request.get("op")
+                    response = {"ok": True, "result": await self.answer(op, request)}
+                except RequestError as error:
+                    response = {"ok": False, "error": str(error)}
+                except (ValueError, TypeError, KeyError) as error:
+                    response = {"ok": False, "error": f"Invalid request: {error}"}
+                #anything else is a bug, the client gets an answer and the connection stays open
+                except Exception as error:
+                    response = {"ok": False, "error": f"Internal error: {error!r}"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+                self.latency.record(op if isinstance(op, str) else "invalid", time.perf_counter() - start)
+                if op == "quit":
+                    break
+        except (ConnectionError, asyncio.LimitOverrunError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def answer(self, op, request):
+        """
+        return: The result of one request. Raises RequestError if it can't be answered.
+        """
+        if op in READS:
+            async with self.lock.reading():
+                return READS[op](self.patients, request)
+        if op == "add":
+            visits = request["visits"] if "visits" in request else [request["visit"]]
+            if not isinstance(visits, list) or not all(isinstance(visit, list) for visit in visits):
+                raise RequestError("visits has to be a list of [id, date, temp, hr, rr, sbp, dbp, spo2] lists.")
+            return await self.write("add", visits)
+        if op == "delete":
+            patientId = request["patientId"]
+            if type(patientId) is not int:
+                raise RequestError("'patientId' should be an integer.")
+            return await self.write("delete", patientId)
+        if op == "quit":
+            return {"goodbye": True}
+        if op == "metrics":
+            report = self.latency.report()
+            if profiling.enabled:
+                report["profile"] = profiling.report()
+            return report
+        raise RequestError(f"Unknown op {op!r}.")
+
+    async def write(self, op, argument):
+        """
+        Queues a write for the writer task and waits for its result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.writes.put((op, argument, future))
+        return await future
+
+    async def writeLoop(self):
+        """
+        The writer task. It takes every write queued so far, applies them while it holds the write lock, and hands
+        each request its result.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self.writes.get()]
+            while not self.writes.empty():
+                jobs.append(self.writes.get_nowait())
+            try:
+                async with self.lock.writer():
+                    #writes are done in a worker thread while the loop takes requests: flushing to disk blocks, and
+                    #so does the file lock while a background compaction rewrites the file
+                    outcomes = await loop.run_in_executor(None, self.applyWrites, jobs)
+                for (op, argument, future), outcome in zip(jobs, outcomes):
+                    if future.cancelled():
+                        continue
+                    if isinstance(outcome, Exception):
+                        future.set_exception(outcome)
+                    else:
+                        future.set_result(outcome)
+            finally:
+                for _ in jobs:
+                    self.writes.task_done()
+
+    def applyWrites(self, jobs):
+        """
+        Applies queued writes in order. The visits of consecutive add requests are checked request by request and
+        then saved together, so they are appended to the file with one write and a request that can't be checked
+        only fails itself.
+
+        jobs: A list of (op, argument, future).
+        return: The result, or the exception, of every job.
+        """
+        outcomes = []
+        start = 0
+        while start < len(jobs):
+            if jobs[start][0] == "delete":
+                patientId = jobs[start][1]
+                try:
+                    removed = deletePatientVisits(self.patients, patientId, self.fileName)
+                    if removed is None:
+                        outcomes.append(RequestError(f"No data found for patient with ID {patientId}."))
+                    else:
+                        outcomes.append({"deleted": removed})
+                except Exception as error:
+                    outcomes.append(error)
+                start += 1
+                continue
+            end = start
+            while end < len(jobs) and jobs[end][0] == "add":
+                end += 1
+            groupOutcomes = []
+            visits = []
+            for op, argument, future in jobs[start:end]:
+                try:
+                    accepted, rejected = checkVisits(argument)
+                except Exception as error:
+                    groupOutcomes.append(error)
+                else:
+                    groupOutcomes.append({"accepted": len(accepted), "rejected": [list(reject) for reject in rejected]})
+                    visits += accepted
+            try:
+                saveVisits(self.patients, visits, self.fileName, self.fsync)
+            except Exception as error:
+                groupOutcomes = [error] * len(groupOutcomes)
+            outcomes += groupOutcomes
+            start = end
+        return outcomes
+
+########################################################################################################
+
+
+async def serve(fileName, host, port, workers=None, fsync=False):
+    """
+    Loads a patient file and serves it until the process is interrupted, then prints the latency percentiles.
+    """
+    from snapshot import loadPatientsWithSnapshot
+    patients, errors = loadPatientsWithSnapshot(fileName, workers)
+    service = PatientServer(patients, fileName, fsync)
+    server = await service.start(host, port)
+    address = server.sockets[0].getsockname()
+    print(f"Serving {patients.numVisits()} visits of {len(patients)} patients from {fileName} on "
+          f"{address[0]}:{address[1]} ({len(errors)} lines rejected)", file=sys.stderr)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.close()
+        print(json.dumps(service.latency.report(), indent=2), file=sys.stderr)
+        if profiling.enabled:
+            print(profiling.formatReport(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a Health Information System file over newline-delimited JSON.")
+    parser.add_argument("--file", default="patients.txt", help="patient file (default patients.txt)")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default 8765)")
+    parser.add_argument("--workers", type=int, default=None, help="processes used to load (default every CPU)")
+    parser.add_argument("--fsync", action="store_true", help="flush the file to disk after every group of writes")
+    parser.add_argument("--profile", action="store_true", help="time each stage and count rows, rejects and scans")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve(args.file, args.host, args.port, args.workers, args.fsync))
@@ -0,0 +1,383 @@
+# Desc: Sharded storage. Instead of one patients.txt, the visits are kept in a directory of shard files in the same
+#       format, and every patient lives in exactly one of them, chosen by a hash of the patient ID. A small
+#       manifest.json lists the shards. Adding visits or deleting a patient only appends to, loads and compacts the
+#       shards of those patients, and full scans (statistics, follow-up, date search) run on every shard at once in a
+#       process pool and merge the partial results. Each shard keeps its own tombstones, compaction and snapshot.
+#       The migrate command converts a single patient file into a sharded directory.
+# Usage: python shards.py migrate SOURCE DIRECTORY [--shards N]
+#        python shards.py DIRECTORY stats [--patient ID]
+#        python shards.py DIRECTORY followup
+#        python shards.py DIRECTORY visits [--year YYYY] [--month MM] [--start yyyy-mm-dd] [--end yyyy-mm-dd]
+#        python shards.py DIRECTORY add ID DATE TEMP HR RR SBP DBP SPO2
+#        python shards.py DIRECTORY delete ID
+
+
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+from operator import itemgetter
+
+from main import BatchResult, addVisits, deletePatientVisits, findVisitRowsByDate, printStats
+from render import TEXT_VISIT
+from snapshot import loadPatientsWithSnapshot
+from visitlog import TOMBSTONE
+from visitstore import VitalAggregate
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+
+#lines of a migrated file that have no readable patient ID, kept so a migration never drops data
+UNSHARDED = "unsharded.txt"
+
+DEFAULT_SHARDS = 8
+
+#lines a shard file collects during a migration before they are written
+WRITE_BATCH = 10000
+
+#shards loaded by this process, file name -> ((size, mtime), store)
+loadedShards = {}
+
+
+def shardOf(patientId, count):
+    """
+    patientId: The ID of a patient.
+    count: The number of shards.
+    return: The index of the shard the patient belongs to. IDs are mixed with a 64-bit multiplicative hash, so runs of
+            consecutive IDs spread over every shard, and the result never changes between runs or Python versions.
+    """
+    return (((patientId * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32) % count
+
+
+def fileKey(fileName):
+    """
+    return: (size, modification time) of a file, which changes whenever the file does.
+    """
+    stat = os.stat(fileName)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def loadShard(fileName, cache=True):
+    """
+    Loads one shard through its snapshot.
+
+    fileName: The name of the shard file.
+    cache: If True, the store is kept in loadedShards and reused as long as the file does not change.
+    return: The VisitStore of the shard.
+    """
+    key = fileKey(fileName)
+    cached = loadedShards.get(fileName)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    patients, errors = loadPatientsWithSnapshot(fileName, workers=1)
+    if cache:
+        loadedShards[fileName] = (key, patients)
+    return patients
+
+########################################################################################################
+# Partial queries, run on one shard each. They are module level functions so a process pool can run them.
+
+
+def shardStats(fileName, cache=True):
+    """
+    return: The VitalAggregate of every visit in a shard.
+    """
+    aggregate = VitalAggregate()
+    aggregate.merge(loadShard(fileName, cache).stats())
+    return aggregate
+
+
+def shardFollowUp(fileName, cache=True):
+    """
+    return: The patients of a shard who need a follow-up visit, in the order they were first seen.
+    """
+    return loadShard(fileName, cache).flaggedPatients()
+
+
+def shardVisits(fileName, year, month, start, end, cache=True):
+    """
+    return: A list of (days, patient ID, visit) for the visits of a shard that match the filters of
+            main.findVisitsByDate, in date order.
+    """
+    patients = loadShard(fileName, cache)
+    dates, patientIds = patients.dates, patients.patientIds
+    return [(dates[row], patientIds[row], patients.visit(row))
+            for row in findVisitRowsByDate(patients, year, month, start, end)]
+
+########################################################################################################
+
+
+class ShardedStore:
+    """
+    A directory of shard files described by a manifest. Use it as a context manager, or call close(), so the process
+    pool of the full scans is shut down.
+    """
+
+    def __init__(self, directory, workers=None):
+        """
+        directory: The directory holding manifest.json.
+        workers: The number of processes full scans use. None uses one per shard up to the number of CPUs, 1 runs
+                 every shard in this process and keeps the loaded shards for the next query.
+        Raises OSError if there is no manifest and ValueError if it is of another version.
+        """
+        with open(os.path.join(directory, MANIFEST)) as infile:
+            manifest = json.load(infile)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported shard manifest version {manifest.get('version')!r}")
+        self.directory = directory
+        self.files = [os.path.join(directory, name) for name in manifest["files"]]
+        if workers is None:
+            workers = min(len(self.files), os.cpu_count() or 1)
+        self.workers = workers
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        """
+        Shuts the process pool down.
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def fileOf(self, patientId):
+        """
+        return: The name of the shard file a patient belongs to.
+        """
+        return self.files[shardOf(patientId, len(self.files))]
+
+    def scan(self, function, *args):
+        """
+        Runs a partial query on every shard.
+
+        function: One of the shard functions above, called as function(fileName, *args, cache).
+        return: The list of its results, in shard order.
+        """
+        if self.workers <= 1 or len(self.files) == 1:
+            return [function(fileName, *args, True) for fileName in self.files]
+        if self.pool is None:
+            #imported here, so commands that touch one shard don't pay for loading multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        #a worker may get any shard, so workers don't keep them, one copy of every shard per worker would not fit
+        count = len(self.files)
+        return list(self.pool.map(function, self.files, *([arg] * count for arg in args), [False] * count))
+
+    def stats(self, patientId=0):
+        """
+        Returns the statistics of each vital sign for all patients or for one patient, like main.getStats.
+
+        patientId: The ID of the patient. If 0, the statistics of every shard are merged.
+        return: The same dictionary as main.getStats, or None if there are no visits.
+        """
+        patientId = int(patientId)
+        if patientId == 0:
+            aggregate = VitalAggregate()
+            for partial in self.scan(shardStats):
+                aggregate.merge(partial)
+        else:
+            patients = loadShard(self.fileOf(patientId))
+            if patientId not in patients:
+                return None
+            aggregate = patients.stats(patientId)
+        return aggregate.asDict() if aggregate.count else None
+
+    def flaggedPatients(self):
+        """
+        return: The patients who need a follow-up visit. They are listed shard by shard, in the order each shard
+                first saw them, since the order of the single file is not kept across shards.
+        """
+        return [patientId for partial in self.scan(shardFollowUp) for patientId in partial]
+
+    def findVisitsByDate(self, year=None, month=None, start=None, end=None):
+        """
+        Finds visits in every shard, with the same filters as main.findVisitsByDate.
+
+        return: An iterator of (patient ID, visit) in date order.
+        """
+        partials = self.scan(shardVisits, year, month, start, end)
+        return ((patientId, visit) for days, patientId, visit in heapq.merge(*partials, key=itemgetter(0)))
+
+    def addVisits(self, visits, fsync=False):
+        """
+        Adds many new visits, like main.addVisits. Each shard gets its visits with one append, and a shard is only
+        loaded if this process already has it loaded, so it stays up to date.
+
+        visits: An iterable of (patientId, date, temp, hr, rr, sbp, dbp, spo2) tuples.
+        fsync: If True, every shard that was written to is flushed to disk.
+        return: A BatchResult for the whole batch.
+        """
+        start = time.perf_counter()
+        groups = {}
+        for index, visit in enumerate(visits):
+            #a visit without a whole number ID is rejected by validation, any shard will do
+            fileName = self.fileOf(visit[0]) if type(visit[0]) is int else self.files[0]
+            groups.setdefault(fileName, []).append((index, visit))
+        accepted = 0
+        rejected = []
+        for fileName, group in groups.items():
+            cached = loadedShards.get(fileName)
+            patients = cached[1] if cached is not None and cached[0] == fileKey(fileName) else None
+            result = addVisits(patients, [visit for index, visit in group], fileName, fsync)
+            if patients is not None:
+                loadedShards[fileName] = (fileKey(fileName), patients)
+            accepted += result.accepted
+            rejected.extend((group[position][0], message) for position, message in result.rejected)
+        rejected.sort()
+        seconds = time.perf_counter() - start
+        rowsPerSecond = (accepted + len(rejected)) / seconds if seconds > 0 else 0.0
+        return BatchResult(accepted, rejected, seconds, rowsPerSecond)
+
+    def deletePatient(self, patientId):
+        """
+        Deletes all visits of a patient. Only the patient's shard is loaded, appended to and compacted.
+
+        return: The number of visits deleted, or None if the patient was not found.
+        """
+        fileName = self.fileOf(patientId)
+        patients = loadShard(fileName)
+        removed = deletePatientVisits(patients, patientId, fileName)
+        if removed is not None:
+            loadedShards[fileName] = (fileKey(fileName), patients)
+        return removed
+
+########################################################################################################
+
+
+def migrate(source, directory, shards=DEFAULT_SHARDS):
+    """
+    Converts a single patient file into a sharded directory. The file is streamed line by line, never loaded, and
+    every line (tombstones too) goes to the shard of its patient in its original order, so loading the shards gives
+    the same visits as loading the file. Lines without a readable patient ID go to unsharded.txt.
+
+    source: The patient file to convert. It is not changed.
+    directory: The directory to create the shards in. It must not hold a manifest already.
+    shards: The number of shard files.
+    return: A list with the number of lines written to each shard, and the number of unsharded lines last.
+            Raises FileExistsError if the directory already holds a manifest.
+    """
+    if shards < 1:
+        raise ValueError(f"The number of shards has to be at least 1, not {shards}.")
+    manifestName = os.path.join(directory, MANIFEST)
+    if os.path.exists(manifestName):
+        raise FileExistsError(f"{manifestName} already exists.")
+    os.makedirs(directory, exist_ok=True)
+    names = [f"shard-{i:03d}.txt" for i in range(shards)] + [UNSHARDED]
+    outfiles = [open(os.path.join(directory, name), "w") for name in names]
+    counts = [0] * len(names)
+    batches = [[] for _ in names]
+    try:
+        with open(source, encoding="utf-8", errors="replace") as infile:
+            for line in infile:
+                line = line.rstrip("\r\n")
+                fields = line.strip().split(",")
+                try:
+                    patientId = int(fields[1] if fields[0] == TOMBSTONE and len(fields) == 2 else fields[0])
+                    target = shardOf(patientId, shards)
+                except ValueError:
+                    target = shards
+                batch = batches[target]
+                batch.append(line)
+                if len(batch) == WRITE_BATCH:
+                    outfiles[target].write("\n".join(batch) + "\n")
+                    counts[target] += len(batch)
+                    batch.clear()
+        for target, batch in enumerate(batches):
+            if batch:
+                outfiles[target].write("\n".join(batch) + "\n")
+                counts[target] += len(batch)
+    finally:
+        for outfile in outfiles:
+            outfile.close()
+    #the manifest is written last, so a migration that stopped halfway is never taken for a finished one
+    manifest = {"version": MANIFEST_VERSION, "shards": shards, "hash": "fibonacci64", "files": names[:-1],
+                "source": os.path.abspath(source)}
+    with open(manifestName + ".tmp", "w") as outfile:
+        json.dump(manifest, outfile, indent=2)
+    os.replace(manifestName + ".tmp", manifestName)
+    return counts
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        parser = argparse.ArgumentParser(prog="shards.py migrate", description="Split a patient file into shards.")
+        parser.add_argument("source", help="patient file to convert")
+        parser.add_argument("directory", help="directory to create the shards in")
+        parser.add_argument("--shards", type=int, default=DEFAULT_SHARDS, help="number of shards (default 8)")
+        args = parser.parse_args(sys.argv[2:])
+        try:
+            counts = migrate(args.source, args.directory, args.shards)
+        except (OSError, ValueError) as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+        print(f"Wrote {sum(counts[:-1])} lines to {len(counts) - 1} shards in {args.directory}"
+              f" ({counts[-1]} lines without a patient ID in {UNSHARDED})")
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Query and update a sharded Health Information System directory.")
+    parser.add_argument("directory", help="directory holding manifest.json")
+    parser.add_argument("--workers", type=int, default=None, help="processes used for full scans")
+    commands = parser.add_subparsers(dest="name", required=True)
+    command = commands.add_parser("stats", help="display the average vital signs")
+    command.add_argument("--patient", default="0", help="patient ID (default every patient)")
+    commands.add_parser("followup", help="list the patients who need a follow-up visit")
+    command = commands.add_parser("visits", help="find visits by year, month, both, or a range of dates")
+    command.add_argument("--year", type=int, default=None)
+    command.add_argument("--month", type=int, default=None)
+    command.add_argument("--start", default=None, help="first date, yyyy-mm-dd")
+    command.add_argument("--end", default=None, help="last date (included), yyyy-mm-dd")
+    command = commands.add_parser("add", help="add one visit")
+    command.add_argument("patient", type=int)
+    command.add_argument("date")
+    command.add_argument("temp", type=float)
+    for name in ("hr", "rr", "sbp", "dbp", "spo2"):
+        command.add_argument(name, type=int)
+    command = commands.add_parser("delete", help="delete all visits of a patient")
+    command.add_argument("patient", type=int)
+    args = parser.parse_args()
+
+    try:
+        with ShardedStore(args.directory, args.workers) as store:
+            if args.name == "stats":
+                try:
+                    printStats(store.stats(args.patient), args.patient)
+                except ValueError:
+                    print("Error:", "'patientId' should be an integer.")
+            elif args.name == "followup":
+                patientIds = store.flaggedPatients()
+                if patientIds:
+                    print("Patients who need follow-up visits:")
+                    print("\n".join(map(str, patientIds)))
+                else:
+                    print("No patients found who need follow-up visits.")
+            elif args.name == "visits":
+                found = False
+                try:
+                    for patientId, visit in store.findVisitsByDate(args.year, args.month, args.start, args.end):
+                        found = True
+                        sys.stdout.write(f"Patient ID: {patientId}\n" + TEXT_VISIT.format(*visit))
+                except ValueError:
+                    print("Error:", "dates should be valid dates in the format 'yyyy-mm-dd'.")
+                    sys.exit(1)
+                if not found:
+                    print("No visits found for the specified year/month.")
+            elif args.name == "add":
+                result = store.addVisits([(args.patient, args.date, args.temp, args.hr, args.rr, args.sbp, args.dbp,
+                                           args.spo2)])
+                print(result.rejected[0][1] if result.rejected else
+                      f"Visit is saved successfully for Patient # {args.patient}")
+            else:
+                if store.deletePatient(args.patient) is None:
+                    print(f"No data found for patient with ID {args.patient}.")
+                else:
+                    print(f"Data for patient {args.patient} has been deleted.")
+    except BrokenPipeError:
+        #whatever read the output stopped early, for example 'shards.py DIR visits | head'
+        sys.stdout = open(os.devnull, "w")
@@ -0,0 +1,230 @@
+# Desc: Binary snapshots of a loaded patient file. A snapshot holds the store's typed columns with every patient's
+#       visits stored next to each other, a patient offset table and the sorted date index, so it is read back with
+#       mmap and a memory copy per column instead of parsing text. It remembers the size, modification time and the
+#       line count of the text file it was made from: an unchanged file reuses it as is, and lines appended to the
+#       file since then (visits and tombstones) are parsed on their own and added to it.
+
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+
+import profiling
+from loader import RejectedLine, loadRange
+from visitlog import staleLines
+from visitstore import ROW_SPAN, VisitStore
+
+MAGIC = b"HISSNAP1"
+#2: lines are checked with the rules of validation.py, snapshots of older versions are made again
+VERSION = 2
+
+#magic, version, source size, source mtime (ns), line count, row count, patient count, stale lines, errors length,
+#hash of the source bytes the snapshot was made from
+HEADER = struct.Struct("<8sIQqQQQQQ32s")
+
+#bytes of the source hashed at a time
+HASH_BLOCK = 1 << 20
+
+#column type codes in the order they are stored, after the patient offset table
+COLUMN_TYPES = ("q", "i", "d", "h", "h", "h", "h", "h")
+
+
+def snapshotNameFor(fileName):
+    """
+    fileName: The name of the patient file.
+    return: The name of the snapshot file kept next to it.
+    """
+    return fileName + ".snap"
+
+
+def hashPrefix(fileName, size):
+    """
+    Hashes the first size bytes of a file.
+
+    fileName: The name of the file.
+    size: The number of bytes of the file to hash.
+    return: A 32-byte digest.
+    """
+    digest = hashlib.sha256()
+    with open(fileName, "rb") as infile:
+        while size > 0:
+            block = infile.read(min(size, HASH_BLOCK))
+            if not block:
+                break
+            digest.update(block)
+            size -= len(block)
+    return digest.digest()
+
+
+def padding(length):
+    """
+    return: The number of zero bytes that bring length to a multiple of 8, so every block stays aligned.
+    """
+    return -length % 8
+
+########################################################################################################
+
+
+def writeSnapshot(patients, errors, fileName, sourceSize, sourceMtime, lineCount, snapshotName=None):
+    """
+    Writes a store to a snapshot file.
+
+    patients: The VisitStore loaded from the first sourceSize bytes of the patient file.
+    errors: The RejectedLine list of the same load.
+    fileName: The name of the patient file.
+    sourceSize: The number of bytes of the patient file that were loaded.
+    sourceMtime: The modification time of the patient file, in nanoseconds, when it was loaded.
+    lineCount: The number of lines in the loaded bytes.
+    snapshotName: The name of the snapshot file. If None, snapshotNameFor(fileName) is used.
+    """
+    snapshotName = snapshotName or snapshotNameFor(fileName)
+    #order the rows by patient, so every patient is described by (patient ID, first row, number of rows)
+    order = array("q")
+    table = array("q")
+    for patientId, rows in patients.offsets.items():
+        table.extend((patientId, len(order), len(rows)))
+        order.extend(rows)
+    columns = [array(column.typecode, map(column.__getitem__, order))
+               for column in (patients.patientIds, patients.dates) + patients.columns()]
+    dateIndex = array("q", sorted(day * ROW_SPAN + row for row, day in enumerate(columns[1])))
+    errorBytes = json.dumps([list(error) for error in errors]).encode()
+    sourceHash = hashPrefix(fileName, sourceSize)
+
+    #imported here, like in visitlog.compactFile, since tempfile is slow to import
+    import tempfile
+    #every writer gets its own temporary file, so processes loading the same file at once don't write over each other
+    handle, tempName = tempfile.mkstemp(prefix=".snap-", dir=os.path.dirname(os.path.abspath(snapshotName)))
+    try:
+        with os.fdopen(handle, "wb") as outfile:
+            outfile.write(HEADER.pack(MAGIC, VERSION, sourceSize, sourceMtime, lineCount, len(order), len(table) // 3,
+                                      staleLines.get(os.path.abspath(fileName), 0), len(errorBytes), sourceHash))
+            outfile.write(bytes(padding(HEADER.size)))
+            for block in [table] + columns + [dateIndex]:
+                data = block.tobytes()
+                outfile.write(data)
+                outfile.write(bytes(padding(len(data))))
+            outfile.write(errorBytes)
+        #mkstemp creates the file readable by the owner only, give it the permissions of the patient file
+        os.chmod(tempName, os.stat(fileName).st_mode & 0o666)
+        os.replace(tempName, snapshotName)
+    except BaseException:
+        os.unlink(tempName)
+        raise
+
+
+def readSnapshot(fileName, snapshotName=None):
+    """
+    Reads a snapshot back into a store, if it was made from the current patient file.
+
+    fileName: The name of the patient file.
+    snapshotName: The name of the snapshot file. If None, snapshotNameFor(fileName) is used.
+    return: (store, errors, header) where header is the unpacked HEADER tuple, or None if there is no usable snapshot:
+            it is missing, from another version, or the patient file was changed other than by appending lines.
+    """
+    snapshotName = snapshotName or snapshotNameFor(fileName)
+    try:
+        snapshotFile = open(snapshotName, "rb")
+    except OSError:
+        return None
+    with snapshotFile:
+        if os.fstat(snapshotFile.fileno()).st_size < HEADER.size:
+            return None
+        with mmap.mmap(snapshotFile.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            return readView(view, fileName)
+
+
+def readView(view, fileName):
+    """
+    Reads the contents of a snapshot, used by readSnapshot.
+
+    view: The mmap of the snapshot file.
+    fileName: The name of the patient file.
+    return: The same as readSnapshot.
+    """
+    header = HEADER.unpack_from(view)
+    magic, version, sourceSize, sourceMtime, lineCount, rowCount, patientCount = header[:7]
+    errorsLength, sourceHash = header[8:]
+    if magic != MAGIC or version != VERSION:
+        return None
+    stat = os.stat(fileName)
+    if stat.st_size < sourceSize:
+        return None
+    if (stat.st_size, stat.st_mtime_ns) != (sourceSize, sourceMtime):
+        #the file changed, the snapshot can only be used if every byte it covers is still the same
+        if hashPrefix(fileName, sourceSize) != sourceHash:
+            return None
+
+    layout = [("q", patientCount * 3)] + [(code, rowCount) for code in COLUMN_TYPES] + [("q", rowCount)]
+    size = HEADER.size + padding(HEADER.size) + errorsLength
+    for typecode, count in layout:
+        length = count * array(typecode).itemsize
+        size += length + padding(length)
+    if len(view) != size:          #a snapshot that was cut short is not used
+        return None
+
+    blocks = []
+    position = HEADER.size + padding(HEADER.size)
+    for typecode, count in layout:
+        block = array(typecode)
+        length = count * block.itemsize
+        block.frombytes(view[position:position + length])
+        blocks.append(block)
+        position += length + padding(length)
+    errors = [RejectedLine(*error) for error in json.loads(view[position:position + errorsLength])]
+
+    table = blocks[0]
+    offsets = {}
+    for i in range(0, len(table), 3):
+        start = table[i + 1]
+        offsets[table[i]] = array("q", range(start, start + table[i + 2]))
+    patients = VisitStore.fromColumns(*blocks[1:9], offsets, blocks[9])
+    return patients, errors, header
+
+########################################################################################################
+
+
+def loadPatientsWithSnapshot(fileName, workers=None, snapshotName=None):
+    """
+    Reads patient data from a plaintext file, using its snapshot when possible, and writes a new snapshot if the
+    text had to be parsed.
+
+    fileName: The name of the file to read patient data from.
+    workers: The number of processes to parse with. None uses every CPU, 1 parses in the calling process.
+    snapshotName: The name of the snapshot file. If None, snapshotNameFor(fileName) is used.
+    return: (store, errors) like loader.loadPatients. Raises OSError if the patient file cannot be opened.
+    """
+    stat = os.stat(fileName)
+    key = os.path.abspath(fileName)
+    with profiling.timed("snapshotRead"):
+        snapshot = readSnapshot(fileName, snapshotName)
+    if snapshot is None:
+        result = loadRange(fileName, 0, stat.st_size, workers)
+        staleLines[key] = result.staleLines
+        patients, errors, lineCount = result.patients, result.errors, result.lineCount
+    else:
+        patients, errors, header = snapshot
+        sourceSize, sourceMtime, lineCount = header[2:5]
+        staleLines[key] = header[7]
+        if (stat.st_size, stat.st_mtime_ns) == (sourceSize, sourceMtime):
+            return patients, errors
+        #only the lines appended since the snapshot are parsed. appendLines puts the line break that ends the last
+        #line covered by the snapshot in front of the new lines, so it is skipped here
+        start = sourceSize
+        with open(fileName, "rb") as infile:
+            infile.seek(start)
+            if infile.read(1) == b"\n":
+                start += 1
+        result = loadRange(fileName, start, stat.st_size, workers, patients, lineCount + 1)
+        staleLines[key] += result.staleLines
+        errors = errors + result.errors
+        lineCount += result.lineCount
+    with profiling.timed("snapshotWrite"):
+        try:
+            writeSnapshot(patients, errors, fileName, stat.st_size, stat.st_mtime_ns, lineCount, snapshotName)
+        #the snapshot only saves time on the next load, the patients are loaded either way
+        except OSError:
+            pass
+    return patients, errors
@@ -0,0 +1,7 @@
+# Desc: Lets the tests import the modules of the Health Information System folder, which is not a package.
+
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,73 @@
+# Desc: Adding visits in batches: what is accepted and rejected, what is written to the file, and values the store
+#       can't keep as given.
+# Usage: python -m pytest tests
+
+
+import io
+
+import pytest
+
+from loader import loadPatients
+from main import BULK_BATCH, addPatientData, addVisits
+from visitstore import VisitStore
+
+
+def test_batch_matches_reload(tmp_path):
+    fileName = str(tmp_path / "patients.txt")
+    patients = VisitStore()
+    visits = [(number % 9 + 1, f"2023-{number % 12 + 1:02d}-{number % 28 + 1:02d}", 36.0 + number % 40 / 10,
+               60 + number % 50, 16, 120, 80, 97) for number in range(BULK_BATCH * 2)]
+    visits[5] = (1, "2023-02-30", 37.0, 72, 16, 120, 80, 97)
+    visits[70] = (1, "2023-01-01", 43.0, 72, 16, 120, 80, 97)
+    result = addVisits(patients, visits, fileName)
+    assert result.accepted == len(visits) - 2 and [index for index, _ in result.rejected] == [5, 70]
+    assert result.rejected[1][1].startswith("Invalid temperature")
+    addPatientData(patients, 3, "2023-05-05", 37.0, 72, 16, 120, 80, 97, fileName)
+    reloaded, errors = loadPatients(fileName, workers=1)
+    assert errors == [] and reloaded.asDict() == patients.asDict() and list(reloaded) == list(patients)
+
+
+def test_stream_lines(tmp_path):
+    fileName = str(tmp_path / "patients.txt")
+    patients = VisitStore()
+    stream = io.StringIO("1,2023-01-01,37.0,72,16,120,80,97\nabc\n2,2023-01-02,37.0,72,16,120,80,300\n"
+                         "3,2023-01-03,36.5,72,16,120,80,97\n")
+    result = addVisits(patients, stream, fileName)
+    assert result.accepted == 2 and [index for index, _ in result.rejected] == [1, 2]
+    assert open(fileName).read().split("\n") == ["1,2023-01-01,37.0,72,16,120,80,97",
+                                                "3,2023-01-03,36.5,72,16,120,80,97"]
+
+
+def test_non_integral_vitals_are_rejected(tmp_path):
+    fileName = str(tmp_path / "patients.txt")
+    patients = VisitStore()
+    result = addVisits(patients, [(9, "2023-01-01", 37.0, 72.0, 16, 120, 80, 97),
+                                  (9, "2023-01-01", 37.0, 72.5, 16, 120, 80, 97),
+                                  (9, "2023-01-01", 37, 72, 16, 120, 80, 97)], fileName)
+    assert result.accepted == 1
+    assert [index for index, message in result.rejected] == [0, 1]
+    assert len(patients.patientIds) == len(patients.hrs) == len(patients.spo2s) == 1
+
+
+def test_add_visit_changes_nothing_when_it_raises():
+    patients = VisitStore()
+    with pytest.raises(TypeError):
+        patients.addVisit(9, 19000, 37.0, 72.5, 16, 120, 80, 97)
+    assert len(patients.patientIds) == len(patients.dates) == len(patients.hrs) == len(patients.alive) == 0
+    assert 9 not in patients
+
+
+def test_added_visits_are_written_as_the_store_holds_them(tmp_path):
+    fileName = str(tmp_path / "patients.txt")
+    patients = VisitStore()
+    result = addVisits(patients, [(9, "\n2023-01-01", 37, 72, 16, 120, 80, 97),
+                                  (True, "2023-01-02", 37.0, 72, 16, 120, 80, 97),
+                                  None,
+                                  (10, " 2023-01-03 ", 36.5, 72, 16, 120, 80, 97),
+                                  (11, 20230104, 36.5, 72, 16, 120, 80, 97)], fileName)
+    assert result.accepted == 2
+    assert [index for index, message in result.rejected] == [1, 2, 4]
+    reloaded, errors = loadPatients(fileName, workers=1)
+    assert errors == []
+    assert reloaded.asDict() == patients.asDict() == {9: [["2023-01-01", 37.0, 72, 16, 120, 80, 97]],
+                                                      10: [["2023-01-03", 36.5, 72, 16, 120, 80, 97]]}
@@ -0,0 +1,41 @@
+# Desc: The synthetic data generator and the benchmark runner on a small file.
+# Usage: python -m pytest tests
+
+
+import sys
+
+from benchmark import OPERATIONS, compareResults, measure, runBenchmarks, runChild
+from datagen import generatePatientsFile
+from loader import loadPatients
+
+
+def test_generated_file_is_repeatable(tmp_path):
+    first, second = str(tmp_path / "first.txt"), str(tmp_path / "second.txt")
+    assert generatePatientsFile(first, patients=50, visitsPerPatient=4, errorRate=0.1, seed=7) == 200
+    generatePatientsFile(second, patients=50, visitsPerPatient=4, errorRate=0.1, seed=7)
+    assert open(first).read() == open(second).read()
+    patients, errors = loadPatients(first, workers=1)
+    assert patients.numVisits() + len(errors) == 200 and 0 < len(errors) < 60
+    assert set(patients) <= set(range(1, 51))
+
+
+def test_benchmarks_leave_the_file_alone(tmp_path):
+    fileName = str(tmp_path / "patients.txt")
+    generatePatientsFile(fileName, patients=200, visitsPerPatient=3, seed=1)
+    text = open(fileName).read()
+    report = runBenchmarks(fileName, repeat=1, workers=1)
+    assert open(fileName).read() == text
+    assert report["meta"]["visits"] == 600 and set(report["results"]) == set(OPERATIONS)
+    for result in report["results"].values():
+        assert result["best"] <= result["mean"] and result["peakBytes"] > 0 and result["items"] > 0
+    slower = {"results": {name: dict(result, best=result["best"] * 2 + 0.01)
+                          for name, result in report["results"].items()}}
+    assert all(row[4] for row in compareResults(report, slower))
+    assert not any(row[4] for row in compareResults(report, report))
+
+
+def test_child_peak_memory_is_the_childs():
+    peak = runChild([sys.executable, "-c", "data = bytearray(64 * 1024 * 1024)"])
+    assert peak is None or peak > 64 * 1024 * 1024
+    result = measure(lambda: runChild([sys.executable, "-c", "pass"]), 1, child=True)
+    assert result["peakBytes"] is None or result["peakBytes"] < peak
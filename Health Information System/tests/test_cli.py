@@ -0,0 +1,54 @@
+# Desc: The command line tool: each subcommand against the menu functions, batches of queries, and queries with
+#       dates that are not valid.
+# Usage: python -m pytest tests
+
+
+from cli import run
+from loader import loadPatients
+
+VISITS = "1,2022-01-01,36.6,65,16,120,80,97\n2,2022-01-02,37.0,70,14,110,70,98\n"
+
+
+def writeFile(tmp_path):
+    fileName = tmp_path / "patients.txt"
+    fileName.write_text(VISITS)
+    return str(fileName)
+
+
+def test_add_without_loading_then_query(tmp_path, capsys):
+    fileName = writeFile(tmp_path)
+    assert run(["--file", fileName, "add", "3", "2022-01-03", "37", "120", "16", "120", "80", "97"]) == 0
+    assert run(["--file", fileName, "add", "3", "2022-01-03", "37", "120", "16", "120", "80", "101"]) == 1
+    capsys.readouterr()
+    assert run(["--file", fileName, "followup"]) == 0
+    assert capsys.readouterr().out == "Patients who need follow-up visits:\n3\n"
+    assert run(["--file", fileName, "show", "--format", "csv"]) == 0
+    assert capsys.readouterr().out == VISITS + "3,2022-01-03,37.0,120,16,120,80,97\n"
+    assert run(["--file", fileName, "delete", "1"]) == 0 and run(["--file", fileName, "delete", "1"]) == 1
+    patients, _ = loadPatients(fileName, workers=1)
+    assert list(patients) == [2, 3]
+
+
+def test_batch_sees_its_own_writes(tmp_path, capsys):
+    fileName = writeFile(tmp_path)
+    queries = tmp_path / "queries.txt"
+    queries.write_text("# a comment\nstats --patient 4\n\nadd 4 2022-02-01 37.5 80 16 120 80 97\n"
+                       "stats --patient 4\nvisits --year 2022 --month 2 --format csv\n")
+    assert run(["--file", fileName, "batch", str(queries)]) == 0
+    output = capsys.readouterr().out
+    assert output.startswith("No data found for patient with ID 4.\n")
+    assert "Average Temperature: 37.50 C" in output and output.endswith("4,2022-02-01,37.5,80,16,120,80,97\n")
+
+
+def test_invalid_dates(tmp_path, capsys):
+    fileName = writeFile(tmp_path)
+    assert run(["--file", fileName, "--no-snapshot", "visits", "--start", "2023-13-01"]) == 1
+    assert run(["--file", fileName, "--no-snapshot", "visits", "--start", "foo"]) == 1
+
+
+def test_batch_continues_after_a_failing_query(tmp_path, capsys):
+    fileName = writeFile(tmp_path)
+    queries = tmp_path / "queries.txt"
+    queries.write_text("visits --start foo\nstats --patient 2\n")
+    assert run(["--file", fileName, "--no-snapshot", "batch", str(queries)]) == 1
+    assert "Vital Signs for Patient 2:" in capsys.readouterr().out
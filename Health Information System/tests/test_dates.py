@@ -0,0 +1,60 @@
+# Desc: Date queries answered from the sorted date index, compared with a scan over every visit.
+# Usage: python -m pytest tests
+
+
+import datetime
+import random
+from array import array
+
+from main import findVisitsByDate
+from visitstore import VisitStore, dateToDays
+
+
+def makeStore(count=500, seed=3):
+    random.seed(seed)
+    patients = VisitStore()
+    columns = [[random.randrange(1, 40) for _ in range(count)],
+               [dateToDays(f"{random.randrange(2019, 2024)}-{random.randrange(1, 13):02d}-"
+                           f"{random.randrange(1, 29):02d}") for _ in range(count)]]
+    columns += [[36.5] * count] + [[random.randrange(60, 100) for _ in range(count)] for _ in range(5)]
+    store = (patients.patientIds, patients.dates) + patients.columns()
+    patients.extend(*(array(column.typecode, values) for column, values in zip(store, columns)))
+    return patients
+
+
+def scan(patients, test):
+    return sorted((patientId, visit) for patientId, visits in patients.asDict().items() for visit in visits
+                  if test(datetime.date.fromisoformat(visit[0])))
+
+
+def check(patients):
+    queries = [({"year": 2021}, lambda day: day.year == 2021),
+               ({"year": 2022, "month": 2}, lambda day: (day.year, day.month) == (2022, 2)),
+               ({"start": "2020-03-05", "end": "2021-07-01"},
+                lambda day: datetime.date(2020, 3, 5) <= day <= datetime.date(2021, 7, 1)),
+               ({"year": 2020, "start": datetime.date(2020, 6, 1)}, lambda day: day >= datetime.date(2020, 6, 1)
+                and day.year == 2020),
+               ({"month": 3}, lambda day: False), ({"year": 9999}, lambda day: False),
+               ({}, lambda day: True)]
+    for filters, test in queries:
+        found = list(findVisitsByDate(patients, **filters))
+        assert sorted(found) == scan(patients, test), filters
+        assert [visit[0] for _, visit in found] == sorted(visit[0] for _, visit in found)
+
+
+def test_bulk_load_matches_scan():
+    check(makeStore())
+
+
+def test_index_follows_inserts_deletes_and_compact():
+    patients = makeStore()
+    check(patients)
+    for patientId in range(1, 40, 3):
+        patients.deletePatient(patientId)
+    patients.addVisit(1, dateToDays("2021-05-05"), 37.0, 70, 16, 120, 80, 97)
+    patients.addVisit(2, dateToDays("2020-01-01"), 37.0, 70, 16, 120, 80, 97)
+    check(patients)
+    patients.compact()
+    check(patients)
+    visit = ["2022-01-02", 37.0, 70, 16, 120, 80, 97]
+    assert list(findVisitsByDate({1: [visit]}, year=2022)) == [(1, visit)]
@@ -0,0 +1,90 @@
+# Desc: Deletes recorded as tombstone lines, replayed on load and dropped by compaction, and deleted visits staying out
+#       of date queries while their rows are still in the index.
+# Usage: python -m pytest tests
+
+
+import os
+
+import loader
+import visitlog
+from main import addPatientData, deleteAllVisitsOfPatient, findVisitsByDate, readPatientsFromFile
+from visitlog import compactFile, maybeCompact
+from visitstore import VisitStore, toDays
+
+LINES = ["1,2022-01-05,37.0,72,16,120,80,97", "2,2022-01-06,37.1,73,17,121,81,96",
+         "1,2022-02-01,37.2,74,18,122,82,95", "3,2022-02-02,37.3,75,19,123,83,94"]
+
+
+def writeFile(tmp_path, lines=LINES):
+    fileName = tmp_path / "patients.txt"
+    fileName.write_text("\n".join(lines))
+    return str(fileName)
+
+
+def makeStore():
+    patients = VisitStore()
+    for patientId, date in [(1, "2022-01-05"), (2, "2022-01-06"), (1, "2022-02-01"), (3, "2022-02-02")]:
+        patients.addVisit(patientId, toDays(date), 37.0, 72, 16, 120, 80, 97)
+    return patients
+
+
+def test_tombstones_replay_on_load(tmp_path, capsys):
+    fileName = writeFile(tmp_path)
+    patients = readPatientsFromFile(fileName)
+    deleteAllVisitsOfPatient(patients, 1, fileName)
+    addPatientData(patients, 1, "2022-03-01", 36.5, 60, 12, 110, 70, 99, fileName)
+    deleteAllVisitsOfPatient(patients, 3, fileName)
+    lines = open(fileName).read().split("\n")
+    assert lines[4:] == ["DELETE,1", "1,2022-03-01,36.5,60,12,110,70,99", "DELETE,3"]
+    reloaded = readPatientsFromFile(fileName)
+    assert reloaded.asDict() == patients.asDict() == {2: [["2022-01-06", 37.1, 73, 17, 121, 81, 96]],
+                                                      1: [["2022-03-01", 36.5, 60, 12, 110, 70, 99]]}
+    assert list(reloaded) == list(patients) == [2, 1]
+
+
+def test_tombstones_apply_across_chunks(tmp_path, monkeypatch):
+    lines = [f"{number % 7 + 1},2022-01-{number % 28 + 1:02d},37.0,{60 + number % 50},16,120,80,97"
+             for number in range(300)]
+    for position in (40, 150, 299):
+        lines.insert(position, f"DELETE,{position % 7 + 1}")
+    fileName = writeFile(tmp_path, lines)
+    patients, errors = loader.loadPatients(fileName, workers=1)
+    monkeypatch.setattr(loader, "PARALLEL_THRESHOLD", 0)
+    pooled, pooledErrors = loader.loadPatients(fileName, workers=4)
+    assert not errors and not pooledErrors
+    assert pooled.asDict() == patients.asDict() and list(pooled) == list(patients)
+    assert patients.numVisits() < 300
+
+
+def test_compaction_drops_tombstones(tmp_path, monkeypatch, capsys):
+    fileName = writeFile(tmp_path)
+    os.chmod(fileName, 0o640)
+    patients = readPatientsFromFile(fileName)
+    monkeypatch.setattr(visitlog, "COMPACT_MIN_LINES", 100)
+    deleteAllVisitsOfPatient(patients, 2, fileName)
+    assert maybeCompact(patients, fileName, background=False) is None and "DELETE,2" in open(fileName).read()
+    monkeypatch.setattr(visitlog, "COMPACT_MIN_LINES", 2)
+    maybeCompact(patients, fileName, background=False)
+    assert open(fileName).read().split("\n") == [LINES[0], LINES[2], LINES[3]]
+    assert os.stat(fileName).st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ["patients.txt"]
+    deleteAllVisitsOfPatient(patients, 3, fileName)
+    compactFile(patients, fileName)
+    assert readPatientsFromFile(fileName).asDict() == patients.asDict()
+
+
+def test_deleted_patient_is_not_found_by_date():
+    patients = makeStore()
+    patients.deletePatient(2)
+    assert [patientId for patientId, _ in findVisitsByDate(patients, year=2022)] == [1, 1, 3]
+    assert [patientId for patientId, _ in findVisitsByDate(patients, year=2022, month=1)] == [1]
+
+
+def test_dead_rows_are_dropped_from_the_index():
+    patients = makeStore()
+    patients.deletePatient(1)
+    patients.deletePatient(3)
+    assert len(patients.sortedDateIndex()) == 1
+    patients.addVisit(4, toDays("2022-01-01"), 37.0, 72, 16, 120, 80, 97)
+    assert [patientId for patientId, _ in findVisitsByDate(patients)] == [4, 2]
+    assert len(patients.liveDateIndex()) == 2
@@ -0,0 +1,68 @@
+# Desc: Patients flagged for a follow-up as visits are added and deleted, compared with a scan over every visit.
+# Usage: python -m pytest tests
+
+
+import random
+from array import array
+
+from main import findPatientsWhoNeedFollowUp
+from snapshot import loadPatientsWithSnapshot
+from visitstore import FollowUpRules, VisitStore
+
+
+def scan(patients, rules=FollowUpRules()):
+    #the order of the old loop over the patients dictionary
+    return [patientId for patientId, visits in patients.asDict().items()
+            if any(visit[2] > rules.hrHigh or visit[2] < rules.hrLow or visit[4] > rules.sbpHigh
+                   or visit[5] > rules.dbpHigh or visit[6] < rules.spo2Low for visit in visits)]
+
+
+def makeStore(seed=5):
+    random.seed(seed)
+    patients = VisitStore()
+    columns = [[random.randrange(1, 80) for _ in range(400)], [random.randrange(18000, 19000) for _ in range(400)],
+               [36.6] * 400, [random.randrange(55, 106) for _ in range(400)], [16] * 400,
+               [random.randrange(100, 146) for _ in range(400)], [random.randrange(60, 93) for _ in range(400)],
+               [random.randrange(88, 101) for _ in range(400)]]
+    store = (patients.patientIds, patients.dates) + patients.columns()
+    patients.extend(*(array(column.typecode, values) for column, values in zip(store, columns)))
+    for _ in range(50):
+        patients.addVisit(random.randrange(1, 100), 19000, 36.6, random.randrange(55, 106), 16, 120, 80, 97)
+    return patients
+
+
+def test_flags_follow_inserts_and_deletes():
+    patients = makeStore()
+    assert findPatientsWhoNeedFollowUp(patients) == scan(patients)
+    for patientId in range(1, 100, 4):
+        patients.deletePatient(patientId)
+    for patientId in range(2, 100, 5):
+        if patientId in patients:
+            patients.deleteFirstVisits(patientId, 2)
+    patients.addVisit(1, 19000, 36.6, 120, 16, 120, 80, 97)
+    assert findPatientsWhoNeedFollowUp(patients) == scan(patients)
+    patients.compact()
+    assert findPatientsWhoNeedFollowUp(patients) == scan(patients)
+
+
+def test_new_rules_flag_again():
+    patients = makeStore()
+    patients.deletePatient(3)
+    rules = FollowUpRules(hrHigh=104, hrLow=56, sbpHigh=144, dbpHigh=91, spo2Low=89)
+    patients.setFollowUpRules(rules)
+    assert findPatientsWhoNeedFollowUp(patients) == scan(patients, rules)
+    patients.deleteFirstVisits(5, 1)
+    patients.addVisit(200, 19000, 36.6, 103, 16, 120, 80, 97)
+    assert findPatientsWhoNeedFollowUp(patients) == scan(patients, rules)
+    assert findPatientsWhoNeedFollowUp({1: [["2022-01-01", 36.6, 50, 16, 120, 80, 97]],
+                                        2: [["2022-01-01", 36.6, 70, 16, 120, 80, 97]]}) == [1]
+
+
+def test_snapshot_keeps_flags(tmp_path):
+    fileName = str(tmp_path / "patients.txt")
+    with open(fileName, "w") as outfile:
+        outfile.write("1,2022-01-01,36.6,65,16,120,80,97\n2,2022-01-02,37.0,110,14,110,70,98\n"
+                      "3,2022-01-03,37.0,70,14,150,70,98\nDELETE,3\n3,2022-01-04,37.0,70,14,110,70,98\n")
+    loadPatientsWithSnapshot(fileName, workers=1)
+    patients, _ = loadPatientsWithSnapshot(fileName, workers=1)
+    assert findPatientsWhoNeedFollowUp(patients) == scan(patients) == [2]
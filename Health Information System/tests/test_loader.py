@@ -0,0 +1,91 @@
+# Desc: Loading a patient file in byte ranges, in one process and across a process pool, and loading files that hold
+#       no visit lines: an empty file, a file touched after its snapshot was made, and a file whose only lines since
+#       its snapshot are a tombstone.
+# Usage: python -m pytest tests
+
+
+import os
+import random
+
+import loader
+from loader import loadPatients, splitFile
+from main import deletePatientVisits
+from snapshot import loadPatientsWithSnapshot
+
+VISITS = "1,2022-01-01,36.6,80,16,120,80,97\n2,2022-01-02,37.0,70,14,110,70,98\n"
+
+
+def writeFile(tmp_path, count=400, seed=2):
+    random.seed(seed)
+    lines = []
+    for _ in range(count):
+        line = (f"{random.randrange(1, 60)},2022-{random.randrange(1, 13):02d}-{random.randrange(1, 29):02d},"
+                f"{random.randrange(350, 421) / 10},{random.randrange(30, 181)},{random.randrange(5, 41)},"
+                f"{random.randrange(70, 201)},{random.randrange(40, 121)},{random.randrange(70, 101)}")
+        kind = random.randrange(20)
+        if kind == 0:
+            line = line.replace(",", ",x,", 1)
+        elif kind == 1:
+            line = line.rsplit(",", 1)[0] + ",abc"
+        elif kind == 2:
+            line = line.split(",", 1)[0] + ",2022-02-30," + line.split(",", 2)[2]
+        lines.append(line)
+    fileName = tmp_path / "patients.txt"
+    fileName.write_text("\n".join(lines) + "\n")
+    return str(fileName), lines
+
+
+def test_ranges_start_on_lines(tmp_path):
+    fileName, lines = writeFile(tmp_path)
+    data = open(fileName, "rb").read()
+    ranges = splitFile(fileName, 7)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data) and len(ranges) == 7
+    for (start, end), (nextStart, _) in zip(ranges, ranges[1:]):
+        assert end == nextStart and data[start - 1:start] in (b"", b"\n")
+
+
+def test_pool_matches_one_process(tmp_path, monkeypatch):
+    fileName, lines = writeFile(tmp_path)
+    patients, errors = loadPatients(fileName, workers=1)
+    monkeypatch.setattr(loader, "PARALLEL_THRESHOLD", 0)
+    pooled, pooledErrors = loadPatients(fileName, workers=3)
+    assert pooled.asDict() == patients.asDict() and list(pooled) == list(patients)
+    assert pooledErrors == errors
+    assert patients.numVisits() + len(errors) == len(lines)
+    assert [error.lineNumber for error in errors] == sorted(error.lineNumber for error in errors)
+    for error in errors:
+        assert lines[error.lineNumber - 1] in error.message or error.reason == "fields"
+    assert {error.reason for error in errors} == {"fields", "type", "date"}
+
+
+
+def test_empty_file(tmp_path):
+    fileName = tmp_path / "patients.txt"
+    fileName.write_text("")
+    patients, errors = loadPatients(str(fileName), workers=1)
+    assert patients.numVisits() == 0 and errors == []
+    patients, errors = loadPatientsWithSnapshot(str(fileName), workers=1)
+    assert patients.numVisits() == 0 and errors == []
+
+
+def test_touched_file(tmp_path):
+    fileName = str(tmp_path / "patients.txt")
+    with open(fileName, "w") as outfile:
+        outfile.write(VISITS)
+    loadPatientsWithSnapshot(fileName, workers=1)
+    stat = os.stat(fileName)
+    os.utime(fileName, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    patients, errors = loadPatientsWithSnapshot(fileName, workers=1)
+    assert patients.asDict() == loadPatients(fileName, workers=1)[0].asDict()
+    assert errors == []
+
+
+def test_delete_then_restart(tmp_path):
+    fileName = str(tmp_path / "patients.txt")
+    with open(fileName, "w") as outfile:
+        outfile.write(VISITS)
+    patients, _ = loadPatientsWithSnapshot(fileName, workers=1)
+    assert deletePatientVisits(patients, 1, fileName) == 1
+    reloaded, errors = loadPatientsWithSnapshot(fileName, workers=1)
+    assert 1 not in reloaded and 2 in reloaded
+    assert errors == []
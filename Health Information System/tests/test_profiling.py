@@ -0,0 +1,63 @@
+# Desc: The opt-in stage timers and counters: what a load and the queries record, and that nothing is recorded
+#       while they are disabled.
+# Usage: python -m pytest tests
+
+
+import io
+
+import pytest
+
+import loader
+import profiling
+from main import displayPatientData, findPatientsWhoNeedFollowUp, getStats
+
+LINES = ["1,2022-01-05,37.0,72,16,120,80,97", "2,2022-01-06,37.1,130,17,121,81,96", "x,2022-01-06,37.1,73,17,121,81,96",
+         "DELETE,1", "3,2022-02-30,37.3,75,19,123,83,94", "4,2022-02-02,37.3,75", "1,2022-02-02,37.3,75,19,123,83,94"]
+
+
+@pytest.fixture
+def profiled():
+    profiling.reset()
+    profiling.enable()
+    yield
+    profiling.disable()
+    profiling.reset()
+
+
+def writeFile(tmp_path, copies=1):
+    fileName = tmp_path / "patients.txt"
+    fileName.write_text("\n".join(LINES * copies))
+    return str(fileName)
+
+
+def test_load_counters_match_the_load(tmp_path, profiled):
+    fileName = writeFile(tmp_path)
+    patients, errors = loader.loadPatients(fileName, workers=1)
+    counters = profiling.counters
+    assert counters["linesRead"] == len(LINES) and counters["bytesRead"] == len("\n".join(LINES))
+    assert counters["rowsRejected"] == len(errors) == 3 and counters["tombstones"] == 1
+    assert {name[9:]: value for name, value in counters.items() if name.startswith("rejected.")} == \
+        loader.rejectCounts(errors)
+    assert {"read", "parse", "insert", "tombstones"} <= set(profiling.report()["timers"])
+    getStats(patients)
+    findPatientsWhoNeedFollowUp(patients)
+    displayPatientData(patients, out=io.StringIO())
+    assert {"stats", "followup", "format"} <= set(profiling.report()["timers"])
+    assert profiling.formatReport().startswith("stage")
+
+
+def test_pool_workers_report_to_the_parent(tmp_path, monkeypatch, profiled):
+    fileName = writeFile(tmp_path, 50)
+    monkeypatch.setattr(loader, "PARALLEL_THRESHOLD", 0)
+    patients, errors = loader.loadPatients(fileName, workers=3)
+    assert profiling.counters["linesRead"] == len(LINES) * 50
+    assert profiling.counters["rowsRejected"] == len(errors)
+    assert profiling.timers["parse"][1] > 1
+
+
+def test_nothing_is_recorded_while_disabled(tmp_path):
+    profiling.reset()
+    patients, errors = loader.loadPatients(writeFile(tmp_path), workers=1)
+    getStats(patients)
+    assert profiling.timed("scan") is profiling.DISABLED
+    assert profiling.report() == {"timers": {}, "counters": {}}
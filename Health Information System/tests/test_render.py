@@ -0,0 +1,68 @@
+# Desc: Visit listings written in batches, compared with the line-by-line output the menu used to print.
+# Usage: python -m pytest tests
+
+
+import io
+import json
+
+from loader import loadPatients
+from main import displayPatientData, findVisitRowsByDate
+from render import renderChunks, writeVisits
+from visitstore import VisitStore, toDays
+
+VISITS = [(1, "2022-01-05", 37.0, 72, 16, 120, 80, 97), (2, "2021-03-06", 36.55, 73, 17, 121, 81, 96),
+          (1, "2022-02-01", 38.125, 74, 18, 122, 82, 95), (3, "2020-02-02", 37.3, 75, 19, 123, 83, 94)]
+
+
+def makeStore():
+    patients = VisitStore()
+    for patientId, date, *vitals in VISITS:
+        patients.addVisit(patientId, toDays(date), *vitals)
+    return patients
+
+
+def printed(patients, patientIds):
+    #the layout the menu printed one line at a time
+    lines = []
+    for patientId in patientIds:
+        lines.append(f"Patient ID: {patientId}")
+        for visit in patients[patientId]:
+            lines += [f" Visit Date: {visit[0]}", f"  Temperature: {visit[1]:.2f} C", f"  Heart Rate: {visit[2]} bpm",
+                      f"  Respiratory Rate: {visit[3]} bpm", f"  Systolic Blood Pressure: {visit[4]} mmHg",
+                      f"  Diastolic Blood Pressure: {visit[5]} mmHg", f"  Oxygen Saturation: {visit[6]} %"]
+    return "".join(line + "\n" for line in lines)
+
+
+def test_text_matches_the_old_listing(capsys):
+    patients = makeStore()
+    displayPatientData(patients)
+    assert capsys.readouterr().out == printed(patients, [1, 2, 3])
+    displayPatientData(patients, 1)
+    assert capsys.readouterr().out == printed(patients, [1])
+    displayPatientData(patients, 9)
+    assert capsys.readouterr().out == "Patient with ID 9 not found.\n"
+
+
+def test_pages_and_batches_add_up():
+    patients = makeStore()
+    rows = list(range(4))
+    whole = "".join(renderChunks(patients, rows, "csv"))
+    assert "".join(renderChunks(patients, rows, "csv", batchSize=1)) == whole
+    pages = "".join("".join(renderChunks(patients, rows, "csv", pageSize=3, offset=offset)) for offset in (0, 3))
+    assert pages == whole
+    page = "".join(renderChunks(patients, iter(rows), "csv", pageSize=2, offset=1))
+    assert page == "".join(whole.splitlines(True)[1:3])
+
+
+def test_csv_and_jsonl_keep_the_values(tmp_path):
+    patients = makeStore()
+    fileName = tmp_path / "patients.txt"
+    fileName.write_text("".join(renderChunks(patients, patients.rows(), "csv")))
+    reloaded, errors = loadPatients(str(fileName), workers=1)
+    assert errors == [] and reloaded.asDict() == patients.asDict()
+    out = io.StringIO()
+    assert writeVisits(patients, findVisitRowsByDate(patients, year=2022), out, "jsonl")
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(record["patientId"], record["date"], record["temp"]) for record in records] == \
+        [(1, "2022-01-05", 37.0), (1, "2022-02-01", 38.125)]
+    assert not writeVisits(patients, [], out)
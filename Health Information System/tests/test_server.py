@@ -0,0 +1,101 @@
+# Desc: The patient server: a round trip of adds and deletes over a connection, writes of several clients applied
+#       together, and the reader/writer lock.
+# Usage: python -m pytest tests
+
+
+import asyncio
+import json
+
+import pytest
+
+from loader import loadPatients
+from main import getStats
+from server import PatientServer, ReadWriteLock
+from visitstore import VisitStore
+
+VISITS = "1,2022-01-01,36.6,80,16,120,80,97\n2,2022-01-02,37.0,70,14,110,70,98\n"
+
+
+async def ask(reader, writer, request):
+    writer.write(json.dumps(request).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+def test_round_trip_matches_a_reload(tmp_path):
+    fileName = str(tmp_path / "patients.txt")
+    with open(fileName, "w") as outfile:
+        outfile.write(VISITS)
+    patients, _ = loadPatients(fileName, workers=1)
+
+    async def session():
+        service = PatientServer(patients, fileName)
+        server = await service.start(port=0)
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        added = [[3, "2022-02-01", 36.8, 75, 15, 118, 78, 99], [3, "2022-13-01", 36.8, 75, 15, 118, 78, 99]]
+        responses = [await ask(reader, writer, {"op": "add", "visits": added}),
+                     await ask(reader, writer, {"op": "delete", "patientId": 1}),
+                     await ask(reader, writer, {"op": "delete", "patientId": 1}),
+                     await ask(reader, writer, {"op": "add", "visit": [1, "2022-03-01", 37.2, 90, 18, 130, 85, 96]}),
+                     await ask(reader, writer, {"op": "stats", "patientId": 3}),
+                     await ask(reader, writer, {"op": "stats", "patientId": 0}),
+                     await ask(reader, writer, {"op": "quit"})]
+        writer.close()
+        await service.close()
+        return responses
+
+    added, deleted, missing, readded, stats, allStats, goodbye = asyncio.run(session())
+    assert added["result"]["accepted"] == 1 and [index for index, message in added["result"]["rejected"]] == [1]
+    assert deleted["result"] == {"deleted": 1}
+    assert not missing["ok"]
+    assert readded["result"] == {"accepted": 1, "rejected": []}
+    assert stats["ok"] and goodbye["result"] == {"goodbye": True}
+    reloaded, errors = loadPatients(fileName, workers=1)
+    assert errors == []
+    assert reloaded.asDict() == patients.asDict()
+    assert list(reloaded) == list(patients)
+    for name, expected in getStats(reloaded).items():
+        assert allStats["result"][name] == pytest.approx(expected)
+    assert allStats["result"]["count"] == 3 and allStats["result"]["sbp"]["min"] == 110
+    assert allStats["result"]["sbp"]["max"] == 130 and allStats["result"]["temp"]["max"] == 37.2
+
+
+def test_a_bad_request_only_fails_itself(tmp_path):
+    fileName = str(tmp_path / "patients.txt")
+    service = PatientServer(VisitStore(), fileName)
+    jobs = [("add", [[1, "2022-01-01", 36.6, 80, 16, 120, 80, 97]], None),
+            ("add", [[2, 20220101, 36.6, 80, 16, 120, 80, 97], None], None),
+            ("add", 5, None),
+            ("add", [[3, "2022-01-03", 36.6, 80, 16, 120, 80, 97]], None)]
+    first, second, third, fourth = service.applyWrites(jobs)
+    assert first == fourth == {"accepted": 1, "rejected": []}
+    assert second["accepted"] == 0 and [index for index, message in second["rejected"]] == [0, 1]
+    assert isinstance(third, Exception)
+    assert list(service.patients) == [1, 3]
+
+
+def test_waiting_writer_holds_back_new_readers():
+    events = []
+
+    async def run():
+        lock = ReadWriteLock()
+
+        async def read(name, delay):
+            async with lock.reading():
+                events.append(f"{name} in")
+                await asyncio.sleep(delay)
+                events.append(f"{name} out")
+
+        async def write():
+            async with lock.writer():
+                events.append("writer")
+
+        first = asyncio.create_task(read("first", 0.05))
+        await asyncio.sleep(0.01)
+        writer = asyncio.create_task(write())
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(read("second", 0))
+        await asyncio.gather(first, writer, second)
+
+    asyncio.run(run())
+    assert events == ["first in", "first out", "writer", "second in", "second out"]
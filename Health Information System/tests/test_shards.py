@@ -0,0 +1,73 @@
+# Desc: A patient file migrated to shards gives the same statistics, follow-up patients and date search as the file.
+# Usage: python -m pytest tests
+
+
+import random
+
+import pytest
+
+from loader import loadPatients
+from main import findPatientsWhoNeedFollowUp, findVisitsByDate, getStats
+from shards import ShardedStore, migrate
+from visitlog import TOMBSTONE
+from visitstore import VITALS
+
+
+def writeFile(fileName, count=300, seed=11):
+    random.seed(seed)
+    lines = []
+    for _ in range(count):
+        lines.append(f"{random.randrange(1, 40)},{random.randrange(2020, 2024)}-{random.randrange(1, 13):02d}-"
+                     f"{random.randrange(1, 29):02d},{random.choice([36.6, 37.1, 38.4])},{random.randrange(50, 130)},"
+                     f"{random.randrange(10, 25)},{random.randrange(90, 150)},{random.randrange(55, 95)},"
+                     f"{random.randrange(88, 100)}")
+        if random.random() < 0.03:
+            lines.append(f"{TOMBSTONE},{random.randrange(1, 40)}")
+    lines.append("not a visit")
+    with open(fileName, "w") as outfile:
+        outfile.write("\n".join(lines) + "\n")
+
+
+def check(store, patients):
+    for patientId in (0, 1, 17, 39, 1000):
+        expected = getStats(patients, patientId)
+        found = store.stats(patientId)
+        if expected is None:
+            assert found is None
+            continue
+        for name in VITALS:
+            assert found[name] == pytest.approx(expected[name]), (patientId, name)
+    assert sorted(store.flaggedPatients()) == sorted(findPatientsWhoNeedFollowUp(patients))
+    for filters in ({"year": 2022}, {"start": "2021-02-01", "end": "2021-06-30"}, {}):
+        found = list(store.findVisitsByDate(**filters))
+        assert sorted(found) == sorted(findVisitsByDate(patients, **filters))
+        assert [visit[0] for _, visit in found] == sorted(visit[0] for _, visit in found)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_migrated_shards_match_the_file(tmp_path, workers):
+    source = str(tmp_path / "patients.txt")
+    writeFile(source)
+    counts = migrate(source, str(tmp_path / "shards"), shards=3)
+    assert counts[-1] == 1
+    patients, _ = loadPatients(source, workers=1)
+    with ShardedStore(str(tmp_path / "shards"), workers=workers) as store:
+        check(store, patients)
+
+
+def test_adds_and_deletes_match_the_file(tmp_path):
+    source = str(tmp_path / "patients.txt")
+    writeFile(source)
+    migrate(source, str(tmp_path / "shards"), shards=4)
+    with ShardedStore(str(tmp_path / "shards"), workers=1) as store:
+        result = store.addVisits([(5, "2023-05-05", 37.0, 150, 18, 120, 80, 97), (41, "2023-05-06", 36.9, 70, 16, 120,
+                                  80, 98), (6, "2023-13-01", 37.0, 70, 16, 120, 80, 97)])
+        assert result.accepted == 2 and [index for index, message in result.rejected] == [2]
+        assert store.deletePatient(17) > 0
+        with open(source, "a") as outfile:
+            outfile.write("5,2023-05-05,37.0,150,18,120,80,97\n41,2023-05-06,36.9,70,16,120,80,98\n")
+            outfile.write(f"{TOMBSTONE},17\n")
+        patients, _ = loadPatients(source, workers=1)
+        check(store, patients)
+    with pytest.raises(FileExistsError):
+        migrate(source, str(tmp_path / "shards"))
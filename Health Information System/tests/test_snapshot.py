@@ -0,0 +1,73 @@
+# Desc: Snapshots give the same store as parsing the text, are only reused while every byte they were made from is
+#       unchanged, replay appended lines, and failing to write one does not stop a load.
+# Usage: python -m pytest tests
+
+
+import os
+
+from loader import loadPatients
+from main import addPatientData, deleteAllVisitsOfPatient
+from snapshot import loadPatientsWithSnapshot, readSnapshot, snapshotNameFor
+
+VISITS = "1,2022-01-01,36.6,65,16,120,80,97\n2,2022-01-02,37.0,70,14,110,70,98\n"
+
+
+def writeFile(tmp_path, text=VISITS):
+    fileName = str(tmp_path / "patients.txt")
+    with open(fileName, "w") as outfile:
+        outfile.write(text)
+    return fileName
+
+
+def test_snapshot_matches_parse(tmp_path):
+    fileName = writeFile(tmp_path, VISITS + "3,2022-13-01,36.6,65,16,120,80,97\n1,2022-01-05,36.9,75,16,120,80,97")
+    patients, errors = loadPatientsWithSnapshot(fileName, workers=1)
+    assert readSnapshot(fileName) is not None
+    reused, reusedErrors = loadPatientsWithSnapshot(fileName, workers=1)
+    parsed, parsedErrors = loadPatients(fileName, workers=1)
+    assert reused.asDict() == patients.asDict() == parsed.asDict() and list(reused) == list(parsed)
+    assert reusedErrors == errors == parsedErrors and len(errors) == 1
+    assert list(reused.rowsBetween()) != [] and sorted(reused.rowsBetween()) == list(reused.rows())
+
+
+def test_appended_lines_are_replayed(tmp_path, capsys):
+    fileName = writeFile(tmp_path, "".join(f"{patientId},2022-01-01,36.6,80,16,120,80,97\n"
+                                           for patientId in range(1, 101)))
+    patients, _ = loadPatientsWithSnapshot(fileName, workers=1)
+    deleteAllVisitsOfPatient(patients, 41, fileName)
+    addPatientData(patients, 41, "2022-03-01", 36.6, 80, 16, 120, 80, 97, fileName)
+    addPatientData(patients, 200, "2022-03-02", 36.6, 80, 16, 120, 80, 97, fileName)
+    #one tombstone in 100 visits is applied visit by visit, the patient is still ordered like a compaction would
+    reloaded, _ = loadPatientsWithSnapshot(fileName, workers=1)
+    parsed, _ = loadPatients(fileName, workers=1)
+    assert reloaded.asDict() == patients.asDict() == parsed.asDict()
+    assert list(reloaded) == list(patients) == list(parsed) == list(range(1, 41)) + list(range(42, 101)) + [41, 200]
+    reloaded.compact()
+    assert list(reloaded) == list(patients)
+
+
+def test_same_size_edit_is_seen(tmp_path):
+    fileName = writeFile(tmp_path)
+    loadPatientsWithSnapshot(fileName, workers=1)
+    stat = os.stat(fileName)
+    with open(fileName, "w") as outfile:
+        outfile.write(VISITS.replace(",65,", ",66,"))
+    os.utime(fileName, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    patients, errors = loadPatientsWithSnapshot(fileName, workers=1)
+    assert patients.asDict()[1][0][2] == 66
+
+
+def test_foreign_snapshot_is_not_used(tmp_path):
+    fileName = writeFile(tmp_path)
+    with open(snapshotNameFor(fileName), "wb") as outfile:
+        outfile.write(b"not a snapshot" * 20)
+    patients, errors = loadPatientsWithSnapshot(fileName, workers=1)
+    assert patients.numVisits() == 2 and readSnapshot(fileName) is not None
+
+
+def test_failed_snapshot_write_still_loads(tmp_path):
+    fileName = writeFile(tmp_path)
+    snapshotName = str(tmp_path / "missing" / "patients.txt.snap")
+    patients, errors = loadPatientsWithSnapshot(fileName, workers=1, snapshotName=snapshotName)
+    assert patients.numVisits() == 2
+    assert os.listdir(tmp_path) == ["patients.txt"]
@@ -0,0 +1,77 @@
+# Desc: The running vital sign aggregates of the store, compared with statistics computed from the visits.
+# Usage: python -m pytest tests
+
+
+import random
+from array import array
+
+import pytest
+
+from main import getStats
+from visitstore import VITALS, VisitStore
+
+
+def expectedStats(visits):
+    stats = {"count": len(visits)}
+    for i, name in enumerate(VITALS, 1):
+        values = [visit[i] for visit in visits]
+        mean = sum(values) / len(values)
+        stats[name] = {"mean": mean, "variance": sum((value - mean) ** 2 for value in values) / len(values),
+                       "min": min(values), "max": max(values)}
+    return stats
+
+
+def assertStats(stats, expected):
+    assert stats["count"] == expected["count"]
+    for name in VITALS:
+        assert stats[name]["min"] == expected[name]["min"] and stats[name]["max"] == expected[name]["max"]
+        assert stats[name]["mean"] == pytest.approx(expected[name]["mean"])
+        assert stats[name]["variance"] == pytest.approx(expected[name]["variance"], abs=1e-6)
+
+
+def test_stats_after_deletes():
+    random.seed(4)
+    patients = VisitStore()
+    visits = {}
+    for _ in range(300):
+        patientId = random.randrange(1, 40)
+        visit = [random.randrange(18000, 19000), round(random.uniform(35, 42), 1), random.randrange(30, 181),
+                 random.randrange(5, 41), random.randrange(70, 201), random.randrange(40, 121),
+                 random.randrange(70, 101)]
+        patients.addVisit(patientId, *visit)
+        visits.setdefault(patientId, []).append(["date"] + visit[1:])
+    for patientId in random.sample(sorted(visits), 30):
+        patients.deletePatient(patientId)
+        del visits[patientId]
+        assertStats(getStats(patients), expectedStats([visit for rows in visits.values() for visit in rows]))
+        other = next(iter(visits))
+        assertStats(getStats(patients, other), expectedStats(visits[other]))
+
+
+def test_extremes_move_when_their_last_visit_goes():
+    patients = VisitStore()
+    patients.addVisit(1, 19000, 35.0, 30, 5, 70, 40, 70)
+    patients.addVisit(2, 19000, 36.0, 40, 6, 80, 50, 80)
+    patients.addVisit(3, 19000, 35.0, 30, 5, 70, 40, 70)
+    patients.deletePatient(1)
+    assert getStats(patients)["hr"]["min"] == 30
+    patients.deletePatient(3)
+    assert getStats(patients)["hr"]["min"] == getStats(patients)["hr"]["max"] == 40
+    assert getStats(patients)["temp"]["min"] == 36.0
+    patients.deletePatient(2)
+    assert getStats(patients) is None
+
+
+def test_bulk_inserts_and_dictionaries():
+    visits = {1: [["2022-01-01", 37.0, 70, 16, 120, 80, 97], ["2022-01-02", 38.5, 90, 20, 140, 90, 95]],
+              2: [["2022-01-03", 36.1, 60, 12, 100, 60, 99]]}
+    assertStats(getStats(visits), expectedStats(visits[1] + visits[2]))
+    patients = VisitStore()
+    store = (patients.patientIds, patients.dates) + patients.columns()
+    columns = [[1, 1, 2], [18000, 18001, 18002]] + [[visit[i] for rows in visits.values() for visit in rows]
+                                                      for i in range(1, 7)]
+    patients.extend(*(array(column.typecode, values) for column, values in zip(store, columns)))
+    assertStats(getStats(patients, 1), expectedStats(visits[1]))
+    patients.deletePatient(1)
+    assertStats(getStats(patients), expectedStats(visits[2]))
+    assert getStats(patients, 1) is None
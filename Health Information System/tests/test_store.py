@@ -0,0 +1,66 @@
+# Desc: The columnar visit store: reading a patient file into it, using it like the old dictionary, deletes, and
+#       writes to a plain dictionary.
+# Usage: python -m pytest tests
+
+
+import pytest
+
+from main import (addPatientData, deleteAllVisitsOfPatient, findPatientsWhoNeedFollowUp, findVisitsByDate,
+                  readPatientsFromFile)
+from visitstore import VisitStore
+
+LINES = ["1,2022-06-01,37.2,72,16,120,80,97", "2,2022-06-10,36.9,69,18,123,80,96",
+         "1,2022-09-15,37.5,73,18,125,82,96", "3,2020-10-09,37.0,100,40,100,100,90",
+         "4,2022-02-30,37.0,72,16,120,80,97", "5,2022-06-01,44.0,72,16,120,80,97", "6,2022-06-01,37.0"]
+
+EXPECTED = {1: [["2022-06-01", 37.2, 72, 16, 120, 80, 97], ["2022-09-15", 37.5, 73, 18, 125, 82, 96]],
+            2: [["2022-06-10", 36.9, 69, 18, 123, 80, 96]],
+            3: [["2020-10-09", 37.0, 100, 40, 100, 100, 90]]}
+
+
+def writeFile(tmp_path, lines=LINES):
+    fileName = tmp_path / "patients.txt"
+    fileName.write_text("\n".join(lines))
+    return str(fileName)
+
+
+def test_read_gives_the_old_dictionary(tmp_path, capsys):
+    patients = readPatientsFromFile(writeFile(tmp_path))
+    assert isinstance(patients, VisitStore)
+    assert patients.asDict() == EXPECTED
+    assert patients[1] == EXPECTED[1] and 3 in patients and 4 not in patients and len(patients) == 3
+    assert list(patients.rows(1)) == [0, 2]
+    assert list(patients.column("hr")) == [72, 69, 73, 100]
+    output = capsys.readouterr().out
+    assert "Invalid date (2022-02-30) in line: 4,2022-02-30" in output
+    assert "Invalid temperature value (44.0)" in output
+    assert "Invalid number of fields 3" in output
+
+
+def test_delete_and_compact(tmp_path, capsys):
+    fileName = writeFile(tmp_path)
+    patients = readPatientsFromFile(fileName)
+    assert patients.deletePatient(1) == 2
+    assert patients.numVisits() == 2 and list(patients.rows()) == [1, 3]
+    patients.compact()
+    assert patients.asDict() == {2: EXPECTED[2], 3: EXPECTED[3]} and len(patients.patientIds) == 2
+    patients = readPatientsFromFile(fileName)
+    deleteAllVisitsOfPatient(patients, 2, fileName)
+    assert readPatientsFromFile(fileName).asDict() == {1: EXPECTED[1], 3: EXPECTED[3]}
+
+
+def test_read_functions_take_a_dictionary():
+    store = VisitStore.fromDict(EXPECTED)
+    assert store.asDict() == EXPECTED
+    assert list(findVisitsByDate(EXPECTED, 2022)) == list(findVisitsByDate(store, 2022))
+    assert list(findPatientsWhoNeedFollowUp(EXPECTED)) == list(findPatientsWhoNeedFollowUp(store)) == [3]
+
+
+def test_writes_to_a_dictionary_are_refused(tmp_path):
+    fileName = writeFile(tmp_path)
+    patients = {1: [["2022-01-01", 36.6, 80, 16, 120, 80, 97]]}
+    with pytest.raises(TypeError):
+        addPatientData(patients, 2, "2022-01-02", 36.6, 80, 16, 120, 80, 97, fileName)
+    with pytest.raises(TypeError):
+        deleteAllVisitsOfPatient(patients, 1, fileName)
+    assert open(fileName).read() == "\n".join(LINES)
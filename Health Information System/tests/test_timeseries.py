@@ -0,0 +1,81 @@
+# Desc: Window averages, cohort means and rolling means of timeseries, compared with sums over every visit.
+# Usage: python -m pytest tests
+
+
+import datetime
+import random
+from array import array
+
+import pytest
+
+from timeseries import cohortMean, periodRange, seriesOf, windowStats
+from visitstore import VITALS, VisitStore, dateToDays
+
+
+def makeStore(count=400, seed=5):
+    random.seed(seed)
+    patients = VisitStore()
+    columns = [[random.randrange(1, 30) for _ in range(count)],
+               [dateToDays(f"{random.randrange(2020, 2024)}-{random.randrange(1, 13):02d}-"
+                           f"{random.randrange(1, 29):02d}") for _ in range(count)]]
+    columns += [[random.choice([36.5, 37.0, 38.2]) for _ in range(count)]]
+    columns += [[random.randrange(60, 140) for _ in range(count)] for _ in range(5)]
+    store = (patients.patientIds, patients.dates) + patients.columns()
+    patients.extend(*(array(column.typecode, values) for column, values in zip(store, columns)))
+    return patients
+
+
+def visitsOf(patients, patientId=0):
+    return [visit for key, visits in patients.asDict().items() if patientId in (0, key) for visit in visits]
+
+
+def average(visits, i, first, last):
+    values = [visit[i + 1] for visit in visits if first <= datetime.date.fromisoformat(visit[0]) <= last]
+    return sum(values) / len(values) if values else None
+
+
+def check(patients):
+    first, last = datetime.date(2021, 4, 1), datetime.date(2022, 9, 30)
+    for patientId in (0, 1, 7, 29):
+        if patientId and patientId not in patients:
+            continue
+        visits = visitsOf(patients, patientId)
+        stats = windowStats(patients, patientId, first, last)
+        assert stats["count"] == sum(first <= datetime.date.fromisoformat(visit[0]) <= last for visit in visits)
+        for i, name in enumerate(VITALS):
+            assert stats[name] == pytest.approx(average(visits, i, first, last))
+    everyone = visitsOf(patients)
+    for period in ("2021", "2022-Q3", "2023-02"):
+        start, end = periodRange(period)
+        expected = average(everyone, VITALS.index("sbp"), datetime.date.fromordinal(start + 719163),
+                           datetime.date.fromordinal(end + 719163))
+        assert cohortMean(patients, "sbp", period) == pytest.approx(expected)
+
+
+def test_windows_match_sums_over_visits():
+    check(makeStore())
+
+
+def test_rolling_means_match_sums_over_visits():
+    patients = makeStore()
+    visits = sorted(visitsOf(patients, 3))
+    means = seriesOf(patients, 3).rollingMeans("hr", 30)
+    assert [date for date, _ in means] == [visit[0] for visit in visits]
+    for date, mean in means:
+        day = datetime.date.fromisoformat(date)
+        assert mean == pytest.approx(average(visits, VITALS.index("hr"), day - datetime.timedelta(days=29), day))
+    with pytest.raises(ValueError):
+        seriesOf(patients, 3).rollingMeans("hr", 0)
+
+
+def test_series_follow_inserts_and_deletes():
+    patients = makeStore()
+    check(patients)
+    patients.addVisit(1, dateToDays("2023-12-30"), 37.0, 70, 16, 120, 80, 97)
+    patients.addVisit(7, dateToDays("2021-05-05"), 39.0, 150, 30, 180, 110, 85)
+    patients.deletePatient(29)
+    patients.deleteFirstVisits(1, 3)
+    check(patients)
+    assert windowStats(patients, 29) is None
+    patients.compact()
+    check(patients)
@@ -0,0 +1,42 @@
+# Desc: Checking visits: dates with whitespace around them, the reasons of visits in dirty columns, and added visits
+#       with values of the wrong type.
+# Usage: python -m pytest tests
+
+
+from loader import loadPatients
+from main import TYPE_MESSAGE, checkVisits, validateVisit
+from validation import REASONS, checkFields, parseDate, splitFields
+
+
+def test_date_with_spaces_is_loaded(tmp_path):
+    fileName = tmp_path / "patients.txt"
+    fileName.write_text("1, 2022-06-01 ,36.6,80,16,120,80,97\n")
+    patients, errors = loadPatients(str(fileName), workers=1)
+    assert errors == []
+    assert parseDate(" 2022-06-01 ") == parseDate("2022-06-01") == patients.dates[0]
+
+
+def test_dirty_columns_get_the_first_reason():
+    lines = ["1,2022-01-01,36.6,72,16,120,80,97"] * 20
+    lines += ["1,2022-01-01,36.6,x,16,120,80,97", "1,2022-01-01,nan,72,16,120,80,97",
+              "1,2022-01-01,36.6,999,1,120,80,97", "0,2022-02-30,36.6,72,16,120,80,97",
+              "1,2022-01-01,36.6,72,16,120,80,50"]
+    #more distinct bad heart rates than are searched for one by one
+    lines += [f"1,2022-01-01,36.6,{200 + i},16,120,80,97" for i in range(12)]
+    check = checkFields(splitFields(lines))
+    reasons = [REASONS[code] for code in check.reasons]
+    assert reasons == [""] * 20 + ["type", "temp", "hr", "id", "spo2"] + ["hr"] * 12
+    assert check.rejectCount == 17
+
+
+def test_values_of_the_wrong_type_are_rejected():
+    assert parseDate(None) == parseDate(20220601) == parseDate("2022-02-30")
+    good = (1, "2022-01-01", 36.6, 72, 16, 120, 80, 97)
+    assert validateVisit(*good)[1] is None
+    for position, value in ((0, True), (3, 72.0), (4, False), (2, "36.6")):
+        visit = list(good)
+        visit[position] = value
+        assert validateVisit(*visit) == (None, TYPE_MESSAGE)
+    assert validateVisit(1, None, 36.6, 72, 16, 120, 80, 97)[0] is None
+    accepted, rejected = checkVisits([good, (1, 20220101) + good[2:], None, (2, "2022-01-02", None, 1, 2, 3, 4, 5)])
+    assert accepted == [validateVisit(*good)[0]] and [index for index, message in rejected] == [1, 2, 3]
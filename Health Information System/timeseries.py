@@ -0,0 +1,217 @@
+# Desc: Date range analytics on a VisitStore. A DateSeries holds visits sorted by date with a running sum of every
+#       vital sign, so the average over any date window takes two bisects and two subtractions whatever the number of
+#       visits in it. Every patient gets one for window averages, visit-to-visit trends and rolling means, and the
+#       whole store gets one for cohort queries such as the average systolic blood pressure of all patients in
+#       2022-Q3. Series are built from the store's columns with map and accumulate instead of Python loops, and the
+#       store caches them until its visits change.
+
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, repeat
+from operator import add, sub, truediv
+
+from visitstore import ROW_SPAN, VITALS, daysToDate, monthToDays, toDays
+
+#'yyyy', 'yyyy-Qn' or 'yyyy-mm'
+PERIOD_PATTERN = re.compile(r"([0-9]{4})(?:-Q([1-4])|-([0-9]{2}))?")
+
+
+def dayOf(value):
+    """
+    value: A date as days since 1970-01-01, a 'yyyy-mm-dd' string or a datetime.date.
+    return: The date as days since 1970-01-01.
+    """
+    return value if isinstance(value, int) else toDays(value)
+
+
+class DateSeries:
+    """
+    Visits sorted by date. dates holds the day of every visit, values[i] the values of the vital sign VITALS[i] in
+    the same order and sums[i] their running sums: sums[i][k] is the sum of the first k values.
+    """
+
+    def __init__(self, dates, values):
+        """
+        dates: An array('i') of days since 1970-01-01, sorted.
+        values: One array per vital sign, in VITALS order, with a value for every date.
+        """
+        self.dates = dates
+        self.values = list(values)
+        self.sums = [array("d", accumulate(column, initial=0.0)) for column in self.values]
+
+    @classmethod
+    def fromKeys(cls, patients, keys):
+        """
+        Builds a series from the store's rows.
+
+        patients: The VisitStore the rows are in.
+        keys: A sorted array of days * ROW_SPAN + row, like the store's date index.
+        return: A new DateSeries.
+        """
+        rows = array("q", map(ROW_SPAN.__rmod__, keys))
+        dates = array("i", map(ROW_SPAN.__rfloordiv__, keys))
+        return cls(dates, [array(column.typecode, map(column.__getitem__, rows)) for column in patients.columns()])
+
+    def __len__(self):
+        return len(self.dates)
+
+    def append(self, days, values):
+        """
+        Adds a visit at the end, if that keeps the series sorted.
+
+        days: The date of the visit as days since 1970-01-01.
+        values: The vital signs of the visit, in VITALS order.
+        return: True if the visit was added, False if it is dated before the last visit.
+        """
+        if self.dates and days < self.dates[-1]:
+            return False
+        self.dates.append(days)
+        for column, sums, value in zip(self.values, self.sums, values):
+            column.append(value)
+            sums.append(sums[-1] + value)
+        return True
+
+    def bounds(self, start=None, end=None):
+        """
+        start: The first date of the window, included. If None, the window starts at the first visit.
+        end: The last date of the window, included. If None, the window ends at the last visit.
+        return: (lo, hi), the window is visits lo to hi - 1 of the series.
+        """
+        lo = 0 if start is None else bisect_left(self.dates, dayOf(start))
+        hi = len(self.dates) if end is None else bisect_right(self.dates, dayOf(end))
+        return lo, max(lo, hi)
+
+    def mean(self, vital, start=None, end=None):
+        """
+        vital: The name of the vital sign, one of VITALS.
+        start, end: The window, see bounds.
+        return: The average value in the window, or None if it has no visits.
+        """
+        i = VITALS.index(vital)
+        lo, hi = self.bounds(start, end)
+        if hi == lo:
+            return None
+        return (self.sums[i][hi] - self.sums[i][lo]) / (hi - lo)
+
+    def windowStats(self, start=None, end=None):
+        """
+        start, end: The window, see bounds.
+        return: {"count": number of visits, "temp": average, "hr": ..., "spo2": ...}. Averages are None if the
+                window has no visits.
+        """
+        lo, hi = self.bounds(start, end)
+        stats = {"count": hi - lo}
+        for name, sums in zip(VITALS, self.sums):
+            stats[name] = (sums[hi] - sums[lo]) / (hi - lo) if hi > lo else None
+        return stats
+
+    def trend(self, vital):
+        """
+        vital: The name of the vital sign, one of VITALS.
+        return: A list of (date, change since the previous visit, days since the previous visit) for every visit
+                but the first.
+        """
+        column = self.values[VITALS.index(vital)]
+        dates = self.dates
+        return list(zip(map(daysToDate, dates[1:]), map(sub, column[1:], column[:-1]), map(sub, dates[1:], dates[:-1])))
+
+    def rollingMeans(self, vital, days):
+        """
+        vital: The name of the vital sign, one of VITALS.
+        days: The length of the window, at least 1. The window of a visit is its date and the days - 1 days before.
+        return: A list of (date, average of the visits in the window) for every visit. Raises ValueError if days is
+                less than 1.
+        """
+        if days < 1:
+            raise ValueError(f"The rolling window has to be at least 1 day, not {days}.")
+        sums = self.sums[VITALS.index(vital)]
+        dates = self.dates
+        #every window ends after the last visit of its day and starts at the first visit within days of it
+        ends = array("q", map(bisect_right, repeat(dates), dates))
+        starts = array("q", map(bisect_right, repeat(dates), map(sub, dates, repeat(days))))
+        totals = map(sub, map(sums.__getitem__, ends), map(sums.__getitem__, starts))
+        return list(zip(map(daysToDate, dates), map(truediv, totals, map(sub, ends, starts))))
+
+########################################################################################################
+
+
+def seriesOf(patients, patientId):
+    """
+    patients: A VisitStore.
+    patientId: The ID of the patient.
+    return: The patient's DateSeries, or None if the patient is not in the store. It is cached by the store.
+    """
+    series = patients.series.get(patientId)
+    if series is None:
+        rows = patients.offsets.get(patientId)
+        if rows is None:
+            return None
+        dates = patients.dates
+        keys = array("q", sorted(map(add, map(ROW_SPAN.__mul__, map(dates.__getitem__, rows)), rows)))
+        series = patients.series[patientId] = DateSeries.fromKeys(patients, keys)
+    return series
+
+
+def storeSeries(patients):
+    """
+    patients: A VisitStore.
+    return: The DateSeries of every visit in the store. It is cached by the store.
+    """
+    if patients.dateSeries is None:
+        patients.dateSeries = DateSeries.fromKeys(patients, patients.liveDateIndex())
+    return patients.dateSeries
+
+
+def periodRange(period):
+    """
+    Converts a period to a range of dates.
+
+    period: 'yyyy' for a year, 'yyyy-Qn' for a quarter (n from 1 to 4) or 'yyyy-mm' for a month.
+    return: (first day, last day) as days since 1970-01-01, the last day is None after the last year datetime supports.
+            Raises ValueError if the period is not in one of these formats.
+    """
+    match = PERIOD_PATTERN.fullmatch(period)
+    if match is None or (match.group(3) and not 1 <= int(match.group(3)) <= 12):
+        raise ValueError(f"Invalid period {period!r}. Please enter 'yyyy', 'yyyy-Qn' or 'yyyy-mm'.")
+    year, quarter, month = match.groups()
+    year = int(year)
+    if quarter:
+        firstMonth, months = 3 * int(quarter) - 2, 3
+    elif month:
+        firstMonth, months = int(month), 1
+    else:
+        firstMonth, months = 1, 12
+    after = monthToDays(year, firstMonth + months)
+    return monthToDays(year, firstMonth), None if after is None else after - 1
+
+
+def windowStats(patients, patientId=0, start=None, end=None):
+    """
+    Averages every vital sign over a date window.
+
+    patients: A VisitStore.
+    patientId: The patient to average. If 0, every visit of every patient is averaged.
+    start, end: The first and last date of the window, included, as 'yyyy-mm-dd', datetime.date or days. None leaves
+                that side of the window open.
+    return: The same as DateSeries.windowStats, or None if the patient is not in the store.
+    """
+    series = storeSeries(patients) if patientId == 0 else seriesOf(patients, patientId)
+    return None if series is None else series.windowStats(start, end)
+
+
+def cohortMean(patients, vital, period=None, start=None, end=None):
+    """
+    Averages one vital sign over every visit of every patient in a period, for example cohortMean(store, "sbp",
+    "2022-Q3").
+
+    patients: A VisitStore.
+    vital: The name of the vital sign, one of VITALS.
+    period: A period as accepted by periodRange. If given, start and end are not used.
+    start, end: The first and last date of the window, included, if no period is given.
+    return: The average, or None if there are no visits in the period.
+    """
+    if period is not None:
+        start, end = periodRange(period)
+    return storeSeries(patients).mean(vital, start, end)
@@ -0,0 +1,280 @@
+# Desc: The rules a visit has to pass, in one table shared by loading the patient file and adding visits. A rule gives
+#       the allowed range of one field and the messages for a rejected visit. checkRow checks one visit against the
+#       table. checkFields converts and checks a whole batch of visits column by column with map, translate and
+#       compress, and returns a reason code for every visit and a reject mask instead of raising or printing anything.
+#       Dates are checked against the calendar (month lengths, leap years) without raising for invalid ones.
+#       Reason codes are indexes into REASONS, 0 means the visit is accepted, and a visit gets the first reason in
+#       REASONS order that applies to it.
+
+
+from array import array
+from collections import namedtuple
+from datetime import MAXYEAR, date
+from itertools import compress, repeat
+from math import isfinite
+from operator import and_, ge, le
+
+from visitstore import EPOCH
+
+#column: the index of the field in a visit (id, date, temp, hr, rr, sbp, dbp, spo2). low, high: the range of allowed
+#values, both included. message: shown when an added visit is rejected. lineMessage: the rejected line message of the
+#loader, formatted with the value and the line.
+Rule = namedtuple("Rule", ["reason", "column", "low", "high", "message", "lineMessage"])
+
+FIRST_YEAR = 1900
+
+#the date of a visit as days since 1970-01-01, an invalid date gets a day outside the range of the date rule
+FIRST_DAY = date(FIRST_YEAR, 1, 1).toordinal() - EPOCH
+LAST_DAY = date(MAXYEAR, 12, 31).toordinal() - EPOCH
+INVALID_DAY = -2 ** 31
+
+DAYS_IN_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+RULES = (
+    Rule("id", 0, 1, 2 ** 63 - 1, "patient ID has to be greater than 0.",
+         "Invalid patient ID ({}) in line: {}"),
+    Rule("date", 1, FIRST_DAY, LAST_DAY, "Invalid date. Please enter a valid date in the format 'yyyy-mm-dd'.",
+         "Invalid date ({}) in line: {}"),
+    Rule("temp", 2, 35.0, 42.0, "Invalid temperature. Please enter a temperature between 35.0 and 42.0 Celsius.",
+         "Invalid temperature value ({}) in line: {}"),
+    Rule("hr", 3, 30, 180, "Invalid heart rate. Please enter a heart rate between 30 and 180 bpm.",
+         "Invalid heart rate value ({}) in line: {}"),
+    Rule("rr", 4, 5, 40, "Invalid respiratory rate. Please enter a respiratory rate between 5 and 40 bpm.",
+         "Invalid respiratory rate ({}) in line: {}"),
+    Rule("sbp", 5, 70, 200,
+         "Invalid systolic blood pressure. Please enter a systolic blood pressure between 70 and 200 mmHg.",
+         "Invalid systolic blood pressure value ({}) in line: {}"),
+    Rule("dbp", 6, 40, 120,
+         "Invalid diastolic blood pressure. Please enter a diastolic blood pressure between 40 and 120 bpm.",
+         "Invalid diastolic blood pressure value ({}) in line: {}"),
+    Rule("spo2", 7, 70, 100, "Invalid oxygen saturation. Please enter an oxygen saturation between 70 and 100%.",
+         "Invalid oxygen saturation value ({}) in line: {}"),
+)
+
+#reason codes: 'fields' is a line without 8 fields, 'type' a field that is not a number, the rest come from RULES
+REASONS = ("", "fields", "type") + tuple(rule.reason for rule in RULES)
+FIELDS, TYPE = 1, 2
+FIRST_RULE = 3
+
+#shown when an added visit has a field that is not a number of the right kind
+TYPE_MESSAGE = "Invalid input. Please enter valid data."
+
+#the type codes of the store's columns
+STORE_TYPES = ("q", "i", "d", "h", "h", "h", "h", "h")
+
+#translate tables that turn reason codes into a reject mask (1 if rejected) or an accept mask (1 if accepted). The
+#accept table also flips a mask of 0s and 1s.
+REJECT_TABLE = bytes(1) + bytes([1]) * 255
+ACCEPT_TABLE = bytes([1]) + bytes(255)
+
+#outsideRows searches a column once for each distinct bad value up to this many, and makes one pass over it above
+OUTSIDE_SEARCHES = 8
+
+#result of checkFields. columns are the converted fields as lists, reasons holds the reason code of every
+#visit, rejected is 1 for every rejected visit and 0 for every accepted one, rejectCount the number of 1s in it.
+BatchCheck = namedtuple("BatchCheck", ["columns", "reasons", "rejected", "rejectCount"])
+
+
+def parseDate(text):
+    """
+    Converts a 'yyyy-mm-dd' date string to days since 1970-01-01 without raising for invalid dates.
+
+    text: The date string. Whitespace around the date is ignored.
+    return: The number of days, or INVALID_DAY if the text is not a string holding a date of the calendar in that
+            format.
+    """
+    if not isinstance(text, str):
+        return INVALID_DAY
+    text = text.strip()
+    if len(text) != 10 or text[4] != "-" or text[7] != "-":
+        return INVALID_DAY
+    digits = text[:4] + text[5:7] + text[8:]
+    if not (digits.isascii() and digits.isdigit()):
+        return INVALID_DAY
+    year, month, day = int(text[:4]), int(text[5:7]), int(text[8:])
+    if year < 1 or not 1 <= month <= 12:
+        return INVALID_DAY
+    leapDay = month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    if not 1 <= day <= DAYS_IN_MONTH[month] + leapDay:
+        return INVALID_DAY
+    return date(year, month, day).toordinal() - EPOCH
+
+
+def parseDates(texts):
+    """
+    texts: A sequence of date strings.
+    return: A list of days since 1970-01-01, see parseDate. Each distinct string is only converted once.
+    """
+    known = {text: parseDate(text) for text in set(texts)}
+    return list(map(known.__getitem__, texts))
+
+
+def parseColumn(convert, texts, bad):
+    """
+    Converts one field of many visits.
+
+    convert: int or float.
+    texts: The field of every visit, as strings.
+    bad: A bytearray with a byte for every visit, set to 1 for the visits whose field could not be converted.
+    return: A list with a value for every visit, 0 where the field could not be converted.
+    """
+    values = []
+    converted = map(convert, texts)
+    while True:
+        #extend keeps the values converted before a field raises, and the map goes on after it, so every field is
+        #converted once however many of them are not numbers
+        try:
+            values.extend(converted)
+            return values
+        except ValueError:
+            bad[len(values)] = 1
+            values.append(0)
+
+
+def splitFields(lines):
+    """
+    lines: Visits as lines of the patients.txt format with exactly 8 fields, without line breaks.
+    return: The 8 fields of the visits as 8 lists of strings, one per field.
+    """
+    if not lines:
+        #joining no lines gives one empty field, which would look like a visit
+        return [[] for _ in range(8)]
+    fields = ",".join(lines).split(",")
+    return [fields[i::8] for i in range(8)]
+
+
+def checkRow(visit):
+    """
+    Checks one visit against RULES.
+
+    visit: (patientId, days, temp, hr, rr, sbp, dbp, spo2), with the date as days since 1970-01-01.
+    return: The reason code of the first rule the visit breaks, TYPE if a field of a rule with int bounds is not an
+            int or a field of a rule with float bounds is not an int or a float, 0 if it breaks none.
+    """
+    for code, rule in enumerate(RULES, FIRST_RULE):
+        value = visit[rule.column]
+        #the columns of rules with int bounds only hold whole numbers, so 72.0 or 72.5 is not a heart rate, and
+        #neither is True, which would be written to the file as 'True'
+        if type(rule.low) is int and type(value) is not int:
+            return TYPE
+        if type(value) is not int and type(value) is not float:
+            return TYPE
+        if not rule.low <= value <= rule.high:
+            return code
+    return 0
+
+
+def outsideRows(column, values, low, high):
+    """
+    column: A list or array of numbers.
+    values: The values of column the bad values are taken from, all of them or the ones of some rows.
+    low, high: The allowed range, both included.
+    return: The indexes of the values outside the range, NaN included, in no particular order. Every row with a bad
+            value of values is in it, other rows may be.
+    """
+    outside = [value for value in set(values) if not low <= value <= high]
+    if len(outside) > OUTSIDE_SEARCHES:
+        if type(low) is int:
+            #a range looks an int up without a Python call, which is only right for int values
+            passed = bytes(map(range(low, high + 1).__contains__, column))
+        else:
+            passed = bytes(map(and_, map(le, repeat(low), column), map(ge, repeat(high), column)))
+        return list(compress(range(len(column)), passed.translate(ACCEPT_TABLE)))
+    #a few distinct bad values, each one is searched for without a Python call per visit. A NaN is found by identity,
+    #each one is its own value in the set.
+    rows = []
+    for value in outside:
+        position = -1
+        try:
+            while True:
+                position = column.index(value, position + 1)
+                rows.append(position)
+        except ValueError:
+            pass
+    return rows
+
+
+def checkColumns(columns, reasons=None):
+    """
+    Checks many visits against RULES, one rule at a time over a whole column.
+
+    columns: The fields of the visits as 8 sequences of numbers, in the order of the rule columns, dates as days.
+             The fields of rules with int bounds have to hold ints.
+    reasons: Reason codes already found for the visits, such as TYPE, which are kept. None if there are none.
+    return: A bytes object with the reason code of every visit, 0 if it is accepted.
+    """
+    result = bytearray(len(columns[0])) if reasons is None else bytearray(reasons)
+    accepted = None if result.count(0) == len(result) else result.translate(ACCEPT_TABLE)
+    for code, rule in enumerate(RULES, FIRST_RULE):
+        column = columns[rule.column]
+        #visits rejected already are left out, so a few bad values don't send the whole column to the slow check
+        values = column if accepted is None else list(compress(column, accepted))
+        if not values or (rule.low <= min(values) and max(values) <= rule.high
+                          and (type(rule.low) is int or isfinite(sum(values)))):
+            #the usual case, every visit passes and min and max tell without a Python call per visit. A float NaN
+            #compares false with everything, so min and max can miss it, but it makes the sum NaN.
+            continue
+        #rules are checked in order, so a visit keeps the first reason it gets
+        for i in outsideRows(column, values, rule.low, rule.high):
+            if result[i] == 0:
+                result[i] = code
+        accepted = result.translate(ACCEPT_TABLE)
+    return bytes(result)
+
+
+def checkFields(texts):
+    """
+    Converts and checks the fields of many visits, without raising or printing anything for invalid ones.
+
+    texts: The fields of the visits as 8 sequences of strings (id, date, temp, hr, rr, sbp, dbp, spo2), as returned
+           by splitFields.
+    return: A BatchCheck.
+    """
+    bad = bytearray(len(texts[0]))
+    columns = [parseColumn(int, texts[0], bad), parseDates(texts[1]), parseColumn(float, texts[2], bad)]
+    columns += [parseColumn(int, column, bad) for column in texts[3:]]
+    #a field that is not a number makes the reason of its visit TYPE, whatever the other rules say
+    reasons = checkColumns(columns, bad.translate(bytes([0, TYPE]) + bytes(254)))
+    rejected = reasons.translate(REJECT_TABLE)
+    return BatchCheck(columns, reasons, rejected, rejected.count(1))
+
+
+def acceptedColumns(check):
+    """
+    check: A BatchCheck.
+    return: The columns of the accepted visits only, with the type codes of the store's columns.
+    """
+    if check.rejectCount == 0:
+        return [array(typecode, column) for typecode, column in zip(STORE_TYPES, check.columns)]
+    accepted = check.reasons.translate(ACCEPT_TABLE)
+    return [array(typecode, compress(column, accepted)) for typecode, column in zip(STORE_TYPES, check.columns)]
+
+
+def rejectedRows(check):
+    """
+    check: A BatchCheck.
+    return: An iterator of the indexes of the rejected visits.
+    """
+    return compress(range(len(check.reasons)), check.rejected)
+
+
+def rowMessage(code):
+    """
+    code: TYPE or the reason code of a rule.
+    return: The message shown when an added visit is rejected for it.
+    """
+    if code == TYPE:
+        return TYPE_MESSAGE
+    return RULES[code - FIRST_RULE].message
+
+
+def lineMessage(check, index, line):
+    """
+    check: A BatchCheck.
+    index: The index of a visit rejected by a rule.
+    line: The line of the visit.
+    return: The rejected line message of the loader, showing the value that broke the rule.
+    """
+    rule = RULES[check.reasons[index] - FIRST_RULE]
+    value = line.strip().split(",")[rule.column] if rule.reason == "date" else check.columns[rule.column][index]
+    return rule.lineMessage.format(value, line)
@@ -0,0 +1,160 @@
+# Desc: Append-only writes to the patient file. New visits and deletes are appended as lines instead of rewriting the
+#       file: a delete is recorded as a tombstone line 'DELETE,<patient ID>' that removes every visit of that patient
+#       written above it. Once enough of the file is made of tombstones and deleted visits it is compacted by writing
+#       the live visits to a temporary file and renaming it over the old one, so a crash never leaves half a file.
+
+
+import os
+import threading
+
+TOMBSTONE = "DELETE"
+
+#the file is compacted once it holds at least this many stale lines and COMPACT_RATIO stale lines per live visit
+COMPACT_MIN_LINES = 1000
+COMPACT_RATIO = 0.5
+
+#number of visits formatted into one string before it is written during compaction
+WRITE_BATCH = 10000
+
+#held while a file is appended to or compacted, and while the store that mirrors it is changed
+fileLock = threading.RLock()
+
+#number of tombstone lines and deleted visits in each file, keyed by absolute path
+staleLines = {}
+
+
+def countStale(fileName, count):
+    """
+    Adds to the number of stale lines recorded for a file.
+
+    fileName: The name of the patient file.
+    count: The number of lines that no longer hold a live visit.
+    """
+    key = os.path.abspath(fileName)
+    staleLines[key] = staleLines.get(key, 0) + count
+
+
+def appendLines(fileName, lines, fsync=False):
+    """
+    Appends lines to a patient file with one write. A line break is only written in front of them if the file does
+    not already end with one, so the file never gets empty lines.
+
+    fileName: The name of the file to append to. It is created if it does not exist.
+    lines: The lines to append, without line breaks.
+    fsync: If True, the file is flushed to disk before returning.
+    """
+    if not lines:
+        return
+    with fileLock:
+        with open(fileName, "a+b") as outfile:
+            separator = b""
+            if outfile.tell() > 0:
+                outfile.seek(-1, os.SEEK_END)
+                if outfile.read(1) != b"\n":
+                    separator = b"\n"
+            outfile.write(separator + "\n".join(lines).encode())
+            if fsync:
+                outfile.flush()
+                os.fsync(outfile.fileno())
+
+
+def formatVisit(patients, row):
+    """
+    Formats one visit as a line of the patient file.
+
+    patients: The VisitStore the visit is in.
+    row: The row number of the visit.
+    return: The line, without a line break.
+    """
+    return ",".join(str(value) for value in [patients.patientIds[row]] + patients.visit(row))
+
+
+def appendTombstone(fileName, patientId):
+    """
+    Records that every visit of a patient written so far is deleted.
+
+    fileName: The name of the patient file.
+    patientId: The ID of the deleted patient.
+    """
+    appendLines(fileName, [f"{TOMBSTONE},{patientId}"])
+
+########################################################################################################
+
+
+def compactFile(patients, fileName):
+    """
+    Rewrites a patient file so it only holds the live visits of a store, without tombstones.
+
+    patients: The VisitStore loaded from the file.
+    fileName: The name of the patient file.
+    """
+    #imported here, since most runs never compact and tempfile is slow to import
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(fileName))
+    with fileLock:
+        #write next to the old file, so the rename below stays on one file system and is atomic
+        handle, tempName = tempfile.mkstemp(prefix=".compact-", dir=directory)
+        try:
+            with os.fdopen(handle, "w") as outfile:
+                batch = []
+                separator = ""
+                for row in patients.rows():
+                    batch.append(formatVisit(patients, row))
+                    if len(batch) == WRITE_BATCH:
+                        outfile.write(separator + "\n".join(batch))
+                        separator = "\n"
+                        batch = []
+                if batch:
+                    outfile.write(separator + "\n".join(batch))
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            #mkstemp creates the file readable by the owner only, keep the permissions the old file had
+            if os.path.exists(fileName):
+                os.chmod(tempName, os.stat(fileName).st_mode & 0o7777)
+            os.replace(tempName, fileName)
+        except BaseException:
+            os.unlink(tempName)
+            raise
+        staleLines[os.path.abspath(fileName)] = 0
+
+
+def needsCompaction(patients, fileName):
+    """
+    patients: The VisitStore loaded from the file.
+    fileName: The name of the patient file.
+    return: True if the stale lines of the file passed the compaction threshold.
+    """
+    stale = staleLines.get(os.path.abspath(fileName), 0)
+    return stale >= COMPACT_MIN_LINES and stale >= COMPACT_RATIO * patients.numVisits()
+
+
+def maybeCompact(patients, fileName, background=True):
+    """
+    Compacts a patient file if it passed the compaction threshold.
+
+    patients: The VisitStore loaded from the file.
+    fileName: The name of the patient file.
+    background: If True, the file is compacted in a new thread and this function returns right away.
+    return: The compaction thread if one was started, otherwise None.
+    """
+    if not needsCompaction(patients, fileName):
+        return None
+    if not background:
+        compactFile(patients, fileName)
+        return None
+    thread = threading.Thread(target=compactIfNeeded, args=(patients, fileName), name="compact-patients")
+    thread.start()
+    return thread
+
+
+def compactIfNeeded(patients, fileName):
+    """
+    Compacts a patient file if it still passes the threshold once the file lock is held. Used by background threads,
+    so that two threads started close together only rewrite the file once.
+
+    patients: The VisitStore loaded from the file.
+    fileName: The name of the patient file.
+    """
+    with fileLock:
+        if needsCompaction(patients, fileName):
+            compactFile(patients, fileName)
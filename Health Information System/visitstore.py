@@ -0,0 +1,709 @@
+# Desc: Columnar visit storage for the Health Information System. Every visit is stored as one row spread over typed
+#       arrays (patient ID, date as days since 1970-01-01, temperature, heart rate, respiratory rate, systolic and
+#       diastolic blood pressure, oxygen saturation) instead of a 7-element Python list, and each patient keeps an
+#       index of the rows that belong to them.
+
+
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, namedtuple
+from collections.abc import Mapping
+from datetime import MAXYEAR, date
+from itertools import compress
+from operator import add, mul
+
+EPOCH = date(1970, 1, 1).toordinal()
+
+#the date index stores days * ROW_SPAN + row, which sorts by (year, month, day) and then by row
+ROW_SPAN = 1 << 32
+
+#names of the vital sign columns, in the same order as the visit lists of the dict view
+VITALS = ("temp", "hr", "rr", "sbp", "dbp", "spo2")
+
+#a visit needs a follow-up if hr > hrHigh or hr < hrLow or sbp > sbpHigh or dbp > dbpHigh or spo2 < spo2Low
+FollowUpRules = namedtuple("FollowUpRules", ["hrHigh", "hrLow", "sbpHigh", "dbpHigh", "spo2Low"],
+                           defaults=[100, 60, 140, 90, 90])
+
+
+def dateToDays(text):
+    """
+    Converts a 'yyyy-mm-dd' date string to the number of days since 1970-01-01.
+
+    text: The date string to convert.
+    return: The date as an integer number of days. Raises ValueError if the text is not a valid calendar date.
+    """
+    if len(text) != 10 or text[4] != "-" or text[7] != "-":
+        raise ValueError(f"Invalid date: {text}")
+    return date(int(text[:4]), int(text[5:7]), int(text[8:])).toordinal() - EPOCH
+
+
+def toDays(value):
+    """
+    Converts a date given as a 'yyyy-mm-dd' string or a datetime.date to days since 1970-01-01.
+
+    value: The date to convert.
+    return: The date as an integer number of days.
+    """
+    if isinstance(value, date):
+        return value.toordinal() - EPOCH
+    return dateToDays(value)
+
+
+def monthToDays(year, month):
+    """
+    Returns the first day of a month as days since 1970-01-01.
+
+    year: The year of the month.
+    month: The month, 13 is taken as January of the next year.
+    return: The number of days, or None if the month is after the last year datetime supports.
+    """
+    if month == 13:
+        year, month = year + 1, 1
+    if year > MAXYEAR:
+        return None
+    return date(year, month, 1).toordinal() - EPOCH
+
+
+def isAbnormal(rules, hr, sbp, dbp, spo2):
+    """
+    rules: The FollowUpRules to check against.
+    hr, sbp, dbp, spo2: The vital signs of one visit.
+    return: True if the visit needs a follow-up.
+    """
+    return hr > rules.hrHigh or hr < rules.hrLow or sbp > rules.sbpHigh or dbp > rules.dbpHigh or spo2 < rules.spo2Low
+
+
+def abnormalMask(rules, hrs, sbps, dbps, spo2s):
+    """
+    Checks many visits against the follow-up rules, one column at a time.
+
+    rules: The FollowUpRules to check against.
+    hrs, sbps, dbps, spo2s: Columns of equal length.
+    return: bytes with 1 for every visit that needs a follow-up and 0 for the others.
+    """
+    return bytes(map(any, zip(map(rules.hrHigh.__lt__, hrs), map(rules.hrLow.__gt__, hrs),
+                              map(rules.sbpHigh.__lt__, sbps), map(rules.dbpHigh.__lt__, dbps),
+                              map(rules.spo2Low.__gt__, spo2s))))
+
+
+def daysToDate(days):
+    """
+    Converts a number of days since 1970-01-01 back to a 'yyyy-mm-dd' date string.
+
+    days: The number of days to convert.
+    return: The date string.
+    """
+    return date.fromordinal(days + EPOCH).isoformat()
+
+########################################################################################################
+
+
+class VitalAggregate:
+    """
+    Running count, sum, sum of squares, minimum and maximum of the six vital signs of a group of visits.
+
+    Every list is indexed in the same order as VITALS. An aggregate visits can be removed from also keeps valueCounts,
+    a Counter per vital sign of how many visits hold each value, so a minimum or maximum only moves when the last
+    visit holding it is removed, and then to the next value in the Counter instead of to one found by a scan.
+    """
+
+    def __init__(self, countValues=False):
+        """
+        countValues: If True, valueCounts is kept, which removeColumns() needs.
+        """
+        self.count = 0
+        self.sums = [0] * len(VITALS)
+        self.squares = [0] * len(VITALS)
+        self.mins = [None] * len(VITALS)
+        self.maxs = [None] * len(VITALS)
+        self.valueCounts = [Counter() for _ in VITALS] if countValues else None
+
+    def add(self, values):
+        """
+        Adds one visit.
+
+        values: The six vital signs of the visit, in VITALS order.
+        """
+        self.count += 1
+        for i, value in enumerate(values):
+            self.sums[i] += value
+            self.squares[i] += value * value
+            if self.mins[i] is None or value < self.mins[i]:
+                self.mins[i] = value
+            if self.maxs[i] is None or value > self.maxs[i]:
+                self.maxs[i] = value
+            if self.valueCounts is not None:
+                self.valueCounts[i][value] += 1
+
+    def addColumns(self, columns):
+        """
+        Adds many visits at once.
+
+        columns: Six sequences of equal length, one per vital sign in VITALS order.
+        """
+        if len(columns[0]) == 0:
+            return
+        self.count += len(columns[0])
+        for i, column in enumerate(columns):
+            self.sums[i] += sum(column)
+            self.squares[i] += sum(map(mul, column, column))
+            if self.valueCounts is None:
+                low, high = min(column), max(column)
+            else:
+                #counting the column in C is about as fast as min and max, and the extremes are then found among the
+                #few distinct values
+                counts = Counter(column)
+                self.valueCounts[i].update(counts)
+                low, high = min(counts), max(counts)
+            if self.mins[i] is None or low < self.mins[i]:
+                self.mins[i] = low
+            if self.maxs[i] is None or high > self.maxs[i]:
+                self.maxs[i] = high
+
+    def removeColumns(self, columns):
+        """
+        Removes visits that were added before. The aggregate has to keep valueCounts.
+
+        columns: Six sequences of equal length, one per vital sign in VITALS order.
+        """
+        count = len(columns[0])
+        if count >= self.count:
+            self.__init__(True)
+            return
+        if count == 0:
+            return
+        self.count -= count
+        for i, column in enumerate(columns):
+            self.sums[i] -= sum(column)
+            self.squares[i] -= sum(map(mul, column, column))
+            counts = self.valueCounts[i]
+            for value, removed in Counter(column).items():
+                if counts[value] == removed:
+                    del counts[value]
+                else:
+                    counts[value] -= removed
+            #the costly part only runs once no visit is left with the minimum or maximum
+            if self.mins[i] not in counts:
+                self.mins[i] = min(counts)
+            if self.maxs[i] not in counts:
+                self.maxs[i] = max(counts)
+
+    def merge(self, other):
+        """
+        Adds the visits of another aggregate, for example the totals of another shard.
+
+        other: The VitalAggregate to add. Its minimums and maximums have to be up to date.
+        """
+        if other.count == 0:
+            return
+        self.count += other.count
+        for i in range(len(VITALS)):
+            self.sums[i] += other.sums[i]
+            self.squares[i] += other.squares[i]
+            if self.mins[i] is None or other.mins[i] < self.mins[i]:
+                self.mins[i] = other.mins[i]
+            if self.maxs[i] is None or other.maxs[i] > self.maxs[i]:
+                self.maxs[i] = other.maxs[i]
+
+    def mean(self, i):
+        """
+        i: The index of the vital sign in VITALS.
+        return: The average value, or None if there are no visits.
+        """
+        if self.count == 0:
+            return None
+        return self.sums[i] / self.count
+
+    def variance(self, i):
+        """
+        i: The index of the vital sign in VITALS.
+        return: The population variance, or None if there are no visits.
+        """
+        if self.count == 0:
+            return None
+        mean = self.sums[i] / self.count
+        #rounding can make the difference slightly negative when every value is the same
+        return max(self.squares[i] / self.count - mean * mean, 0.0)
+
+    def asDict(self):
+        """
+        return: {"count": number of visits, vital name: {"mean", "variance", "min", "max"}, ...} for every vital sign.
+        """
+        stats = {"count": self.count}
+        for i, name in enumerate(VITALS):
+            stats[name] = {"mean": self.mean(i), "variance": self.variance(i), "min": self.mins[i], "max": self.maxs[i]}
+        return stats
+
+########################################################################################################
+
+
+class VisitStore(Mapping):
+    """
+    Stores patient visits in typed columns.
+
+    Row i of the store is the visit (patientIds[i], dates[i], temps[i], hrs[i], rrs[i], sbps[i], dbps[i], spo2s[i]).
+    offsets maps every patient ID to an array of its row numbers, in the order the visits were added, and keeps
+    patients in the order they were first seen. Deleting a patient only marks their rows dead; compact() drops them.
+    dateIndex holds every row sorted by date, so date queries are answered by bisecting it. Single inserts keep it
+    sorted; bulk inserts append to it and it is sorted again the next time it is queried. Deletes leave their rows in
+    it, so they cost the same whatever the size of the store: queries skip dead rows, and the dead rows are dropped
+    once they make up half of it, or by compact().
+    totals and patientTotals are VitalAggregates of every live visit and of each patient's visits. They are updated on
+    every insert and delete, so stats() does not scan the visits. A patient's aggregate is only built once it is
+    asked for if the patient's visits were bulk inserted.
+    abnormalCounts holds, for every patient with at least one visit that breaks followUpRules, the number of such
+    visits, and firstSeen gives every patient a number in the order they were first seen, so the flagged patients can
+    be listed in that order without looking at any visit.
+    series and dateSeries cache the visits of each patient, and of the whole store, sorted by date with running sums
+    (see timeseries.DateSeries). They are built when a date range query needs them; a visit added in date order is
+    appended to them and any other change drops them.
+
+    The store is also a read-only mapping with the same shape as the old patients dictionary:
+    store[patientId] is a list of [date (str), temperature, heart rate, respiratory rate, systolic blood pressure,
+    diastolic blood pressure, oxygen saturation] lists. asDict() returns a plain dictionary copy.
+    """
+
+    def __init__(self):
+        self.patientIds = array("q")
+        self.dates = array("i")
+        self.temps = array("d")
+        self.hrs = array("h")
+        self.rrs = array("h")
+        self.sbps = array("h")
+        self.dbps = array("h")
+        self.spo2s = array("h")
+        self.alive = bytearray()
+        self.offsets = {}
+        self.deadRows = 0
+        self.dateIndex = array("q")
+        self.dateIndexSorted = True
+        self.dateIndexDead = 0
+        self.totals = VitalAggregate(countValues=True)
+        self.patientTotals = {}
+        self.followUpRules = FollowUpRules()
+        self.abnormalCounts = {}
+        self.firstSeen = {}
+        self.seenCount = 0
+        self.series = {}
+        self.dateSeries = None
+
+    @classmethod
+    def fromDict(cls, patients):
+        """
+        Builds a store from a dictionary of patient IDs, where each patient has a list of visits.
+
+        patients: The dictionary to copy. Visit dates are 'yyyy-mm-dd' strings.
+        return: A new VisitStore.
+        """
+        store = cls()
+        for patientId in patients:
+            for visit in patients[patientId]:
+                store.addVisit(patientId, dateToDays(visit[0]), *visit[1:])
+        return store
+
+    @classmethod
+    def fromColumns(cls, patientIds, dates, temps, hrs, rrs, sbps, dbps, spo2s, offsets, dateIndex):
+        """
+        Builds a store around columns that are already filled in, for example ones read back from a snapshot.
+
+        patientIds, dates, temps, hrs, rrs, sbps, dbps, spo2s: Arrays of equal length with the store's column types.
+        offsets: A dictionary of patient IDs to arrays of their row numbers, in first-seen order.
+        dateIndex: An array of days * ROW_SPAN + row for every row, sorted.
+        return: A new VisitStore that uses the given arrays without copying them.
+        """
+        store = cls()
+        store.patientIds, store.dates = patientIds, dates
+        store.temps, store.hrs, store.rrs, store.sbps, store.dbps, store.spo2s = temps, hrs, rrs, sbps, dbps, spo2s
+        store.alive = bytearray(b"\x01") * len(patientIds)
+        store.offsets = offsets
+        store.dateIndex = dateIndex
+        store.totals.addColumns(store.columns())
+        store.firstSeen = {patientId: rank for rank, patientId in enumerate(offsets)}
+        store.seenCount = len(offsets)
+        store.countAbnormal(patientIds, hrs, sbps, dbps, spo2s)
+        return store
+
+    def columns(self):
+        """
+        return: The vital sign columns, in the same order as VITALS.
+        """
+        return (self.temps, self.hrs, self.rrs, self.sbps, self.dbps, self.spo2s)
+
+    def addVisit(self, patientId, days, temp, hr, rr, sbp, dbp, spo2):
+        """
+        Appends one visit to the store. Values are expected to be validated already.
+
+        patientId: The ID of the patient the visit belongs to.
+        days: The visit date as days since 1970-01-01.
+        temp, hr, rr, sbp, dbp, spo2: The vital signs of the visit.
+        return: The row number of the new visit.
+        """
+        #the values are converted before any column changes, so a value a column can't hold raises with the store
+        #left as it was instead of with columns of different lengths
+        array("q", (patientId,)), array("i", (days,)), array("d", (temp,)), array("h", (hr, rr, sbp, dbp, spo2))
+        row = len(self.patientIds)
+        self.patientIds.append(patientId)
+        self.dates.append(days)
+        self.temps.append(temp)
+        self.hrs.append(hr)
+        self.rrs.append(rr)
+        self.sbps.append(sbp)
+        self.dbps.append(dbp)
+        self.spo2s.append(spo2)
+        self.alive.append(1)
+        rows = self.offsets.get(patientId)
+        if rows is None:
+            rows = self.offsets[patientId] = array("q")
+            self.patientTotals[patientId] = VitalAggregate()
+            self.firstSeen[patientId] = self.seenCount
+            self.seenCount += 1
+        rows.append(row)
+        values = (temp, hr, rr, sbp, dbp, spo2)
+        self.totals.add(values)
+        if patientId in self.patientTotals:
+            self.patientTotals[patientId].add(values)
+        if isAbnormal(self.followUpRules, hr, sbp, dbp, spo2):
+            self.abnormalCounts[patientId] = self.abnormalCounts.get(patientId, 0) + 1
+        series = self.series.get(patientId)
+        if series is not None and not series.append(days, values):
+            del self.series[patientId]
+        if self.dateSeries is not None and not self.dateSeries.append(days, values):
+            self.dateSeries = None
+        if self.dateIndexSorted:
+            insort(self.dateIndex, days * ROW_SPAN + row)
+        else:
+            self.dateIndex.append(days * ROW_SPAN + row)
+        return row
+
+    def extend(self, patientIds, dates, temps, hrs, rrs, sbps, dbps, spo2s):
+        """
+        Appends many visits at once, in order. Values are expected to be validated already.
+
+        patientIds, dates, temps, hrs, rrs, sbps, dbps, spo2s: Arrays of equal length with the same types as the
+        store's columns.
+        """
+        row = len(self.patientIds)
+        self.patientIds.extend(patientIds)
+        self.dates.extend(dates)
+        self.temps.extend(temps)
+        self.hrs.extend(hrs)
+        self.rrs.extend(rrs)
+        self.sbps.extend(sbps)
+        self.dbps.extend(dbps)
+        self.spo2s.extend(spo2s)
+        self.alive.extend(b"\x01" * len(patientIds))
+        self.dateIndex.extend(map(add, map(ROW_SPAN.__mul__, dates), range(row, row + len(patientIds))))
+        self.dateIndexSorted = False
+        self.dateSeries = None
+        self.totals.addColumns((temps, hrs, rrs, sbps, dbps, spo2s))
+        offsets = self.offsets
+        patientTotals = self.patientTotals
+        firstSeen = self.firstSeen
+        for patientId in patientIds:
+            rows = offsets.get(patientId)
+            if rows is None:
+                rows = offsets[patientId] = array("q")
+                firstSeen[patientId] = self.seenCount
+                self.seenCount += 1
+            rows.append(row)
+            row += 1
+        self.countAbnormal(patientIds, hrs, sbps, dbps, spo2s)
+        #aggregates of patients who got new visits are rebuilt from their rows when they are next asked for
+        for patientId in set(patientIds):
+            patientTotals.pop(patientId, None)
+            self.series.pop(patientId, None)
+
+    def deletePatient(self, patientId):
+        """
+        Removes all visits of a patient.
+
+        patientId: The ID of the patient to delete.
+        return: The number of visits removed, 0 if the patient is not in the store.
+        """
+        if patientId not in self.offsets:
+            return 0
+        rows = self.offsets.pop(patientId)
+        self.totals.removeColumns([array(column.typecode, map(column.__getitem__, rows)) for column in self.columns()])
+        self.patientTotals.pop(patientId, None)
+        del self.firstSeen[patientId]
+        self.series.pop(patientId, None)
+        self.dateSeries = None
+        self.abnormalCounts.pop(patientId, None)
+        alive = self.alive
+        for row in rows:
+            alive[row] = 0
+        self.deadRows += len(rows)
+        self.dateIndexDead += len(rows)
+        return len(rows)
+
+    def compact(self):
+        """
+        Rebuilds the columns without the rows of deleted patients, so scans no longer skip over them.
+        """
+        if self.deadRows == 0:
+            return
+        live = [row for row in range(len(self.patientIds)) if self.alive[row]]
+        old = (self.patientIds, self.dates) + self.columns()
+        rules = self.followUpRules
+        self.__init__()
+        self.followUpRules = rules
+        #keeping the live rows in their old order also keeps every patient's visit order and first-seen order
+        self.extend(*(array(column.typecode, map(column.__getitem__, live)) for column in old))
+
+    def deleteVisitsBefore(self, tombstones):
+        """
+        Removes visits written before tombstones. Used when a file with tombstones is loaded.
+
+        tombstones: A list of (row, patientId). Every visit of patientId stored in a row before row is removed.
+        return: The number of visits removed.
+        """
+        removed = 0
+        if len(tombstones) * 64 < self.numVisits():
+            #few tombstones, for example lines appended to a file since its snapshot: delete visit by visit
+            for position, patientId in tombstones:
+                rows = self.offsets.get(patientId)
+                if rows:
+                    removed += self.deleteFirstVisits(patientId, bisect_left(rows, position))
+            return removed
+        #many tombstones: mark every removed row and rebuild the columns, indexes and totals once
+        for position, patientId in tombstones:
+            for row in self.offsets.get(patientId, ()):
+                if row >= position:
+                    break
+                if self.alive[row]:
+                    self.alive[row] = 0
+                    removed += 1
+        self.deadRows += removed
+        self.compact()
+        return removed
+
+    def deleteFirstVisits(self, patientId, count):
+        """
+        Removes the oldest visits of a patient. The patient is then ordered by their first visit left, as compact()
+        orders every patient, so loading a file gives the same patient order whichever way its tombstones are applied.
+
+        patientId: The ID of the patient.
+        count: The number of visits to remove, from the first one stored.
+        return: The number of visits removed.
+        """
+        rows = self.offsets[patientId]
+        if count >= len(rows):
+            return self.deletePatient(patientId)
+        if count <= 0:
+            return 0
+        removedRows = rows[:count]
+        self.totals.removeColumns([array(column.typecode, map(column.__getitem__, removedRows))
+                                   for column in self.columns()])
+        self.patientTotals.pop(patientId, None)
+        self.series.pop(patientId, None)
+        self.dateSeries = None
+        abnormal = abnormalMask(self.followUpRules, *(array(column.typecode, map(column.__getitem__, removedRows))
+                                                      for column in (self.hrs, self.sbps, self.dbps, self.spo2s))).count(1)
+        if abnormal:
+            self.abnormalCounts[patientId] -= abnormal
+            if self.abnormalCounts[patientId] == 0:
+                del self.abnormalCounts[patientId]
+        alive = self.alive
+        for row in removedRows:
+            alive[row] = 0
+        del rows[:count]
+        self.deadRows += count
+        self.dateIndexDead += count
+        self.rankPatient(patientId)
+        return count
+
+    def rankPatient(self, patientId):
+        """
+        Moves a patient whose first visit left is now later than before behind the patients first seen between
+        their old and new first visit, in offsets and in firstSeen.
+
+        patientId: The ID of the patient.
+        """
+        offsets = self.offsets
+        first = offsets[patientId][0]
+        #patients are kept in the order of their first rows, so the ones to move are at the end
+        later = []
+        for other in reversed(offsets):
+            if offsets[other][0] < first:
+                break
+            if other != patientId:
+                later.append(other)
+        for other in [patientId] + later[::-1]:
+            offsets[other] = offsets.pop(other)
+            self.firstSeen[other] = self.seenCount
+            self.seenCount += 1
+
+    def sortedDateIndex(self):
+        """
+        return: dateIndex, sorted first if visits were bulk inserted since the last query. It can hold rows of deleted
+                visits, see alive, use liveDateIndex() for the live rows only.
+        """
+        if self.dateIndexDead * 2 > len(self.dateIndex):
+            #dropping the dead rows costs one pass, once per as many deletes as there are rows left
+            index = self.dateIndex
+            self.dateIndex = array("q", compress(index, map(self.alive.__getitem__, map(ROW_SPAN.__rmod__, index))))
+            self.dateIndexDead = 0
+        if not self.dateIndexSorted:
+            self.dateIndex = array("q", sorted(self.dateIndex))
+            self.dateIndexSorted = True
+        return self.dateIndex
+
+    def liveDateIndex(self):
+        """
+        return: The sorted dateIndex without the rows of deleted visits. It is a copy if there are any.
+        """
+        index = self.sortedDateIndex()
+        if self.dateIndexDead == 0:
+            return index
+        return array("q", compress(index, map(self.alive.__getitem__, map(ROW_SPAN.__rmod__, index))))
+
+    def rowsBetween(self, first=None, last=None):
+        """
+        Lazily iterates over the rows whose date falls in a range, in date order.
+
+        first: The first day of the range, in days since 1970-01-01. If None, the range has no lower bound.
+        last: The day just after the range. If None, the range has no upper bound.
+        return: An iterator of row numbers. The store should not be changed while the iterator is in use.
+        """
+        index = self.sortedDateIndex()
+        alive = self.alive
+        low = 0 if first is None else bisect_left(index, first * ROW_SPAN)
+        high = len(index) if last is None else bisect_left(index, last * ROW_SPAN)
+        for position in range(low, high):
+            row = index[position] % ROW_SPAN
+            if alive[row]:
+                yield row
+
+    def countAbnormal(self, patientIds, hrs, sbps, dbps, spo2s):
+        """
+        Adds the visits that need a follow-up among many visits to abnormalCounts.
+
+        patientIds, hrs, sbps, dbps, spo2s: Columns of equal length, holding live visits only.
+        """
+        counts = self.abnormalCounts
+        for patientId in compress(patientIds, abnormalMask(self.followUpRules, hrs, sbps, dbps, spo2s)):
+            counts[patientId] = counts.get(patientId, 0) + 1
+
+    def setFollowUpRules(self, rules):
+        """
+        Changes the follow-up thresholds and flags the patients again with one pass over the columns.
+
+        rules: The new FollowUpRules.
+        """
+        self.followUpRules = rules
+        self.abnormalCounts = {}
+        columns = (self.patientIds, self.hrs, self.sbps, self.dbps, self.spo2s)
+        if self.deadRows:
+            columns = [array(column.typecode, compress(column, self.alive)) for column in columns]
+        self.countAbnormal(*columns)
+
+    def flaggedPatients(self):
+        """
+        return: The IDs of the patients who need a follow-up, in the order the patients were first seen.
+        """
+        return sorted(self.abnormalCounts, key=self.firstSeen.__getitem__)
+
+    def stats(self, patientId=None):
+        """
+        Returns the running vital sign aggregate of one patient or of every visit.
+
+        patientId: The patient to return the aggregate for. If None, the aggregate of all live visits is returned.
+        return: A VitalAggregate that is kept up to date by the store, it should not be changed by the caller.
+                Raises KeyError if the patient is not in the store.
+        """
+        if patientId is None:
+            return self.totals
+        aggregate = self.patientTotals.get(patientId)
+        if aggregate is None:
+            rows = self.offsets[patientId]
+            aggregate = self.patientTotals[patientId] = VitalAggregate()
+            aggregate.addColumns([array(column.typecode, map(column.__getitem__, rows)) for column in self.columns()])
+        return aggregate
+
+    def numVisits(self):
+        """
+        return: The number of visits in the store, not counting deleted ones.
+        """
+        return len(self.patientIds) - self.deadRows
+
+    def rows(self, patientId=None):
+        """
+        Iterates over row numbers.
+
+        patientId: The patient to iterate over. If None, every live row of the store is returned in insertion order.
+        return: An iterable of row numbers.
+        """
+        if patientId is not None:
+            return self.offsets.get(patientId, ())
+        if self.deadRows == 0:
+            return range(len(self.patientIds))
+        return (row for row in range(len(self.patientIds)) if self.alive[row])
+
+    def column(self, name, patientId=None):
+        """
+        Returns the values of one column.
+
+        name: 'date', 'patientId' or one of VITALS.
+        patientId: The patient to return values for. If None, values for every live visit are returned.
+        return: An iterable of values. When no rows are dead and patientId is None this is the array itself.
+        """
+        values = {"date": self.dates, "patientId": self.patientIds}.get(name)
+        if values is None:
+            values = self.columns()[VITALS.index(name)]
+        if patientId is None and self.deadRows == 0:
+            return values
+        return map(values.__getitem__, self.rows(patientId))
+
+    def visit(self, row):
+        """
+        Returns one visit in the list format of the dict view.
+
+        row: The row number of the visit.
+        return: [date (str), temperature, heart rate, respiratory rate, systolic bp, diastolic bp, oxygen saturation]
+        """
+        return [daysToDate(self.dates[row]), self.temps[row], self.hrs[row], self.rrs[row],
+                self.sbps[row], self.dbps[row], self.spo2s[row]]
+
+    def asDict(self):
+        """
+        return: A plain dictionary copy of the store in the format readPatientsFromFile used to return.
+        """
+        return {patientId: self[patientId] for patientId in self.offsets}
+
+    def __getitem__(self, patientId):
+        return [self.visit(row) for row in self.offsets[patientId]]
+
+    def __contains__(self, patientId):
+        return patientId in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+def asStore(patients):
+    """
+    Returns patients as a VisitStore, converting a plain dictionary of patient IDs if needed.
+
+    patients: A VisitStore or a dictionary of patient IDs, where each patient has a list of visits.
+    return: A VisitStore.
+    """
+    if isinstance(patients, VisitStore):
+        return patients
+    return VisitStore.fromDict(patients)
+
+
+def writableStore(patients):
+    """
+    Checks that patients can be written to. A dictionary of patient IDs is only read through asStore, which copies it,
+    so a write to it would be lost.
+
+    patients: What a write function was given as the patients.
+    return: patients if it is a VisitStore. Raises TypeError if it is not.
+    """
+    if not isinstance(patients, VisitStore):
+        raise TypeError(f"Visits can only be added to or deleted from a VisitStore, not a {type(patients).__name__}. "
+                        "Use VisitStore.fromDict to build one.")
+    return patients